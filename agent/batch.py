@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from .config import CONCURRENCY
+from .runner import run_session
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _parse_prompt(line, line_number):
+    # The prompt on one line of a prompts file. A line that cannot be run still gives a prompt, with an "error" saying
+    # why, so it is reported in the results instead of stopping the batch.
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        record = line
+    if isinstance(record, str):
+        record = {"prompt": record}
+    if not isinstance(record, dict):
+        return {"id": str(line_number), "error": f"Line {line_number} is not a JSON object or string"}
+
+    prompt = {"id": str(record.get("id", line_number))}
+    if isinstance(record.get("prompt"), str) and record["prompt"].strip():
+        prompt["prompt"] = record["prompt"]
+    else:
+        prompt["error"] = f'Line {line_number} has no "prompt" string'
+    workspace = record.get("workspace")
+    if workspace is not None:
+        prompt["workspace"] = workspace
+        if not isinstance(workspace, str) or not os.path.isdir(workspace):
+            prompt.setdefault("error", f"Line {line_number}: workspace {workspace!r} is not a directory")
+    return prompt
+
+
+def read_prompts(path):
+    # One prompt per line: either a JSON object with a "prompt" (and optional "id" and "workspace", the directory the
+    # session's tools work in) or a JSON string / plain text.
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if line:
+                yield _parse_prompt(line, line_number)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def result_record(prompt, result=None, error=None, wall_time=None):
+    record = {name: prompt[name] for name in ("id", "prompt", "workspace", "error") if name in prompt}
+    if result is not None:
+        record.update(
+            final_text=result.final_text,
+            iterations=result.iterations,
+            prompt_tokens=result.prompt_tokens,
+            cached_prompt_tokens=result.cached_prompt_tokens,
+            response_tokens=result.response_tokens,
+            rate_limited_seconds=round(result.rate_limited_seconds, 3),
+            wall_time=round(result.wall_time, 3),
+        )
+    if error is not None:
+        record.update(error=f"{type(error).__name__}: {error}", wall_time=round(wall_time, 3))
+    return record
+
+
+async def run_batch(client, model, system_prompt, prompts, output, concurrency=CONCURRENCY, **session_kwargs):
+    # Every session shares the client and whatever rate limiter is passed in session_kwargs; a record is written to
+    # output as each session finishes, so a long batch can be followed (and a crash loses nothing already finished).
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    counts = {"succeeded": 0, "failed": 0}
+
+    async def run_one(prompt):
+        if "error" in prompt:
+            LOGGER.error(f"Skipping prompt {prompt['id']}: {prompt['error']}")
+            counts["failed"] += 1
+            output.write(json.dumps(result_record(prompt)) + "\n")
+            output.flush()
+            return
+        async with semaphore:
+            started = time.perf_counter()
+            kwargs = dict(session_kwargs, session_id=prompt["id"])
+            if "workspace" in prompt:
+                kwargs["workspace"] = prompt["workspace"]
+            try:
+                result = await run_session(client, model, system_prompt, prompt["prompt"], **kwargs)
+                record = result_record(prompt, result)
+                counts["succeeded"] += 1
+            except Exception as e:
+                LOGGER.exception(f"Session {prompt['id']} failed")
+                record = result_record(prompt, error=e, wall_time=time.perf_counter() - started)
+                counts["failed"] += 1
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(prompt) for prompt in prompts))
+    LOGGER.info(
+        f"Batch finished in {time.perf_counter() - started:.2f}s: "
+        f"{counts['succeeded']} succeeded, {counts['failed']} failed"
+    )
+    return counts
@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from functions.config import CACHE_DIR
+from functions.file_cache import FILE_CACHE
+from functions.result_cache import RESULT_CACHE
+
+from .cassette import Cassette, ReplayClient, restore_snapshot
+from .config import STARTUP_IMPORT_BUDGET_MS, WORKING_DIRECTORY
+from .dispatch import MAX_WORKERS
+from .history import TOKEN_BUDGET
+from .rate_limit import RateLimiter
+from .runner import run_session
+from .tools import REGISTRY
+
+
+SOURCE_DIRECTORY = os.path.abspath(WORKING_DIRECTORY)
+# Replays and tool runs work on a copy, so recorded write_file calls never touch the real working directory. The path
+# is fixed so the persisted search index for it is reused between benchmark runs.
+SANDBOX_DIRECTORY = os.path.join(CACHE_DIR, "benchmark", "workspace")
+REPLAY_REPEATS = 5
+TOOL_REPEATS = 20
+
+TOOL_CASES = [
+    ("get_files_info", {"directory": "."}),
+    ("get_files_info", {"directory": ".", "recursive": True}),
+    ("get_file_content", {"file_path": "lorem.txt"}),
+    ("get_file_content", {"file_path": "lorem.txt", "start_line": 1, "end_line": 20}),
+    ("search_code", {"query": "def "}),
+    ("search_code", {"query": r"def \w+\(", "regex": True}),
+    ("run_python_file", {"file_path": "main.py", "args": ["3 + 5"]}),
+    ("write_file", {"file_path": "benchmark_output.txt", "content": "benchmark\n" * 100}),
+]
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_REPEATS = 5
+# Commands whose cold start is budgeted, and modules none of them may import.
+STARTUP_CASES = [
+    ("main.py --help", ["main.py", "--help"]),
+    ("import tests", ["-c", "import tests"]),
+]
+STARTUP_FORBIDDEN_MODULES = ("google.genai",)
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+def prepare_sandbox(source=SOURCE_DIRECTORY, snapshot=None):
+    # The sandbox is the snapshot when there is one, and otherwise a copy of source as it is now.
+    shutil.rmtree(SANDBOX_DIRECTORY, ignore_errors=True)
+    if snapshot is not None:
+        restore_snapshot(snapshot, SANDBOX_DIRECTORY)
+    else:
+        shutil.copytree(source, SANDBOX_DIRECTORY)
+    FILE_CACHE.clear()
+    RESULT_CACHE.clear()
+
+
+async def replay_session(cassette, latency_scale=0.0, max_workers=MAX_WORKERS):
+    metadata = cassette.metadata
+    client = ReplayClient(cassette, latency_scale=latency_scale)
+    result = await run_session(
+        client,
+        metadata["model"],
+        metadata["system_prompt"],
+        metadata["user_prompt"],
+        max_workers=max_workers,
+        rate_limiter=RateLimiter(requests_per_minute=10**6, tokens_per_minute=10**12),
+        token_budget=metadata.get("token_budget", TOKEN_BUDGET),
+        context_cache=metadata.get("context_cache", False),
+        stream=metadata.get("stream", False),
+        workspace=SANDBOX_DIRECTORY,
+        # Cassettes recorded before tool output was shaped replay without it.
+        shape_output=metadata.get("shape_output", False),
+    )
+    return result, client
+
+
+def benchmark_replay(cassette, repeats=REPLAY_REPEATS, latency_scale=0.0, max_workers=MAX_WORKERS, quiet=True):
+    runs = []
+    for _ in range(repeats):
+        # Cassettes recorded without a snapshot replay against the recorded workspace as it is now.
+        prepare_sandbox(cassette.metadata.get("workspace", SOURCE_DIRECTORY), cassette.snapshot)
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            result, client = asyncio.run(replay_session(cassette, latency_scale, max_workers))
+        runs.append((result, client))
+
+    iterations = []
+    for i in range(max(len(result.iteration_timings) for result, _ in runs)):
+        timings = [result.iteration_timings[i] for result, _ in runs if i < len(result.iteration_timings)]
+        iterations.append(
+            {
+                "iteration": i,
+                "total": _summary([timing.total_seconds for timing in timings]),
+                "model": _summary([timing.model_seconds for timing in timings]),
+                "tools": _summary([timing.tool_seconds for timing in timings]),
+                "overhead": _summary([timing.overhead_seconds for timing in timings]),
+                "prompt_tokens": timings[0].prompt_tokens,
+                "response_tokens": timings[0].response_tokens,
+            }
+        )
+    return {
+        "repeats": repeats,
+        "latency_scale": latency_scale,
+        "divergences": max(client.divergences for _, client in runs),
+        "wall_time": _summary([result.wall_time for result, _ in runs]),
+        "overhead": _summary([sum(t.overhead_seconds for t in result.iteration_timings) for result, _ in runs]),
+        "prompt_tokens": runs[0][0].prompt_tokens,
+        "response_tokens": runs[0][0].response_tokens,
+        "iterations": iterations,
+    }
+
+
+def benchmark_tools(repeats=TOOL_REPEATS, cases=TOOL_CASES):
+    prepare_sandbox()
+    results = []
+    for name, args in cases:
+        function = REGISTRY.tools[name].function
+        FILE_CACHE.clear()
+        RESULT_CACHE.clear()
+        started = time.perf_counter()
+        function(SANDBOX_DIRECTORY, **args)
+        cold = time.perf_counter() - started
+
+        samples = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            function(SANDBOX_DIRECTORY, **args)
+            samples.append(time.perf_counter() - started)
+        results.append({"tool": name, "args": args, "cold": cold, "warm": _summary(samples)})
+    return results
+
+
+def parse_importtime(stderr):
+    # {module: (self microseconds, cumulative microseconds, nesting depth)} from python -X importtime output. Depth 0
+    # is an import the command made itself rather than on behalf of another module.
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        if own.strip().isdigit():
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            imports[name.strip()] = (int(own), int(cumulative), depth)
+    return imports
+
+
+def _importtime(command):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *command], cwd=REPOSITORY_DIRECTORY, capture_output=True, text=True
+    )
+    return completed.stderr
+
+
+def benchmark_startup(repeats=STARTUP_REPEATS, budget_ms=STARTUP_IMPORT_BUDGET_MS, cases=STARTUP_CASES):
+    # Import time that our code adds to interpreter startup. Modules the bare interpreter already imports (site and
+    # whatever .pth files pull in) are left out, so the budget does not depend on the environment's site-packages.
+    baseline = set(parse_importtime(_importtime(["-c", "pass"])))
+    results = []
+    for label, command in cases:
+        # The first run may still be writing bytecode caches.
+        _importtime(command)
+        samples = []
+        for _ in range(repeats):
+            imports = {
+                name: timing for name, timing in parse_importtime(_importtime(command)).items() if name not in baseline
+            }
+            samples.append(sum(cumulative for _, cumulative, depth in imports.values() if depth == 0) / 1000)
+        forbidden = sorted(name for name in imports if name.startswith(STARTUP_FORBIDDEN_MODULES))
+        heaviest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:5]
+        results.append(
+            {
+                "command": label,
+                "import_ms": _summary(samples),
+                "budget_ms": budget_ms,
+                "forbidden_imports": forbidden,
+                "heaviest": [[name, own / 1000] for name, (own, _, _) in heaviest],
+                "passed": statistics.median(samples) <= budget_ms and not forbidden,
+            }
+        )
+    return results
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:10.2f}"
+
+
+def print_replay_report(path, report):
+    print(
+        f"Replay of {path}: {report['repeats']} runs, {len(report['iterations'])} iterations, "
+        f"{report['divergences']} divergent requests, latency scale {report['latency_scale']}"
+    )
+    print(
+        f"{'iter':>4} {'total ms':>10} {'model ms':>10} {'tools ms':>10} {'loop ms':>10} "
+        f"{'prompt tok':>10} {'resp tok':>10}"
+    )
+    for iteration in report["iterations"]:
+        print(
+            f"{iteration['iteration']:>4} {_ms(iteration['total']['median'])} {_ms(iteration['model']['median'])} "
+            f"{_ms(iteration['tools']['median'])} {_ms(iteration['overhead']['median'])} "
+            f"{iteration['prompt_tokens']:>10} {iteration['response_tokens']:>10}"
+        )
+    print(
+        f"Session wall time: median {_ms(report['wall_time']['median']).strip()} ms, "
+        f"p95 {_ms(report['wall_time']['p95']).strip()} ms; loop overhead median "
+        f"{_ms(report['overhead']['median']).strip()} ms; {report['prompt_tokens']} prompt tokens, "
+        f"{report['response_tokens']} response tokens"
+    )
+
+
+def print_tool_report(results):
+    print(f"{'tool':<18} {'args':<48} {'cold ms':>10} {'median ms':>10} {'p95 ms':>10}")
+    for result in results:
+        args = json.dumps(result["args"])
+        args = args if len(args) <= 48 else args[:45] + "..."
+        print(
+            f"{result['tool']:<18} {args:<48} {_ms(result['cold'])} {_ms(result['warm']['median'])} "
+            f"{_ms(result['warm']['p95'])}"
+        )
+
+
+def print_startup_report(results):
+    print(f"{'command':<18} {'median ms':>10} {'max ms':>10} {'budget ms':>10}  result")
+    for result in results:
+        status = "ok" if result["passed"] else "OVER BUDGET"
+        if result["forbidden_imports"]:
+            status = f"imports {', '.join(result['forbidden_imports'])}"
+        print(
+            f"{result['command']:<18} {result['import_ms']['median']:>10.2f} {result['import_ms']['max']:>10.2f} "
+            f"{result['budget_ms']:>10}  {status}"
+        )
+        if not result["passed"]:
+            for name, ms in result["heaviest"]:
+                print(f"    {name:<40} {ms:>10.2f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog="python -m agent.benchmark",
+        description="Replay recorded sessions offline and time the agent loop and the tools",
+    )
+    parser.add_argument("cassettes", nargs="*", help="Cassettes recorded with main.py --record")
+    parser.add_argument("--repeat", type=int, default=REPLAY_REPEATS, help="Number of replays of each cassette")
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=0.0,
+        help="Fraction of the recorded API latency to wait during replay (0 measures only local work)",
+    )
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--tools", action="store_true", help="Also time each tool on the sample working directory")
+    parser.add_argument("--tool-repeats", type=int, default=TOOL_REPEATS)
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Check the import time of main.py --help and the tool tests against their budget; exits 1 when over it",
+    )
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_IMPORT_BUDGET_MS, metavar="MS")
+    parser.add_argument("--json", metavar="PATH", help="Write the full report as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = {"replays": {}, "tools": None, "startup": None}
+    for path in args.cassettes:
+        report["replays"][path] = benchmark_replay(
+            Cassette.load(path), repeats=args.repeat, latency_scale=args.latency_scale, max_workers=args.max_workers
+        )
+        print_replay_report(path, report["replays"][path])
+        print()
+    if args.tools or not (args.cassettes or args.startup):
+        report["tools"] = benchmark_tools(repeats=args.tool_repeats)
+        print_tool_report(report["tools"])
+    if args.startup:
+        report["startup"] = benchmark_startup(budget_ms=args.startup_budget)
+        print_startup_report(report["startup"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if report["startup"] and not all(result["passed"] for result in report["startup"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
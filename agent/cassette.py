@@ -0,0 +1,282 @@
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import time
+
+from google.genai import errors, types
+
+
+LOGGER = logging.getLogger(__name__)
+CASSETTE_VERSION = 1
+
+
+def _dump(value):
+    return value.model_dump(mode="json", exclude_none=True) if value is not None else None
+
+
+def _dump_contents(contents):
+    if contents is None:
+        return None
+    if not isinstance(contents, list):
+        contents = [contents]
+    return [_dump(content) if isinstance(content, types.Content) else content for content in contents]
+
+
+def _tool_results(contents):
+    # The function responses sent back in a request; these are what the tools returned for the previous turn.
+    results = []
+    for content in contents or []:
+        for part in content.get("parts") or []:
+            if "function_response" in part:
+                results.append(part["function_response"])
+    return results
+
+
+def snapshot_directory(root):
+    # Every directory and file under root, with file contents and modification times, so that a replay can start from
+    # the tree the recorded session started from rather than the one it left behind.
+    directories, files = [], {}
+    for directory, dirnames, filenames in os.walk(root):
+        relative_directory = os.path.relpath(directory, root)
+        for name in dirnames:
+            directories.append(os.path.normpath(os.path.join(relative_directory, name)).replace(os.sep, "/"))
+        for name in filenames:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                content = base64.b64encode(f.read()).decode("ascii")
+            relative_path = os.path.normpath(os.path.join(relative_directory, name)).replace(os.sep, "/")
+            files[relative_path] = [os.stat(path).st_mtime_ns, content]
+    return {"directories": sorted(directories), "files": files}
+
+
+def restore_snapshot(snapshot, root):
+    os.makedirs(root, exist_ok=True)
+    for relative_directory in snapshot["directories"]:
+        os.makedirs(os.path.join(root, relative_directory), exist_ok=True)
+    for relative_path, (mtime_ns, content) in snapshot["files"].items():
+        path = os.path.join(root, relative_path)
+        with open(path, "wb") as f:
+            f.write(base64.b64decode(content))
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# Everything a session exchanged with the API, in order: each request's contents (and so the tool results sent
+# back to the model), each response or error, and how long the call took. metadata holds what is needed to start
+# the same session again (model, prompts and flags), and snapshot the working directory as it was when recording
+# started.
+class Cassette:
+    def __init__(self, interactions=None, metadata=None, snapshot=None):
+        self.interactions = interactions if interactions is not None else []
+        self.metadata = metadata or {}
+        self.snapshot = snapshot
+
+    @classmethod
+    def load(cls, path):
+        with _open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f'Unsupported cassette version {data.get("version")} in "{path}"')
+        return cls(data["interactions"], data.get("metadata"), data.get("snapshot"))
+
+    def save(self, path):
+        data = {"version": CASSETTE_VERSION, "metadata": self.metadata, "interactions": self.interactions}
+        if self.snapshot is not None:
+            data["snapshot"] = self.snapshot
+        with _open(path, "w") as f:
+            json.dump(data, f)
+
+    def record(self, kind, request, started, response=None, chunks=None, error=None):
+        interaction = {"kind": kind, "request": request, "latency": time.perf_counter() - started}
+        if response is not None:
+            interaction["response"] = response
+        if chunks is not None:
+            interaction["chunks"] = chunks
+        if error is not None:
+            interaction["error"] = {"code": error.code, "details": error.details}
+        self.interactions.append(interaction)
+        return interaction
+
+
+class _RecordingModels:
+    def __init__(self, client):
+        self.client = client
+
+    def _request(self, model, contents, config):
+        return {"model": model, "contents": _dump_contents(contents), "config": _dump(config)}
+
+    async def generate_content(self, model, contents, config=None):
+        request = self._request(model, contents, config)
+        started = time.perf_counter()
+        try:
+            response = await self.client.wrapped.aio.models.generate_content(
+                model=model, contents=contents, config=config
+            )
+        except errors.APIError as e:
+            self.client.cassette.record("generate_content", request, started, error=e)
+            raise
+        self.client.cassette.record("generate_content", request, started, response=_dump(response))
+        return response
+
+    async def generate_content_stream(self, model, contents, config=None):
+        request = self._request(model, contents, config)
+        started = time.perf_counter()
+        try:
+            stream = await self.client.wrapped.aio.models.generate_content_stream(
+                model=model, contents=contents, config=config
+            )
+        except errors.APIError as e:
+            self.client.cassette.record("generate_content_stream", request, started, error=e)
+            raise
+        return self._stream(stream, request, started)
+
+    async def _stream(self, stream, request, started):
+        chunks = []
+        try:
+            async for chunk in stream:
+                chunks.append({"offset": time.perf_counter() - started, "response": _dump(chunk)})
+                yield chunk
+        except errors.APIError as e:
+            self.client.cassette.record("generate_content_stream", request, started, chunks=chunks, error=e)
+            raise
+        self.client.cassette.record("generate_content_stream", request, started, chunks=chunks)
+
+
+class _RecordingCaches:
+    def __init__(self, client):
+        self.client = client
+
+    async def _call(self, kind, method, **kwargs):
+        request = {key: _dump(value) if hasattr(value, "model_dump") else value for key, value in kwargs.items()}
+        started = time.perf_counter()
+        try:
+            response = await method(**kwargs)
+        except errors.APIError as e:
+            self.client.cassette.record(kind, request, started, error=e)
+            raise
+        self.client.cassette.record(kind, request, started, response=_dump(response))
+        return response
+
+    async def create(self, model, config):
+        return await self._call("caches.create", self.client.wrapped.aio.caches.create, model=model, config=config)
+
+    async def update(self, name, config=None):
+        return await self._call("caches.update", self.client.wrapped.aio.caches.update, name=name, config=config)
+
+    async def delete(self, name, config=None):
+        return await self._call("caches.delete", self.client.wrapped.aio.caches.delete, name=name, config=config)
+
+
+# Wraps a genai.Client and records every model and context cache call it makes into a Cassette, so a live session
+# can later be replayed offline with ReplayClient.
+class RecordingClient:
+    def __init__(self, client, cassette=None):
+        self.wrapped = client
+        self.cassette = cassette if cassette is not None else Cassette()
+        self.aio = self
+        self.models = _RecordingModels(self)
+        self.caches = _RecordingCaches(self)
+
+
+def _raise_recorded_error(error):
+    code = error["code"]
+    if 400 <= code < 500:
+        raise errors.ClientError(code, error["details"])
+    if 500 <= code < 600:
+        raise errors.ServerError(code, error["details"])
+    raise errors.APIError(code, error["details"])
+
+
+class _ReplayModels:
+    def __init__(self, client):
+        self.client = client
+
+    async def generate_content(self, model, contents, config=None):
+        interaction = self.client.next_interaction("generate_content", contents)
+        await self.client.sleep(interaction["latency"])
+        if "error" in interaction:
+            _raise_recorded_error(interaction["error"])
+        return types.GenerateContentResponse.model_validate(interaction["response"])
+
+    async def generate_content_stream(self, model, contents, config=None):
+        interaction = self.client.next_interaction("generate_content_stream", contents)
+        if "error" in interaction and not interaction.get("chunks"):
+            await self.client.sleep(interaction["latency"])
+            _raise_recorded_error(interaction["error"])
+        return self._stream(interaction)
+
+    async def _stream(self, interaction):
+        previous_offset = 0.0
+        for chunk in interaction["chunks"]:
+            await self.client.sleep(chunk["offset"] - previous_offset)
+            previous_offset = chunk["offset"]
+            yield types.GenerateContentResponse.model_validate(chunk["response"])
+        if "error" in interaction:
+            _raise_recorded_error(interaction["error"])
+
+
+class _ReplayCaches:
+    def __init__(self, client):
+        self.client = client
+
+    async def _replay(self, kind):
+        interaction = self.client.next_interaction(kind)
+        await self.client.sleep(interaction["latency"])
+        if "error" in interaction:
+            _raise_recorded_error(interaction["error"])
+        return interaction.get("response")
+
+    async def create(self, model, config):
+        return types.CachedContent.model_validate(await self._replay("caches.create"))
+
+    async def update(self, name, config=None):
+        return types.CachedContent.model_validate(await self._replay("caches.update"))
+
+    async def delete(self, name, config=None):
+        await self._replay("caches.delete")
+
+
+# Offline stand-in for genai.Client that plays a Cassette back. Calls are answered in the order they were recorded,
+# per kind of call. latency_scale=0 answers immediately, so a replay measures only the agent loop and the tools;
+# 1.0 waits as long as the live API took. When the tool results sent in a request differ from the recorded ones the
+# replay carries on with the recorded responses and counts the divergence.
+class ReplayClient:
+    def __init__(self, cassette, latency_scale=0.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        self.by_kind = {}
+        for interaction in cassette.interactions:
+            self.by_kind.setdefault(interaction["kind"], []).append(interaction)
+        self.positions = {}
+        self.requests = 0
+        self.divergences = 0
+        self.aio = self
+        self.models = _ReplayModels(self)
+        self.caches = _ReplayCaches(self)
+
+    def next_interaction(self, kind, contents=None):
+        position = self.positions.get(kind, 0)
+        matching = self.by_kind.get(kind, [])
+        if position >= len(matching):
+            raise RuntimeError(f"Cassette has no more recorded {kind} calls (replayed {position})")
+        self.positions[kind] = position + 1
+        interaction = matching[position]
+        if kind.startswith("generate_content"):
+            self.requests += 1
+            recorded = _tool_results(interaction["request"].get("contents"))
+            if recorded != _tool_results(_dump_contents(contents)):
+                self.divergences += 1
+                LOGGER.info(f"Replayed {kind} call {position} sent different tool results than were recorded")
+        return interaction
+
+    async def sleep(self, seconds):
+        if self.latency_scale > 0 and seconds > 0:
+            await asyncio.sleep(seconds * self.latency_scale)
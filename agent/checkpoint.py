@@ -0,0 +1,77 @@
+import gzip
+import json
+import os
+
+from .config import CHECKPOINT_DIR
+
+
+CHECKPOINT_VERSION = 1
+# SessionResult totals carried over when a session is resumed.
+RESULT_TOTALS = ("iterations", "prompt_tokens", "cached_prompt_tokens", "response_tokens", "rate_limited_seconds")
+
+
+def checkpoint_path(session):
+    # A session is named by its id, or by the path of its checkpoint file.
+    if session.endswith(".json.gz") or os.sep in session:
+        return session
+    return os.path.join(CHECKPOINT_DIR, f"{session}.json.gz")
+
+
+# The state of a session as of its last completed iteration: the conversation (with every tool result sent back to
+# the model), the history's compaction bookkeeping and the token totals so far. metadata holds what is needed to
+# start the session again (model and prompts). A snapshot is only taken between iterations, so a session that fails
+# half way through an iteration resumes with that iteration's model call.
+class SessionCheckpoint:
+    def __init__(self, session_id, metadata=None, state=None, error=None, path=None):
+        self.session_id = session_id
+        self.metadata = metadata or {}
+        self.state = state
+        self.error = error
+        self.path = path or checkpoint_path(session_id)
+
+    @classmethod
+    def load(cls, session):
+        path = checkpoint_path(session)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f'Unsupported checkpoint version {data.get("version")} in "{path}"')
+        return cls(data["session_id"], data["metadata"], data["state"], data.get("error"), path=path)
+
+    @property
+    def next_iteration(self):
+        return self.state["iteration"] if self.state else 0
+
+    def capture(self, iteration, history, result):
+        self.state = {
+            "iteration": iteration,
+            "history": history.snapshot(),
+            "result": {name: getattr(result, name) for name in RESULT_TOTALS},
+        }
+        self.error = None
+
+    def restore(self, history, result):
+        history.restore(self.state["history"])
+        for name, value in self.state["result"].items():
+            setattr(result, name, value)
+        return self.next_iteration
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "session_id": self.session_id,
+            "metadata": self.metadata,
+            "state": self.state,
+            "error": self.error,
+        }
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with gzip.open(temporary_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temporary_path, self.path)
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
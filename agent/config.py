@@ -0,0 +1,43 @@
+import os
+
+from functions.config import CACHE_DIR, MAX_CHARS
+
+
+# Defaults for the command line options. They live here, away from the modules that use them, so that parsing
+# arguments (and printing --help) does not import the Gen AI SDK.
+WORKING_DIRECTORY = "./calculator"
+MAX_ITERATIONS = 20
+MAX_WORKERS = 4
+CONCURRENCY = 4
+TOKEN_BUDGET = 60_000
+REQUESTS_PER_MINUTE = 10
+TOKENS_PER_MINUTE = 250_000
+
+CHECKPOINT_DIR = os.path.join(CACHE_DIR, "sessions")
+
+# Speculative prefetching (--prefetch): bytes read ahead per model call, the largest file worth reading ahead, how
+# many recent action logs to learn call patterns from, and how likely a listing must be to be followed by a read for
+# the listed files to be read ahead.
+PREFETCH_BYTE_BUDGET = 256 * 1024
+PREFETCH_MAX_FILE_BYTES = 64 * 1024
+PREFETCH_LOG_FILES = 50
+PREFETCH_MIN_PROBABILITY = 0.2
+
+# Cold-start budget checked by python -m agent.benchmark --startup: cumulative import time, as reported by
+# python -X importtime, of main.py --help and of the modules the tool tests import.
+STARTUP_IMPORT_BUDGET_MS = 100
+
+# Tool output shaping: the most tokens of each tool's output sent to the model (roughly four characters per token),
+# and the share of an over-budget output kept from its start; the rest is kept from its end. get_file_content already
+# stops at MAX_CHARS characters, so its budget covers that and the header and truncation note around it: a read the
+# tool allows is never cut a second time.
+CHARS_PER_TOKEN = 4
+FILE_READ_NOTE_CHARS = 512
+TOOL_OUTPUT_TOKEN_BUDGETS = {
+    "get_file_content": (MAX_CHARS + FILE_READ_NOTE_CHARS) // CHARS_PER_TOKEN,
+    "get_files_info": 1000,
+    "run_python_file": 1500,
+    "search_code": 1500,
+}
+DEFAULT_TOOL_OUTPUT_TOKENS = 2000
+TOOL_OUTPUT_HEAD_FRACTION = 0.4
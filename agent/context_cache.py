@@ -0,0 +1,89 @@
+import logging
+import time
+
+from google.genai import errors, types
+
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = 600
+REFRESH_MARGIN_SECONDS = 60
+
+
+# Request configuration for one session. The GenerateContentConfig is built once. With caching enabled, the static
+# prefix (system prompt, tool declarations and the opening turns) is uploaded once as cached content. Later requests
+# then send only the turns after it and refer to the cache by name. The cache's TTL is extended before it runs out,
+# and if the API refuses to cache (for example because the prefix is below the minimum size) requests fall back to
+# sending everything.
+class PromptCache:
+    def __init__(self, client, model, system_prompt, tools, prefix_contents=(), enabled=True, ttl=CACHE_TTL_SECONDS):
+        self.client = client
+        self.model = model
+        self.system_prompt = system_prompt
+        self.tools = tools
+        self.prefix_contents = list(prefix_contents)
+        self.enabled = enabled
+        self.ttl = ttl
+        self.config = types.GenerateContentConfig(tools=tools, system_instruction=system_prompt)
+        self.cached_config = None
+        self.name = None
+        self.expires_at = 0.0
+        self.cached_tokens = 0
+
+    async def _create(self):
+        cached_content = await self.client.aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=self.system_prompt,
+                tools=self.tools,
+                contents=self.prefix_contents or None,
+                ttl=f"{self.ttl}s",
+            ),
+        )
+        self.name = cached_content.name
+        self.cached_config = types.GenerateContentConfig(cached_content=self.name)
+        self.expires_at = time.monotonic() + self.ttl
+        if cached_content.usage_metadata and cached_content.usage_metadata.total_token_count:
+            self.cached_tokens = cached_content.usage_metadata.total_token_count
+        LOGGER.info(f"Created context cache {self.name} ({self.cached_tokens} tokens, ttl {self.ttl}s)")
+
+    async def _refresh(self):
+        try:
+            await self.client.aio.caches.update(
+                name=self.name, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s")
+            )
+            self.expires_at = time.monotonic() + self.ttl
+        except errors.ClientError:
+            # Most likely the cache already expired on the server; start again with a new one.
+            await self._create()
+
+    async def _ensure(self):
+        if self.name is None or time.monotonic() >= self.expires_at:
+            await self._create()
+        elif self.expires_at - time.monotonic() < REFRESH_MARGIN_SECONDS:
+            await self._refresh()
+
+    async def request(self, messages):
+        # Until there are turns after the prefix there is nothing to send alongside the cache, and a request needs
+        # contents, so the first request of a session goes out in full.
+        if not self.enabled or len(messages) <= len(self.prefix_contents):
+            return self.config, messages
+        try:
+            await self._ensure()
+        except errors.APIError as e:
+            LOGGER.info(f"Context caching unavailable, sending the full prompt instead: {e}")
+            self.enabled = False
+            return self.config, messages
+        return self.cached_config, messages[len(self.prefix_contents) :]
+
+    def expire(self):
+        self.name = None
+
+    async def close(self):
+        if self.name is None:
+            return
+        try:
+            await self.client.aio.caches.delete(name=self.name)
+        except errors.APIError as e:
+            LOGGER.info(f"Failed to delete context cache {self.name}: {e}")
+        self.name = None
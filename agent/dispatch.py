@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+from functions.apply_patch import patch_paths
+
+from .config import MAX_WORKERS
+
+
+WRITE_FUNCTIONS = {"write_file", "edit_file", "apply_patch"}
+# Calls that may read any file under the working directory: a script can import whatever was just written, and a
+# search reads every file.
+TREE_READ_FUNCTIONS = {"run_python_file", "search_code"}
+
+
+def written_paths(function_call_part):
+    # Normalized paths a call would write, relative to the working directory; empty for calls that write nothing.
+    args = function_call_part.args or {}
+    if function_call_part.name == "apply_patch":
+        paths = patch_paths(str(args.get("patch", "")))
+    elif function_call_part.name in WRITE_FUNCTIONS and "file_path" in args:
+        paths = [args["file_path"]]
+    else:
+        return []
+    return [os.path.normpath(str(path)) for path in paths]
+
+
+def read_path(function_call_part):
+    # Normalized path of the file a call reads, or None for calls that read no single file.
+    args = function_call_part.args or {}
+    if function_call_part.name in WRITE_FUNCTIONS or "file_path" not in args:
+        return None
+    return os.path.normpath(str(args["file_path"]))
+
+
+def listed_directory(function_call_part):
+    # Normalized directory a listing covers, or None for calls that list nothing.
+    if function_call_part.name != "get_files_info":
+        return None
+    return os.path.normpath(str((function_call_part.args or {}).get("directory") or "."))
+
+
+def _is_under(path, directory):
+    return directory == "." or path == directory or path.startswith(directory + os.sep)
+
+
+def _waits_for(function_call_part, write_tails):
+    # The earlier calls in the turn this call must run after. Writes to the same path run one after another, in
+    # order, and a patch touching several files waits on each of them. A read of a file waits for the writes to it,
+    # a listing for the writes under its directory, and calls that may read any file in the tree wait for every
+    # write. Everything else is free to run alongside the rest.
+    paths = written_paths(function_call_part)
+    if paths:
+        return {write_tails[path] for path in paths if path in write_tails}
+    if function_call_part.name in TREE_READ_FUNCTIONS:
+        return set(write_tails.values())
+    directory = listed_directory(function_call_part)
+    if directory is not None:
+        return {task for path, task in write_tails.items() if _is_under(path, directory)}
+    path = read_path(function_call_part)
+    return {write_tails[path]} if path in write_tails else set()
+
+
+# Starts each function call as soon as it is submitted, so calls can begin while the model is still streaming the
+# rest of its turn. A call waits for the earlier writes in the turn that it could observe before it starts.
+class AsyncToolDispatcher:
+    def __init__(self, call, max_workers=MAX_WORKERS):
+        self.call = call
+        self.semaphore = asyncio.Semaphore(max(1, max_workers))
+        self.function_call_parts = []
+        self.tasks = []
+        self.write_tails = {}
+
+    async def _run(self, function_call_part, previous):
+        if previous:
+            await asyncio.wait(previous)
+        async with self.semaphore:
+            return await self.call(function_call_part)
+
+    def submit(self, function_call_part):
+        previous = _waits_for(function_call_part, self.write_tails)
+        task = asyncio.create_task(self._run(function_call_part, previous))
+        for path in written_paths(function_call_part):
+            self.write_tails[path] = task
+        self.function_call_parts.append(function_call_part)
+        self.tasks.append(task)
+        return task
+
+    async def results(self):
+        return list(await asyncio.gather(*self.tasks))
+
@@ -0,0 +1,117 @@
+import asyncio
+import itertools
+import re
+
+from google.genai import errors, types
+
+from .rate_limit import estimate_tokens
+
+
+def _estimate_prompt_tokens(system_instruction, tools, contents):
+    tokens = estimate_tokens(contents or [])
+    if system_instruction:
+        tokens += len(str(system_instruction)) // 4
+    for tool in tools or []:
+        tokens += len(tool.model_dump_json(exclude_none=True)) // 4
+    return tokens
+
+
+def text_response(text):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))]
+    )
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    async def generate_content_stream(self, model, contents, config=None):
+        response = await self.generate_content(model, contents, config)
+        return self._stream(response)
+
+    async def _stream(self, response):
+        parts = response.candidates[0].content.parts if response.candidates and response.candidates[0].content else []
+        chunks = []
+        for part in parts or []:
+            if part.text:
+                chunks.extend(types.Part(text=word) for word in re.findall(r"\s*\S+\s*", part.text))
+            else:
+                chunks.append(part)
+        for i, part in enumerate(chunks):
+            await asyncio.sleep(self.client.chunk_delay)
+            yield types.GenerateContentResponse(
+                candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))],
+                usage_metadata=response.usage_metadata if i == len(chunks) - 1 else None,
+            )
+
+    async def generate_content(self, model, contents, config=None):
+        if not contents:
+            # Like the SDK, which checks this before sending anything.
+            raise ValueError("contents are required.")
+        config = config or types.GenerateContentConfig()
+        cached_tokens = 0
+        if config.cached_content:
+            if config.cached_content not in self.client.cached_contents:
+                raise errors.ClientError(404, {"error": {"code": 404, "message": "CachedContent not found"}})
+            cached_tokens = self.client.cached_contents[config.cached_content]
+        prompt_tokens = cached_tokens + _estimate_prompt_tokens(config.system_instruction, config.tools, contents)
+
+        response = self.client.responses.pop(0) if self.client.responses else text_response("Done.")
+        response = response.model_copy(deep=True)
+        candidate_tokens = sum(
+            estimate_tokens([candidate.content]) for candidate in response.candidates or [] if candidate.content
+        )
+        response.usage_metadata = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens or None,
+            candidates_token_count=candidate_tokens,
+            total_token_count=prompt_tokens + candidate_tokens,
+        )
+
+        self.client.requests += 1
+        self.client.billed_prompt_tokens += prompt_tokens - cached_tokens
+        self.client.cached_prompt_tokens += cached_tokens
+        return response
+
+
+class _FakeCaches:
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, model, config):
+        tokens = _estimate_prompt_tokens(config.system_instruction, config.tools, config.contents)
+        if tokens < self.client.min_cache_tokens:
+            message = f"Cached content is too small: {tokens} tokens"
+            raise errors.ClientError(400, {"error": {"code": 400, "message": message, "status": "INVALID_ARGUMENT"}})
+        name = f"cachedContents/fake-{next(self.client.cache_ids)}"
+        self.client.cached_contents[name] = tokens
+        self.client.billed_prompt_tokens += tokens
+        return types.CachedContent(
+            name=name, model=model, usage_metadata=types.CachedContentUsageMetadata(total_token_count=tokens)
+        )
+
+    async def update(self, name, config=None):
+        if name not in self.client.cached_contents:
+            raise errors.ClientError(404, {"error": {"code": 404, "message": "CachedContent not found"}})
+        return types.CachedContent(name=name)
+
+    async def delete(self, name, config=None):
+        self.client.cached_contents.pop(name, None)
+
+
+# Offline stand-in for genai.Client that replays scripted responses and counts how many prompt tokens would have
+# been billed in full versus served from cached content, so the effect of context caching can be measured locally.
+class FakeClient:
+    def __init__(self, responses=(), min_cache_tokens=0, chunk_delay=0.0):
+        self.responses = list(responses)
+        self.min_cache_tokens = min_cache_tokens
+        self.chunk_delay = chunk_delay
+        self.cached_contents = {}
+        self.cache_ids = itertools.count(1)
+        self.requests = 0
+        self.billed_prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.aio = self
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches(self)
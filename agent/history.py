@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+
+from google.genai import types
+
+from .config import TOKEN_BUDGET
+from .dispatch import written_paths
+from .rate_limit import estimate_tokens
+from .shaping import UNCHANGED_KEY
+
+
+LOGGER = logging.getLogger(__name__)
+
+KEEP_RECENT_TURNS = 4
+SUMMARY_SNIPPET_CHARS = 200
+SUMMARY_HEADER = "Summary of earlier steps, compacted to save context:"
+
+# Calls whose output only depends on their arguments and the files on disk, so an older copy is redundant once the
+# same call has been made again.
+REPEATABLE_FUNCTIONS = {"get_file_content", "get_files_info", "search_code", "run_python_file"}
+
+
+def _call_key(function_call):
+    return function_call.name, json.dumps(function_call.args or {}, sort_keys=True, default=str)
+
+
+def _snippet(value):
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    text = " ".join(text.split())
+    return text if len(text) <= SUMMARY_SNIPPET_CHARS else text[:SUMMARY_SNIPPET_CHARS] + "..."
+
+
+# The conversation sent to the model on every iteration, kept within a token budget. messages[0] is always the user's
+# prompt. Once anything has been summarized, messages[1] is the summary, and after that come (model, tool) turns.
+class ConversationHistory:
+    def __init__(self, user_prompt, token_budget=TOKEN_BUDGET, keep_recent_turns=KEEP_RECENT_TURNS):
+        self.messages = [types.Content(role="user", parts=[types.Part(text=user_prompt)])]
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.token_estimate = estimate_tokens(self.messages)
+        self.collapsed_outputs = 0
+        self.summarized_turns = 0
+
+    def append(self, content):
+        self.messages.append(content)
+        self.token_estimate += estimate_tokens([content])
+
+    def snapshot(self):
+        # JSON-serializable copy of the history, for session checkpoints.
+        return {
+            "messages": [content.model_dump(mode="json", exclude_none=True) for content in self.messages],
+            "token_estimate": self.token_estimate,
+            "collapsed_outputs": self.collapsed_outputs,
+            "summarized_turns": self.summarized_turns,
+        }
+
+    def restore(self, snapshot):
+        self.messages = [types.Content.model_validate(content) for content in snapshot["messages"]]
+        self.token_estimate = snapshot["token_estimate"]
+        self.collapsed_outputs = snapshot["collapsed_outputs"]
+        self.summarized_turns = snapshot["summarized_turns"]
+
+    def record_usage(self, usage_metadata):
+        # The API's count of what was just sent replaces our estimate; contents appended afterwards are estimated.
+        if usage_metadata and usage_metadata.prompt_token_count is not None:
+            self.token_estimate = usage_metadata.prompt_token_count
+
+    def _has_summary(self):
+        return len(self.messages) > 1 and self.messages[1].role == "user"
+
+    def _turns(self):
+        # Pairs of (model content, tool content) after the prompt and summary.
+        start = 2 if self._has_summary() else 1
+        turns = []
+        for i in range(start, len(self.messages) - 1):
+            model_content, tool_content = self.messages[i], self.messages[i + 1]
+            if model_content.role == "model" and tool_content.role == "tool":
+                turns.append((model_content, tool_content))
+        return turns
+
+    def _calls_and_responses(self):
+        for turn, (model_content, tool_content) in enumerate(self._turns()):
+            function_calls = [part.function_call for part in model_content.parts or [] if part.function_call]
+            response_parts = [part for part in tool_content.parts or [] if part.function_response]
+            for function_call, response_part in zip(function_calls, response_parts):
+                yield turn, function_call, response_part
+
+    def collapse_stale_outputs(self):
+        # A response that only refers back to an identical earlier output (see agent.shaping) does not replace that
+        # output: the output stays until something after its last reference supersedes it, and the references go
+        # with it.
+        calls = list(self._calls_and_responses())
+        last_seen = {}
+        last_written = {}
+        referred_to = {}
+        referenced_until = {}
+        for position, (_, function_call, response_part) in enumerate(calls):
+            key = _call_key(function_call)
+            if UNCHANGED_KEY in (response_part.function_response.response or {}):
+                if key in last_seen:
+                    referred_to[position] = last_seen[key]
+                    referenced_until[last_seen[key]] = position
+            else:
+                last_seen[key] = position
+            for path in written_paths(function_call):
+                last_written[path] = position
+
+        collapsed = 0
+        reasons = {}
+        for position, (_, function_call, response_part) in enumerate(calls):
+            if function_call.name not in REPEATABLE_FUNCTIONS:
+                continue
+            response = response_part.function_response.response or {}
+            if "stale" in response:
+                continue
+
+            file_path = (function_call.args or {}).get("file_path")
+            until = referenced_until.get(position, position)
+            if UNCHANGED_KEY in response:
+                if referred_to.get(position) not in reasons:
+                    continue
+                reason = reasons[referred_to[position]]
+            elif last_seen[_call_key(function_call)] > until:
+                reason = "the same call was made again later"
+            elif file_path is not None and last_written.get(os.path.normpath(str(file_path)), -1) > until:
+                reason = f'"{file_path}" was rewritten later'
+            else:
+                continue
+
+            before = estimate_tokens([types.Content(role="tool", parts=[response_part])])
+            response_part.function_response.response = {"stale": f"Output removed because {reason}."}
+            self.token_estimate -= before - estimate_tokens([types.Content(role="tool", parts=[response_part])])
+            reasons[position] = reason
+            collapsed += 1
+
+        self.collapsed_outputs += collapsed
+        return collapsed
+
+    def _move_referenced_outputs(self, removed):
+        # A kept response that refers back to an output in a turn about to be summarized takes that output over, so
+        # the model still has a copy; later references then point at the response it moved into.
+        outputs = {}
+        for model_content, tool_content in self._turns():
+            summarized = id(tool_content) in removed
+            function_calls = [part.function_call for part in model_content.parts or [] if part.function_call]
+            response_parts = [part for part in tool_content.parts or [] if part.function_response]
+            for function_call, response_part in zip(function_calls, response_parts):
+                key = _call_key(function_call)
+                response = response_part.function_response.response or {}
+                if "result" in response:
+                    outputs[key] = (summarized, response["result"])
+                elif UNCHANGED_KEY in response and not summarized and outputs.get(key, (False,))[0]:
+                    before = estimate_tokens([types.Content(role="tool", parts=[response_part])])
+                    response_part.function_response.response = {"result": outputs[key][1]}
+                    self.token_estimate += estimate_tokens([types.Content(role="tool", parts=[response_part])]) - before
+                    outputs[key] = (False, outputs[key][1])
+
+    def _summarize_turn(self, model_content, tool_content):
+        lines = []
+        responses = [part.function_response for part in tool_content.parts or [] if part.function_response]
+        function_calls = [part.function_call for part in model_content.parts or [] if part.function_call]
+        for part in model_content.parts or []:
+            if part.text and not part.thought:
+                lines.append(f"- Model: {_snippet(part.text)}")
+        for function_call, function_response in zip(function_calls, responses):
+            lines.append(
+                f"- Called {function_call.name}({_snippet(function_call.args or {})}) -> "
+                f"{_snippet(function_response.response or {})}"
+            )
+        return lines
+
+    def summarize_old_turns(self):
+        turns = self._turns()
+        if self.token_estimate <= self.token_budget or len(turns) <= self.keep_recent_turns:
+            return 0
+
+        summary_lines = []
+        removed = set()
+        for model_content, tool_content in turns[: len(turns) - self.keep_recent_turns]:
+            if self.token_estimate <= self.token_budget:
+                break
+            summary_lines.extend(self._summarize_turn(model_content, tool_content))
+            self.token_estimate -= estimate_tokens([model_content, tool_content])
+            removed.update((id(model_content), id(tool_content)))
+        self._move_referenced_outputs(removed)
+        self.messages = [content for content in self.messages if id(content) not in removed]
+
+        previous_lines = []
+        if self._has_summary():
+            previous_summary = self.messages.pop(1)
+            self.token_estimate -= estimate_tokens([previous_summary])
+            previous_lines = previous_summary.parts[0].text.split("\n")[1:]
+        summary_text = "\n".join([SUMMARY_HEADER, *previous_lines, *summary_lines])
+        summary = types.Content(role="user", parts=[types.Part(text=summary_text)])
+        self.messages.insert(1, summary)
+        self.token_estimate += estimate_tokens([summary])
+
+        self.summarized_turns += len(removed) // 2
+        return len(removed) // 2
+
+    def compact(self):
+        collapsed = self.collapse_stale_outputs()
+        summarized = self.summarize_old_turns()
+        if collapsed or summarized:
+            LOGGER.info(
+                f"Compacted history: collapsed {collapsed} stale tool outputs, summarized {summarized} turns, "
+                f"~{self.token_estimate} tokens"
+            )
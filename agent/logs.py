@@ -0,0 +1,28 @@
+import logging
+
+from .metrics import SESSION_ID
+
+
+LOG_FORMAT = "{asctime} - {levelname} - {message}"
+LOG_DATE_FORMAT = "%Y-%m-%d:%H:%M:%S"
+
+
+# Prefixes log records with the id of the session that produced them, when several sessions share one log file.
+class SessionLogFilter(logging.Filter):
+    def filter(self, record):
+        session_id = SESSION_ID.get()
+        if session_id is not None:
+            record.msg = f"[{session_id}] {record.msg}"
+        return True
+
+
+def configure_file_logging(path, logger_name="agent"):
+    # Called once the arguments have been parsed, so --help and usage errors leave no log file behind. The file is
+    # only created when the first record is written.
+    file_handler = logging.FileHandler(path, mode="w", encoding="utf-8", delay=True)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT, style="{", datefmt=LOG_DATE_FORMAT))
+    file_handler.addFilter(SessionLogFilter())
+    logger = logging.getLogger(logger_name)
+    logger.addHandler(file_handler)
+    logger.setLevel(logging.INFO)
+    return file_handler
@@ -0,0 +1,176 @@
+import contextlib
+import contextvars
+import json
+import threading
+import time
+
+from dataclasses import dataclass, field
+
+
+SESSION_ID = contextvars.ContextVar("session_id", default=None)
+CURRENT_TRACER = contextvars.ContextVar("tracer", default=None)
+
+# Span attributes that become Prometheus labels; everything else is only kept in the JSON lines export.
+LABEL_ATTRIBUTES = ("tool", "status")
+# Span attributes summed into counters in the Prometheus export, per span name and tool: (attribute, metric, label
+# name, label value).
+COUNTER_ATTRIBUTES = (
+    ("request_bytes", "agent_payload_bytes_total", "direction", "request"),
+    ("response_bytes", "agent_payload_bytes_total", "direction", "response"),
+    ("prompt_tokens", "agent_tokens_total", "kind", "prompt"),
+    ("cached_tokens", "agent_tokens_total", "kind", "cached"),
+    ("response_tokens", "agent_tokens_total", "kind", "response"),
+    ("output_tokens", "agent_tool_output_tokens_total", "stage", "output"),
+    ("sent_tokens", "agent_tool_output_tokens_total", "stage", "sent"),
+)
+# Span attributes exported as gauges, keeping the latest value per span name and tool: (attribute, metric).
+GAUGE_ATTRIBUTES = (("budget_tokens", "agent_tool_output_budget_tokens"),)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration: float = 0.0
+    session_id: str | None = None
+    attributes: dict = field(default_factory=dict)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        record = {"name": self.name, "start": round(self.start, 6), "duration": round(self.duration, 6)}
+        if self.session_id is not None:
+            record["session_id"] = self.session_id
+        record.update(self.attributes)
+        return record
+
+
+class _NullSpan:
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+# Collects timed spans (model calls, tool calls, rate-limit waits, retries) from every session running with it as
+# the current tracer. Spans are kept in memory and written out at the end as JSON lines and as a Prometheus text
+# file, so there is no cost per span beyond appending to a list.
+class Tracer:
+    def __init__(self):
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        started = time.perf_counter()
+        span = Span(name, started - self.origin, session_id=SESSION_ID.get(), attributes=attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes.setdefault("status", str(getattr(e, "code", None) or "error"))
+            span.attributes.setdefault("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            span.attributes.setdefault("status", "ok")
+            self._add(span)
+
+    def record(self, name, duration=0.0, **attributes):
+        start = time.perf_counter() - self.origin - duration
+        span = Span(name, start, duration, session_id=SESSION_ID.get(), attributes=attributes)
+        self._add(span)
+        return span
+
+    def write_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for span in sorted(self.spans, key=lambda span: span.start):
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def prometheus_text(self):
+        durations = {}
+        counters = {}
+        gauges = {}
+        for span in self.spans:
+            labels = (("span", span.name),) + tuple(
+                (name, span.attributes[name]) for name in LABEL_ATTRIBUTES if name in span.attributes
+            )
+            count, total = durations.get(labels, (0, 0.0))
+            durations[labels] = (count + 1, total + span.duration)
+            for attribute, metric, label_name, label_value in COUNTER_ATTRIBUTES:
+                if span.attributes.get(attribute):
+                    key = (metric, tuple(pair for pair in labels if pair[0] != "status") + ((label_name, label_value),))
+                    counters[key] = counters.get(key, 0) + span.attributes[attribute]
+            for attribute, metric in GAUGE_ATTRIBUTES:
+                if span.attributes.get(attribute):
+                    gauges[metric, tuple(pair for pair in labels if pair[0] != "status")] = span.attributes[attribute]
+
+        lines = [
+            "# HELP agent_span_duration_seconds Time spent in each phase of the agent loop.",
+            "# TYPE agent_span_duration_seconds summary",
+        ]
+        for labels, (count, total) in sorted(durations.items()):
+            lines.append(f"agent_span_duration_seconds_count{_labels(labels)} {count}")
+            lines.append(f"agent_span_duration_seconds_sum{_labels(labels)} {total:.6f}")
+        for metric, description in (
+            ("agent_payload_bytes_total", "Bytes sent to and received from the model and the tools."),
+            ("agent_tokens_total", "Tokens reported by the API's usage metadata."),
+            ("agent_tool_output_tokens_total", "Estimated tokens of tool output, before and after shaping."),
+        ):
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{metric}{_labels(labels)} {value}")
+        for metric, description in (("agent_tool_output_budget_tokens", "Token budget of each tool's output."),):
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} gauge")
+            for (name, labels), value in sorted(gauges.items()):
+                if name == metric:
+                    lines.append(f"{metric}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+
+
+def use_tracer(tracer):
+    CURRENT_TRACER.set(tracer)
+
+
+def tracing():
+    return CURRENT_TRACER.get() is not None
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    tracer = CURRENT_TRACER.get()
+    if tracer is None:
+        yield NULL_SPAN
+        return
+    with tracer.span(name, **attributes) as current:
+        yield current
+
+
+def record(name, duration=0.0, **attributes):
+    tracer = CURRENT_TRACER.get()
+    if tracer is not None:
+        tracer.record(name, duration, **attributes)
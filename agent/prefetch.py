@@ -0,0 +1,222 @@
+import ast
+import asyncio
+import glob
+import logging
+import os
+import re
+import stat
+import threading
+
+from collections import Counter, defaultdict
+
+from functions.config import MAX_CHARS
+from functions.file_cache import FILE_CACHE, file_version
+from functions.get_file_content import get_file_content
+from functions.workspace import Workspace
+
+from . import metrics
+from .config import PREFETCH_BYTE_BUDGET, PREFETCH_LOG_FILES, PREFETCH_MAX_FILE_BYTES, PREFETCH_MIN_PROBABILITY
+
+
+LOGGER = logging.getLogger(__name__)
+
+START = "<start>"
+# "{asctime} - INFO - [session id]  - Calling function: name({args})", as written by agent.tools and agent.logs.
+LOGGED_CALL = re.compile(
+    r"^\S+ - \w+ - (?:\[(?P<session>[^\]]*)\] )?\s*- Calling function: (?P<name>\w+)\((?P<args>.*)\)$"
+)
+# One entry of a get_files_info result.
+LISTED_ENTRY = re.compile(r"^- (?P<path>.+): file_size=(?P<size>\d+) bytes, is_dir=(?P<is_dir>True|False)$")
+
+
+def recent_action_logs(directory=".", limit=PREFETCH_LOG_FILES):
+    paths = glob.glob(os.path.join(directory, "action_log_*.log"))
+    return sorted(paths, key=os.path.getmtime, reverse=True)[:limit]
+
+
+def _parse_args(text):
+    try:
+        args = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return None
+    return args if isinstance(args, dict) else None
+
+
+def _whole_file_read(name, args):
+    # The file a call reads in full; ranged reads are not cached as whole files, so they are not worth predicting.
+    if name == "get_file_content" and set(args) == {"file_path"}:
+        return os.path.normpath(str(args["file_path"]))
+    return None
+
+
+# What past sessions did, learned from the tool calls recorded in action logs: how often each tool followed each
+# other tool and which files were read in full.
+class CallPatterns:
+    def __init__(self):
+        self.transitions = Counter()
+        self.reads = Counter()
+        self.sessions = 0
+
+    @classmethod
+    def from_logs(cls, paths):
+        patterns = cls()
+        for path in paths:
+            sessions = defaultdict(list)
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        match = LOGGED_CALL.match(line.rstrip("\n"))
+                        if match is None:
+                            continue
+                        args = _parse_args(match.group("args"))
+                        if args is not None:
+                            sessions[match.group("session")].append((match.group("name"), args))
+            except OSError as e:
+                LOGGER.info(f"Skipping action log {path}: {e}")
+                continue
+            for calls in sessions.values():
+                patterns.learn(calls)
+        return patterns
+
+    def learn(self, calls):
+        previous = START
+        for name, args in calls:
+            self.transitions[(previous, name)] += 1
+            file_path = _whole_file_read(name, args)
+            if file_path is not None:
+                self.reads[file_path] += 1
+            previous = name
+        self.sessions += 1
+
+    def probability(self, previous, name):
+        # How often name was the next call after previous, or None when previous was never seen.
+        total = sum(count for (first, _), count in self.transitions.items() if first == previous)
+        if total == 0:
+            return None
+        return self.transitions[(previous, name)] / total
+
+
+def _function_calls(messages):
+    # (function call, response) pairs in the order they were made.
+    for model_content, tool_content in zip(messages, messages[1:]):
+        if model_content.role != "model" or tool_content.role != "tool":
+            continue
+        function_calls = [part.function_call for part in model_content.parts or [] if part.function_call]
+        responses = [part.function_response for part in tool_content.parts or [] if part.function_response]
+        for function_call, function_response in zip(function_calls, responses):
+            yield function_call, function_response.response or {}
+
+
+def _listed_entries(directory, response):
+    result = response.get("result")
+    if not isinstance(result, str):
+        return
+    for line in result.splitlines():
+        match = LISTED_ENTRY.match(line)
+        if match is not None:
+            path = os.path.normpath(os.path.join(directory, match.group("path")))
+            yield path, int(match.group("size")), match.group("is_dir") == "True"
+
+
+# Reads ahead the files the model is likely to ask for next while a model call is in flight: the files of directories
+# that were just listed (most often read first, then smallest first) and the files past sessions read most. They go
+# into FILE_CACHE through get_file_content, so a later identical call is answered from memory. Listings are not read
+# ahead; making one costs less than looking it up would. At most byte_budget bytes are read per model call, and
+# reading stops as soon as the model has answered, so prefetching never holds up the tools that were actually called.
+class Prefetcher:
+    def __init__(self, working_directory, patterns=None, byte_budget=PREFETCH_BYTE_BUDGET):
+        self.workspace = Workspace.of(working_directory)
+        self.patterns = patterns if patterns is not None else CallPatterns()
+        self.byte_budget = byte_budget
+        self.prefetched = set()
+        self.requested = set()
+        self.files = 0
+        self.bytes = 0
+        self.useful = 0
+        self._stopped = threading.Event()
+        self._task = None
+
+    def plan(self, messages):
+        # [(relative file path, size or None)] to read ahead, most useful first. Only the latest
+        # turn is looked at; history compaction may already have summarized the ones before it.
+        new_calls = list(_function_calls(messages[-2:]))
+        for function_call, _ in new_calls:
+            file_path = _whole_file_read(function_call.name, function_call.args or {})
+            if file_path is not None:
+                if file_path in self.prefetched and file_path not in self.requested:
+                    self.useful += 1
+                self.requested.add(file_path)
+
+        probability = self.patterns.probability("get_files_info", "get_file_content")
+        read_listed = probability is None or probability >= PREFETCH_MIN_PROBABILITY
+        listed_files = []
+        for function_call, response in new_calls:
+            if function_call.name != "get_files_info":
+                continue
+            directory = os.path.normpath(str((function_call.args or {}).get("directory", ".")))
+            for path, size, is_dir in _listed_entries(directory, response):
+                if not is_dir and read_listed and size <= PREFETCH_MAX_FILE_BYTES:
+                    listed_files.append((path, size))
+        listed_files.sort(key=lambda item: (-self.patterns.reads[item[0]], item[1]))
+
+        planned = {path for path, _ in listed_files}
+        files = listed_files + [(path, None) for path, _ in self.patterns.reads.most_common() if path not in planned]
+        files = [(path, size) for path, size in files if path not in self.requested and path not in self.prefetched]
+        return files
+
+    async def start(self, messages):
+        await self.close()
+        files = self.plan(messages)
+        self._stopped = threading.Event()
+        if files:
+            self._task = asyncio.create_task(asyncio.to_thread(self._prefetch, files, self._stopped))
+
+    def stop(self):
+        self._stopped.set()
+
+    async def close(self):
+        self.stop()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def _prefetch(self, files, stopped):
+        workspace = self.workspace
+        with metrics.span("prefetch") as prefetch_span:
+            files_read = bytes_read = 0
+            budget = self.byte_budget
+            for path, _ in files:
+                if stopped.is_set() or budget <= 0:
+                    break
+                file_abs_path = workspace.resolve(path)
+                if file_abs_path is None:
+                    continue
+                try:
+                    file_stat = os.stat(file_abs_path)
+                except OSError:
+                    continue
+                cost = min(file_stat.st_size, MAX_CHARS)
+                if (
+                    not stat.S_ISREG(file_stat.st_mode)
+                    or file_stat.st_size > PREFETCH_MAX_FILE_BYTES
+                    or cost > budget
+                    or FILE_CACHE.contains(file_abs_path, file_version(file_stat))
+                ):
+                    continue
+                if get_file_content(workspace, path).startswith("Error:"):
+                    continue
+                budget -= cost
+                files_read += 1
+                bytes_read += cost
+                self.prefetched.add(path)
+
+            self.files += files_read
+            self.bytes += bytes_read
+            prefetch_span.set(files=files_read, bytes=bytes_read)
+
+    def stats(self):
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "files_used": self.useful,
+        }
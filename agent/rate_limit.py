@@ -0,0 +1,93 @@
+import asyncio
+import re
+import time
+
+from .config import REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+
+
+MAX_RETRIES = 3
+DEFAULT_RETRY_DELAY = 5.0
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.available = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def time_until(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+
+    def take(self, amount):
+        self._refill()
+        self.available -= amount
+
+
+# Requests-per-minute and tokens-per-minute budget, shared by every session that uses the same client.
+class RateLimiter:
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, estimated_tokens=0):
+        waited = 0.0
+        async with self._lock:
+            while True:
+                delay = max(
+                    self.blocked_until - time.monotonic(),
+                    self.requests.time_until(1),
+                    self.tokens.time_until(estimated_tokens),
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+                waited += delay
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+        return waited
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        if actual_tokens is not None:
+            self.tokens.take(actual_tokens - estimated_tokens)
+
+    def back_off(self, delay):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+
+def estimate_tokens(contents):
+    # Roughly four characters per token; good enough to keep the token bucket honest before usage is known.
+    return sum(len(content.model_dump_json(exclude_none=True)) for content in contents) // 4
+
+
+def _parse_duration(value):
+    match = re.fullmatch(r"\s*([0-9.]+)\s*s?\s*", str(value))
+    return float(match.group(1)) if match else None
+
+
+def retry_after(error):
+    details = error.details.get("error", error.details) if isinstance(error.details, dict) else {}
+    for detail in details.get("details", []) if isinstance(details, dict) else []:
+        if isinstance(detail, dict) and detail.get("@type", "").endswith("RetryInfo"):
+            delay = _parse_duration(detail.get("retryDelay", ""))
+            if delay is not None:
+                return delay
+
+    headers = getattr(error.response, "headers", None) or {}
+    delay = _parse_duration(headers.get("retry-after", "")) if hasattr(headers, "get") else None
+    if delay is not None:
+        return delay
+
+    match = re.search(r"retry in ([0-9.]+)\s*s", str(error.message or ""))
+    return float(match.group(1)) if match else None
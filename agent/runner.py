@@ -0,0 +1,389 @@
+import asyncio
+import logging
+import time
+
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any
+
+from google.genai import errors, types
+
+from functions.file_cache import FILE_CACHE
+from functions.result_cache import RESULT_CACHE
+from functions.workspace import Workspace
+
+from . import metrics
+from .config import MAX_ITERATIONS, PREFETCH_BYTE_BUDGET, WORKING_DIRECTORY
+from .context_cache import PromptCache
+from .dispatch import MAX_WORKERS, AsyncToolDispatcher
+from .history import TOKEN_BUDGET, ConversationHistory
+from .metrics import SESSION_ID
+from .prefetch import Prefetcher
+from .rate_limit import DEFAULT_RETRY_DELAY, MAX_RETRIES, RateLimiter, estimate_tokens, retry_after
+from .shaping import ResponseShaper
+from .tools import REGISTRY
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Where the time of one loop iteration went. Whatever is not the model call, a rate-limit wait or the tools is the
+# loop's own overhead: building requests, bookkeeping and history compaction.
+@dataclass
+class IterationTiming:
+    total_seconds: float = 0.0
+    model_seconds: float = 0.0
+    rate_limited_seconds: float = 0.0
+    tool_seconds: float = 0.0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+
+    @property
+    def overhead_seconds(self):
+        return max(0.0, self.total_seconds - self.model_seconds - self.rate_limited_seconds - self.tool_seconds)
+
+
+@dataclass
+class SessionResult:
+    user_prompt: str
+    final_text: str | None = None
+    iterations: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    response_tokens: int = 0
+    rate_limited_seconds: float = 0.0
+    wall_time: float = 0.0
+    response: Any = None
+    iteration_timings: list[IterationTiming] = field(default_factory=list)
+
+
+def _payload_bytes(models):
+    return sum(len(model.model_dump_json(exclude_none=True)) for model in models)
+
+
+async def _request_with_retries(prompt_cache, messages, rate_limiter, estimated_tokens, request):
+    waited = 0.0
+    if estimated_tokens is None:
+        estimated_tokens = estimate_tokens(messages)
+    config, contents = await prompt_cache.request(messages)
+    for attempt in range(MAX_RETRIES + 1):
+        with metrics.span("rate_limit_wait", attempt=attempt) as wait_span:
+            slept = await rate_limiter.acquire(estimated_tokens)
+            wait_span.set(slept_seconds=round(slept, 6))
+        waited += slept
+        try:
+            with metrics.span("model_call", attempt=attempt, cached=bool(config.cached_content)) as call_span:
+                if metrics.tracing():
+                    call_span.set(request_bytes=_payload_bytes(contents))
+                response = await request(config, contents)
+                if metrics.tracing():
+                    call_span.set(response_bytes=_payload_bytes([response]))
+                if response.usage_metadata:
+                    call_span.set(
+                        prompt_tokens=response.usage_metadata.prompt_token_count or 0,
+                        cached_tokens=response.usage_metadata.cached_content_token_count or 0,
+                        response_tokens=response.usage_metadata.candidates_token_count or 0,
+                    )
+        except errors.ClientError as e:
+            if getattr(e, "partial_response", False):
+                raise
+            if e.code == 404 and config.cached_content and attempt < MAX_RETRIES:
+                LOGGER.info(f"Context cache {config.cached_content} is gone, creating a new one")
+                metrics.record("retry", attempt=attempt, reason="context cache expired")
+                prompt_cache.expire()
+                config, contents = await prompt_cache.request(messages)
+                continue
+            if e.code != 429 or attempt == MAX_RETRIES:
+                raise
+            delay = retry_after(e) or DEFAULT_RETRY_DELAY * 2**attempt
+            LOGGER.info(f"Rate limited by the API, retrying in {delay:.1f}s")
+            metrics.record("retry", attempt=attempt, reason="rate limited", delay_seconds=delay)
+            rate_limiter.back_off(delay)
+            continue
+
+        if response.usage_metadata:
+            rate_limiter.record_usage(estimated_tokens, response.usage_metadata.total_token_count)
+        return response, waited
+
+
+async def generate_content_helper(client, model, prompt_cache, messages, rate_limiter, estimated_tokens=None):
+    async def request(config, contents):
+        return await client.aio.models.generate_content(model=model, config=config, contents=contents)
+
+    return await _request_with_retries(prompt_cache, messages, rate_limiter, estimated_tokens, request)
+
+
+def _merge_part(parts, part):
+    # Streamed text arrives in many small chunks; keep it as one part so the history stays compact.
+    previous = parts[-1] if parts else None
+    if (
+        previous is not None
+        and part.text
+        and previous.text
+        and not part.thought
+        and not previous.thought
+        and not part.thought_signature
+        and not previous.thought_signature
+    ):
+        parts[-1] = types.Part(text=previous.text + part.text)
+    else:
+        parts.append(part)
+
+
+async def stream_content_helper(client, model, prompt_cache, messages, rate_limiter, estimated_tokens, on_part):
+    async def request(config, contents):
+        parts = []
+        usage_metadata = None
+        stream = await client.aio.models.generate_content_stream(model=model, config=config, contents=contents)
+        try:
+            async for chunk in stream:
+                usage_metadata = chunk.usage_metadata or usage_metadata
+                if not chunk.candidates or not chunk.candidates[0].content:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    on_part(part)
+                    _merge_part(parts, part)
+        except errors.ClientError as e:
+            # Parts already handed to on_part may have started tools, so the request must not be retried.
+            e.partial_response = bool(parts)
+            raise
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+            usage_metadata=usage_metadata,
+        )
+
+    return await _request_with_retries(prompt_cache, messages, rate_limiter, estimated_tokens, request)
+
+
+def _check_function_call_result(function_call_part, function_call_result):
+    if not (
+        hasattr(function_call_result, "function_response")
+        and function_call_result.function_response is not None
+        and hasattr(function_call_result.function_response, "response")
+        and function_call_result.function_response.response is not None
+    ):
+        raise RuntimeError(
+            f"Response content from call_function {function_call_part.name} does not have appropriate format"
+        )
+
+
+def _log_text(part, verbose):
+    LOGGER.info(part.text.strip("\n"))
+    if verbose:
+        print(part.text)
+
+
+def _new_dispatcher(registry, workspace, shaper, verbose, max_workers):
+    return AsyncToolDispatcher(
+        lambda function_call_part: registry.call_function_async(
+            workspace, function_call_part, verbose=verbose, shaper=shaper
+        ),
+        max_workers=max_workers,
+    )
+
+
+async def _collect_tool_responses(dispatcher, verbose):
+    candidate_response_content = types.Content(role="tool", parts=[])
+    assert candidate_response_content.parts is not None
+    function_call_results = await dispatcher.results()
+    for function_call_part, function_call_result in zip(dispatcher.function_call_parts, function_call_results):
+        _check_function_call_result(function_call_part, function_call_result)
+        if verbose:
+            print(f"-> {function_call_result.function_response.response}")
+        candidate_response_content.parts.append(function_call_result)
+    return candidate_response_content
+
+
+async def _respond_to_candidate(candidate, dispatcher, verbose):
+    for part in candidate.content.parts:
+        if part.text:
+            _log_text(part, verbose)
+
+        if part.function_call:
+            dispatcher.submit(part.function_call)
+
+    return await _collect_tool_responses(dispatcher, verbose)
+
+
+async def _stream_turn(client, model, prompt_cache, history, rate_limiter, dispatcher, verbose):
+    def on_part(part):
+        if part.text and verbose and not part.thought:
+            print(part.text, end="", flush=True)
+        if part.function_call:
+            dispatcher.submit(part.function_call)
+
+    try:
+        response, waited = await stream_content_helper(
+            client, model, prompt_cache, history.messages, rate_limiter, history.token_estimate, on_part
+        )
+    except BaseException:
+        for task in dispatcher.tasks:
+            task.cancel()
+        raise
+    if verbose:
+        print()
+    return response, waited, dispatcher
+
+
+def _record_iteration(index, timing):
+    metrics.record(
+        "iteration",
+        timing.total_seconds,
+        iteration=index,
+        model_seconds=round(timing.model_seconds, 6),
+        tool_seconds=round(timing.tool_seconds, 6),
+        rate_limited_seconds=round(timing.rate_limited_seconds, 6),
+        overhead_seconds=round(timing.overhead_seconds, 6),
+    )
+
+
+async def run_session(
+    client,
+    model,
+    system_prompt,
+    user_prompt,
+    verbose=False,
+    max_workers=MAX_WORKERS,
+    rate_limiter=None,
+    token_budget=TOKEN_BUDGET,
+    context_cache=False,
+    stream=False,
+    session_id=None,
+    tracer=None,
+    max_iterations=MAX_ITERATIONS,
+    checkpoint=None,
+    prefetch=None,
+    prefetch_budget=PREFETCH_BYTE_BUDGET,
+    workspace=WORKING_DIRECTORY,
+    registry=REGISTRY,
+    shape_output=True,
+):
+    # With a checkpoint, the session continues from the checkpoint's last completed iteration (if it has one) and a
+    # new checkpoint is saved after every iteration, so a failed session can be resumed rather than run again. With
+    # prefetch (the CallPatterns learned from earlier sessions), likely tool inputs are read during each model call.
+    # Tools run in workspace, which is resolved once here; nothing about it is global, so concurrent sessions can each
+    # work in their own. With shape_output, tool output is kept within per-tool token budgets before it is sent.
+    if session_id is not None:
+        SESSION_ID.set(session_id)
+    if tracer is not None:
+        metrics.use_tracer(tracer)
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
+    workspace = Workspace.of(workspace)
+    shaper = ResponseShaper() if shape_output else None
+    new_dispatcher = partial(_new_dispatcher, registry, workspace, shaper, verbose, max_workers)
+    result = SessionResult(user_prompt=user_prompt)
+    started = time.perf_counter()
+    history = ConversationHistory(user_prompt, token_budget=token_budget)
+    first_iteration = 0
+    if checkpoint is not None and checkpoint.state is not None:
+        first_iteration = checkpoint.restore(history, result)
+        LOGGER.info(f"Resuming session {checkpoint.session_id} at iteration {first_iteration}")
+    prefetcher = None
+    if prefetch is not None:
+        prefetcher = Prefetcher(workspace, prefetch, byte_budget=prefetch_budget)
+    prompt_cache = PromptCache(
+        client,
+        model,
+        system_prompt,
+        [registry.declarations],
+        prefix_contents=history.messages[:1],
+        enabled=context_cache,
+    )
+    try:
+        for i in range(first_iteration, first_iteration + max_iterations):
+            print(f"Iteration {i}")
+            result.iterations = i + 1
+            timing = IterationTiming()
+            iteration_started = time.perf_counter()
+            dispatcher = None
+            if prefetcher is not None:
+                await prefetcher.start(history.messages)
+            if stream:
+                response, waited, dispatcher = await _stream_turn(
+                    client, model, prompt_cache, history, rate_limiter, new_dispatcher(), verbose
+                )
+            else:
+                response, waited = await generate_content_helper(
+                    client, model, prompt_cache, history.messages, rate_limiter, history.token_estimate
+                )
+            model_finished = time.perf_counter()
+            if prefetcher is not None:
+                prefetcher.stop()
+            timing.rate_limited_seconds = waited
+            timing.model_seconds = max(0.0, model_finished - iteration_started - waited)
+            result.iteration_timings.append(timing)
+            result.response = response
+            result.rate_limited_seconds += waited
+            if response.usage_metadata:
+                timing.prompt_tokens = response.usage_metadata.prompt_token_count or 0
+                timing.response_tokens = response.usage_metadata.candidates_token_count or 0
+                result.prompt_tokens += timing.prompt_tokens
+                result.cached_prompt_tokens += response.usage_metadata.cached_content_token_count or 0
+                result.response_tokens += timing.response_tokens
+            history.record_usage(response.usage_metadata)
+
+            if not response.function_calls or not response.candidates:
+                timing.total_seconds = time.perf_counter() - iteration_started
+                _record_iteration(i, timing)
+                result.final_text = response.text
+                LOGGER.info(f"Final Response: {response.text}")
+                print(f"Final Response: {response.text}")
+                break
+
+            if dispatcher is not None:
+                for part in response.candidates[0].content.parts:
+                    if part.text:
+                        LOGGER.info(part.text.strip("\n"))
+                history.append(response.candidates[0].content)
+                history.append(await _collect_tool_responses(dispatcher, verbose))
+            else:
+                for candidate in response.candidates:
+                    if not candidate.content:
+                        continue
+                    history.append(candidate.content)
+                    if not candidate.content.parts:
+                        continue
+
+                    history.append(await _respond_to_candidate(candidate, new_dispatcher(), verbose))
+            timing.tool_seconds = time.perf_counter() - model_finished
+            with metrics.span("compact_history"):
+                history.compact()
+                if shaper is not None:
+                    shaper.retain(history.messages)
+            if checkpoint is not None:
+                with metrics.span("checkpoint"):
+                    checkpoint.capture(i + 1, history, result)
+                    await asyncio.to_thread(checkpoint.save)
+            timing.total_seconds = time.perf_counter() - iteration_started
+            _record_iteration(i, timing)
+        else:
+            raise RecursionError("Failed to get expected response before max iterations.")
+    except BaseException as e:
+        if checkpoint is not None and checkpoint.state is not None:
+            checkpoint.error = f"{type(e).__name__}: {e}"
+            checkpoint.save()
+        raise
+    finally:
+        await prompt_cache.close()
+        if prefetcher is not None:
+            await prefetcher.close()
+            LOGGER.info(f"Prefetch: {prefetcher.stats()}")
+        if shaper is not None:
+            for name, usage in shaper.stats().items():
+                LOGGER.info(f"Tool output budget for {name}: {usage}")
+        result.wall_time = time.perf_counter() - started
+        LOGGER.info(f"Rate limiter added {result.rate_limited_seconds:.2f}s to the session")
+        LOGGER.info(
+            f"Prompt tokens: {result.prompt_tokens}, of which {result.cached_prompt_tokens} served from the context cache"
+        )
+        LOGGER.info(f"File cache: {FILE_CACHE.stats()}")
+        LOGGER.info(f"Tool result cache: {RESULT_CACHE.stats()}")
+        metrics.record(
+            "session",
+            result.wall_time,
+            iterations=result.iterations,
+            rate_limited_seconds=round(result.rate_limited_seconds, 6),
+        )
+
+    return result
@@ -0,0 +1,209 @@
+import hashlib
+import re
+import threading
+
+from dataclasses import asdict, dataclass
+
+from functions.result_cache import canonical_args
+
+from .config import CHARS_PER_TOKEN, DEFAULT_TOOL_OUTPUT_TOKENS, TOOL_OUTPUT_HEAD_FRACTION, TOOL_OUTPUT_TOKEN_BUDGETS
+
+
+# The key a function response carries in place of "result" when it stands for an identical earlier output.
+UNCHANGED_KEY = "unchanged"
+
+# Calls whose output only depends on their arguments and the files on disk, so an identical repeat can be answered
+# with a reference to the earlier output.
+REFERABLE_FUNCTIONS = {"get_file_content", "get_files_info", "search_code", "run_python_file"}
+# Tools whose output is program output, where tracebacks and repeated lines are collapsed. File contents are never
+# collapsed: the model edits files by quoting them.
+COLLAPSIBLE_FUNCTIONS = {"run_python_file"}
+# How to get at what was cut, for tools that can return part of their output.
+TRUNCATION_HINTS = {
+    "get_file_content": "read the omitted part with start_line/end_line or offset/length",
+    "get_files_info": "narrow the listing with pattern or page through it with offset/limit",
+    "search_code": "narrow the search with directory or pattern",
+}
+
+MAX_REPEAT_PERIOD = 8
+# "  File "path", line 12, in name", one frame of a Python traceback.
+TRACEBACK_FRAME = re.compile(r'^(?P<indent>\s*)File "[^"]*", line \d+, in ')
+
+
+def estimate_text_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip())
+
+
+def collapse_traceback_frames(lines):
+    # A frame shown earlier in the same output (by its "File ..., line ..., in ..." line) keeps that line, but not
+    # the source and caret lines printed under it again.
+    seen = set()
+    collapsed = []
+    skip_deeper_than = None
+    for line in lines:
+        if skip_deeper_than is not None:
+            if line.strip() and _indent(line) > skip_deeper_than and not TRACEBACK_FRAME.match(line):
+                continue
+            skip_deeper_than = None
+        collapsed.append(line)
+        match = TRACEBACK_FRAME.match(line)
+        if match is not None:
+            if line in seen:
+                skip_deeper_than = len(match.group("indent"))
+            seen.add(line)
+    return collapsed
+
+
+def collapse_repeated_lines(lines, max_period=MAX_REPEAT_PERIOD):
+    # Runs of a block of up to max_period lines repeated back to back become one copy of the block and a note, when
+    # that is shorter than the run.
+    collapsed = []
+    i = 0
+    while i < len(lines):
+        best = None
+        for period in range(1, max_period + 1):
+            block = lines[i : i + period]
+            if len(block) < period:
+                break
+            repeats = 1
+            while lines[i + repeats * period : i + (repeats + 1) * period] == block:
+                repeats += 1
+            note = f"[previous {period} line{'s' if period > 1 else ''} repeated {repeats - 1} more times]\n"
+            saved = (repeats - 1) * sum(len(line) for line in block) - len(note)
+            if repeats > 1 and saved > 0 and (best is None or saved > best[0]):
+                best = saved, period, repeats, note
+        if best is None:
+            collapsed.append(lines[i])
+            i += 1
+            continue
+        _, period, repeats, note = best
+        collapsed.extend(lines[i : i + period])
+        if not collapsed[-1].endswith("\n"):
+            collapsed[-1] += "\n"
+        collapsed.append(note)
+        i += period * repeats
+    return collapsed
+
+
+def truncate_middle(text, max_chars, hint=None, head_fraction=TOOL_OUTPUT_HEAD_FRACTION):
+    # Keeps whole lines from the start and the end of text, up to max_chars between them, and says what was left
+    # out. Returns the text and the number of characters dropped.
+    if len(text) <= max_chars:
+        return text, 0
+    lines = text.splitlines(keepends=True)
+    head_budget = int(max_chars * head_fraction)
+    tail_budget = max_chars - head_budget
+
+    head_count = head_size = 0
+    while head_count < len(lines) and head_size + len(lines[head_count]) <= head_budget:
+        head_size += len(lines[head_count])
+        head_count += 1
+    tail_count = tail_size = 0
+    while (
+        tail_count < len(lines) - head_count and tail_size + len(lines[len(lines) - 1 - tail_count]) <= tail_budget
+    ):
+        tail_size += len(lines[len(lines) - 1 - tail_count])
+        tail_count += 1
+
+    if head_count == 0 and tail_count == 0:
+        # A single line longer than the budget: cut it by characters.
+        head, tail = text[:head_budget], text[len(text) - tail_budget :]
+        omitted = f"{len(text) - len(head) - len(tail)} characters"
+    else:
+        head = "".join(lines[:head_count])
+        tail = "".join(lines[len(lines) - tail_count :])
+        omitted = f"{len(lines) - head_count - tail_count} lines ({len(text) - len(head) - len(tail)} characters)"
+    marker = f"[...{omitted} omitted to keep this output short{f'; {hint}' if hint else ''}]"
+    if head and not head.endswith("\n"):
+        marker = "\n" + marker
+    return f"{head}{marker}\n{tail}", len(text) - len(head) - len(tail)
+
+
+@dataclass
+class ToolOutputUsage:
+    calls: int = 0
+    budget_tokens: int = 0
+    output_tokens: int = 0
+    sent_tokens: int = 0
+    truncated: int = 0
+    collapsed: int = 0
+    references: int = 0
+
+
+# Shapes what one session's tools return before it goes into the conversation, where it is billed again as prompt
+# tokens on every later iteration. Program output has repeated traceback frames and lines collapsed; anything over its
+# tool's token budget keeps its start and end; and a repeat of a call whose identical output the model can still see
+# is answered with a short reference instead. retain() is given the history after each compaction, so that a repeat is
+# not answered with a reference to an output that has since been summarized away.
+class ResponseShaper:
+    def __init__(self, budgets=None, default_budget=DEFAULT_TOOL_OUTPUT_TOKENS):
+        self.budgets = TOOL_OUTPUT_TOKEN_BUDGETS if budgets is None else budgets
+        self.default_budget = default_budget
+        self.sent = {}
+        self.usage = {}
+        self._lock = threading.Lock()
+
+    def budget(self, name):
+        return self.budgets.get(name, self.default_budget)
+
+    def shape(self, function_call_part, output):
+        # The function response for output, a tool's string result, and the token counts before and after shaping.
+        name = function_call_part.name
+        budget = self.budget(name)
+        key = (name, canonical_args(function_call_part.args))
+        digest = hashlib.blake2b(output.encode("utf-8", errors="replace"), digest_size=16).digest()
+        output_tokens = estimate_text_tokens(output)
+
+        with self._lock:
+            usage = self.usage.setdefault(name, ToolOutputUsage(budget_tokens=budget))
+            usage.calls += 1
+            usage.output_tokens += output_tokens
+            previous = self.sent.get(key)
+
+        if name in REFERABLE_FUNCTIONS and previous is not None and previous[0] == digest:
+            response = {
+                UNCHANGED_KEY: f"Identical to the output of the earlier {name} call with the same arguments, which is "
+                "still in this conversation."
+            }
+            sent_tokens = estimate_text_tokens(response[UNCHANGED_KEY])
+            with self._lock:
+                usage.references += 1
+                usage.sent_tokens += sent_tokens
+            return response, output_tokens, sent_tokens
+
+        shaped = output
+        collapsed = False
+        if name in COLLAPSIBLE_FUNCTIONS:
+            lines = output.splitlines(keepends=True)
+            collapsed_lines = collapse_repeated_lines(collapse_traceback_frames(lines))
+            if collapsed_lines != lines:
+                shaped = "".join(collapsed_lines)
+                collapsed = True
+        shaped, dropped = truncate_middle(shaped, budget * CHARS_PER_TOKEN, TRUNCATION_HINTS.get(name))
+        sent_tokens = estimate_text_tokens(shaped)
+
+        with self._lock:
+            if name in REFERABLE_FUNCTIONS:
+                self.sent[key] = (digest, shaped)
+            usage.collapsed += collapsed
+            usage.truncated += dropped > 0
+            usage.sent_tokens += sent_tokens
+        return {"result": shaped}, output_tokens, sent_tokens
+
+    def retain(self, messages):
+        # Forget outputs that are no longer in messages, so later repeats send them in full again.
+        present = set()
+        for content in messages:
+            for part in content.parts or []:
+                if part.function_response and isinstance((part.function_response.response or {}).get("result"), str):
+                    present.add(part.function_response.response["result"])
+        with self._lock:
+            self.sent = {key: value for key, value in self.sent.items() if value[1] in present}
+
+    def stats(self):
+        with self._lock:
+            return {name: asdict(usage) for name, usage in sorted(self.usage.items())}
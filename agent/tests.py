@@ -0,0 +1,206 @@
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from google.genai import types
+
+from agent.benchmark import benchmark_replay
+from agent.cassette import RecordingClient, snapshot_directory
+from agent.checkpoint import SessionCheckpoint
+from agent.config import TOOL_OUTPUT_TOKEN_BUDGETS
+from agent.dispatch import AsyncToolDispatcher
+from agent.fake_client import FakeClient, text_response
+from agent.history import ConversationHistory
+from agent.metrics import Tracer
+from agent.rate_limit import RateLimiter
+from agent.runner import run_session
+from agent.shaping import UNCHANGED_KEY, ResponseShaper
+
+
+FILE_PATH = "pkg/calculator.py"
+FILE_CONTENT = "class Calculator:\n    pass\n"
+
+
+def _function_call(name, **args):
+    return types.FunctionCall(name=name, args=args)
+
+
+def _model_turn(function_call):
+    content = types.Content(role="model", parts=[types.Part(function_call=function_call)])
+    return types.GenerateContentResponse(candidates=[types.Candidate(content=content)])
+
+
+def _run_session(client, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(
+            run_session(
+                client,
+                "model",
+                "system",
+                "Read the calculator.",
+                rate_limiter=RateLimiter(requests_per_minute=10**6, tokens_per_minute=10**12),
+                **kwargs,
+            )
+        )
+
+
+def _responses(messages, name):
+    return [
+        part.function_response.response
+        for content in messages
+        for part in content.parts or []
+        if part.function_response and part.function_response.name == name
+    ]
+
+
+class TestOutputReferences(unittest.TestCase):
+    def setUp(self):
+        self.shaper = ResponseShaper()
+        self.history = ConversationHistory("Read the calculator.", token_budget=0, keep_recent_turns=2)
+
+    def append_call(self, function_call, output):
+        response, _, _ = self.shaper.shape(function_call, output)
+        self.history.append(types.Content(role="model", parts=[types.Part(function_call=function_call)]))
+        self.history.append(
+            types.Content(
+                role="tool", parts=[types.Part.from_function_response(name=function_call.name, response=response)]
+            )
+        )
+        return response
+
+    def test_repeat_is_sent_as_reference(self):
+        read = _function_call("get_file_content", file_path=FILE_PATH)
+        self.assertEqual(self.append_call(read, FILE_CONTENT), {"result": FILE_CONTENT})
+        self.assertIn(UNCHANGED_KEY, self.append_call(read, FILE_CONTENT))
+
+    def test_summarized_output_moves_into_first_kept_reference(self):
+        read = _function_call("get_file_content", file_path=FILE_PATH)
+        for _ in range(3):
+            self.append_call(read, FILE_CONTENT)
+        self.history.compact()
+        responses = _responses(self.history.messages, "get_file_content")
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(responses[0], {"result": FILE_CONTENT})
+        self.assertIn(UNCHANGED_KEY, responses[1])
+
+    def test_referenced_output_is_not_collapsed_by_rewrite(self):
+        self.history.token_budget = 10**6
+        read = _function_call("get_file_content", file_path=FILE_PATH)
+        self.append_call(read, FILE_CONTENT)
+        self.append_call(_function_call("write_file", file_path=FILE_PATH, content=FILE_CONTENT), "Successfully wrote")
+        self.append_call(read, FILE_CONTENT)
+        self.history.compact()
+        responses = _responses(self.history.messages, "get_file_content")
+        self.assertEqual(responses[0], {"result": FILE_CONTENT})
+        self.assertIn(UNCHANGED_KEY, responses[1])
+
+    def test_session_keeps_a_copy_of_referenced_output(self):
+        script = []
+        for _ in range(6):
+            script.append(_model_turn(_function_call("get_file_content", file_path=FILE_PATH)))
+            script.append(_model_turn(_function_call("get_files_info", directory="pkg")))
+        script.append(text_response("Done."))
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = SessionCheckpoint("references", path=os.path.join(directory, "session.json.gz"))
+            _run_session(FakeClient(script), token_budget=3000, checkpoint=checkpoint)
+        history = ConversationHistory("")
+        history.restore(checkpoint.state["history"])
+        responses = _responses(history.messages, "get_file_content")
+        self.assertTrue(any(UNCHANGED_KEY in response for response in responses))
+        self.assertIn("result", responses[0])
+
+
+class TestPromptCache(unittest.TestCase):
+    def test_first_request_sends_the_prompt(self):
+        client = FakeClient([_model_turn(_function_call("get_files_info", directory="pkg")), text_response("Done.")])
+        result = _run_session(client, context_cache=True)
+        self.assertEqual(result.final_text, "Done.")
+        self.assertEqual(client.requests, 2)
+        self.assertGreater(result.cached_prompt_tokens, 0)
+
+    def test_fake_client_rejects_empty_contents(self):
+        with self.assertRaisesRegex(ValueError, "contents are required"):
+            asyncio.run(FakeClient().aio.models.generate_content(model="model", contents=[]))
+
+
+class TestReplay(unittest.TestCase):
+    def test_session_that_writes_replays_without_divergences(self):
+        script = [
+            _model_turn(_function_call("get_files_info", directory=".")),
+            _model_turn(_function_call("write_file", file_path="main.py", content="print('written')\n")),
+            _model_turn(_function_call("run_python_file", file_path="main.py")),
+            text_response("Done."),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "main.py"), "w") as f:
+                f.write("print('original')\n")
+            client = RecordingClient(FakeClient(script))
+            client.cassette.metadata = dict(
+                model="model", system_prompt="system", user_prompt="Read the calculator.", workspace=directory
+            )
+            client.cassette.snapshot = snapshot_directory(directory)
+            _run_session(client, workspace=directory, shape_output=False)
+            report = benchmark_replay(client.cassette, repeats=1)
+        self.assertEqual(report["divergences"], 0)
+        self.assertEqual(len(report["iterations"]), 4)
+
+
+class TestDispatch(unittest.TestCase):
+    def run_turn(self, function_calls):
+        finished = []
+
+        async def call(function_call_part):
+            if function_call_part.name == "write_file":
+                await asyncio.sleep(0.01)
+            finished.append(function_call_part.name)
+
+        async def turn():
+            dispatcher = AsyncToolDispatcher(call)
+            for function_call in function_calls:
+                dispatcher.submit(function_call)
+            await dispatcher.results()
+
+        asyncio.run(turn())
+        return finished
+
+    def test_listing_waits_for_writes_under_its_directory(self):
+        write = _function_call("write_file", file_path="pkg/new.py", content="")
+        listings = [
+            _function_call("get_files_info", directory="pkg"),
+            _function_call("get_files_info", directory="."),
+            _function_call("get_files_info"),
+        ]
+        for listing in listings:
+            self.assertEqual(self.run_turn([write, listing]), ["write_file", "get_files_info"])
+
+    def test_listing_of_another_directory_does_not_wait(self):
+        write = _function_call("write_file", file_path="pkg/new.py", content="")
+        listing = _function_call("get_files_info", directory="docs")
+        self.assertEqual(self.run_turn([write, listing]), ["get_files_info", "write_file"])
+
+
+class TestMetrics(unittest.TestCase):
+    def test_tool_output_tokens_are_counted_once(self):
+        script = [
+            _model_turn(_function_call("get_files_info", directory="pkg")),
+            _model_turn(_function_call("get_files_info", directory=".")),
+            text_response("Done."),
+        ]
+        tracer = Tracer()
+        _run_session(FakeClient(script), tracer=tracer)
+        sent = sum(span.attributes.get("sent_tokens", 0) for span in tracer.spans)
+        lines = tracer.prometheus_text().splitlines()
+        counted = [line for line in lines if line.startswith("agent_tool_output_tokens_total{") and "sent" in line]
+        self.assertEqual(sum(int(line.split()[-1]) for line in counted), sent)
+        self.assertFalse(any('stage="budget"' in line for line in lines))
+        self.assertIn("# TYPE agent_tool_output_budget_tokens gauge", lines)
+        budgets = [line for line in lines if line.startswith("agent_tool_output_budget_tokens{")]
+        self.assertEqual(len(budgets), 1)
+        self.assertTrue(budgets[0].endswith(f" {TOOL_OUTPUT_TOKEN_BUDGETS['get_files_info']}"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+
+from collections import namedtuple
+
+from google.genai import types
+
+from functions.apply_patch import apply_patch, apply_patch_async
+from functions.edit_file import edit_file, edit_file_async
+from functions.get_file_content import get_file_content, get_file_content_async
+from functions.get_files_info import get_files_info, get_files_info_async
+from functions.result_cache import RESULT_CACHE
+from functions.run_python_file import run_python_file, run_python_file_async
+from functions.schemas import (
+    schema_apply_patch,
+    schema_edit_file,
+    schema_get_file_content,
+    schema_get_files_info,
+    schema_run_python_file,
+    schema_search_code,
+    schema_write_file,
+)
+from functions.search_code import search_code, search_code_async
+from functions.workspace import Workspace
+from functions.write_file import write_file, write_file_async
+
+from . import metrics
+
+
+LOGGER = logging.getLogger(__name__)
+
+RegisteredTool = namedtuple("RegisteredTool", ["name", "function", "async_function", "schema"])
+
+
+def _log_function_call(function_call_part, verbose):
+    LOGGER.info(f" - Calling function: {function_call_part.name}({function_call_part.args})")
+    if verbose:
+        print(f"Calling function: {function_call_part.name}({function_call_part.args})")
+    else:
+        print(f" - Calling function: {function_call_part.name}")
+
+
+def _unknown_function_response(function_call_part):
+    return types.Part.from_function_response(
+        name=function_call_part.name, response={"error": f"Unknown function: {function_call_part.name}"}
+    )
+
+
+def _function_response(function_call_part, tool_span, shaper, response=None, error=None):
+    if error is not None or (isinstance(response, str) and response.startswith("Error:")):
+        tool_span.set(status="error")
+    if error is not None:
+        function_response = {"error": str(error)}
+    elif shaper is not None and isinstance(response, str):
+        function_response, output_tokens, sent_tokens = shaper.shape(function_call_part, response)
+        tool_span.set(
+            output_tokens=output_tokens,
+            sent_tokens=sent_tokens,
+            budget_tokens=shaper.budget(function_call_part.name),
+        )
+    else:
+        function_response = {"result": response}
+    if metrics.tracing():
+        tool_span.set(
+            request_bytes=len(json.dumps(function_call_part.args or {}, default=str)),
+            response_bytes=len(json.dumps(function_response, default=str)),
+        )
+    return types.Part.from_function_response(name=function_call_part.name, response=function_response)
+
+
+# The tools the model may call, by name. A tool is a function taking the working directory (a path or a Workspace)
+# followed by the model's arguments, its FunctionDeclaration and, optionally, a native asyncio variant; without one
+# the function runs on a worker thread. The types.Tool sent with every request is built once, when first needed. The
+# registry holds no per-session state: each call is given the Workspace it runs in, and the session's ResponseShaper
+# if its output is to be shaped, so sessions over different workspaces can share one registry.
+class ToolRegistry:
+    def __init__(self):
+        self.tools = {}
+        self._declarations = None
+
+    def register(self, schema, function, async_function=None):
+        if schema.name in self.tools:
+            raise ValueError(f"A tool named {schema.name} is already registered")
+        if async_function is None:
+
+            async def async_function(working_directory, **kwargs):
+                return await asyncio.to_thread(function, working_directory, **kwargs)
+
+        self.tools[schema.name] = RegisteredTool(schema.name, function, async_function, schema)
+        self._declarations = None
+
+    @property
+    def declarations(self):
+        if self._declarations is None:
+            self._declarations = types.Tool(function_declarations=[tool.schema for tool in self.tools.values()])
+        return self._declarations
+
+    async def call_function_async(self, workspace, function_call_part, verbose=False, shaper=None) -> types.Part:
+        _log_function_call(function_call_part, verbose)
+        tool = self.tools.get(function_call_part.name)
+        if tool is None:
+            return _unknown_function_response(function_call_part)
+
+        workspace = Workspace.of(workspace)
+        with metrics.span("tool_call", tool=function_call_part.name) as tool_span:
+            try:
+                response, cached = await RESULT_CACHE.call_async(
+                    workspace.root,
+                    function_call_part.name,
+                    function_call_part.args,
+                    lambda: tool.async_function(workspace, **function_call_part.args),
+                )
+                tool_span.set(cached=cached)
+            except Exception as e:
+                return _function_response(function_call_part, tool_span, shaper, error=e)
+            return _function_response(function_call_part, tool_span, shaper, response)
+
+
+# The built-in tools. Registering a tool here is all it takes to offer it to the model.
+REGISTRY = ToolRegistry()
+REGISTRY.register(schema_apply_patch, apply_patch, apply_patch_async)
+REGISTRY.register(schema_edit_file, edit_file, edit_file_async)
+REGISTRY.register(schema_get_file_content, get_file_content, get_file_content_async)
+REGISTRY.register(schema_get_files_info, get_files_info, get_files_info_async)
+REGISTRY.register(schema_run_python_file, run_python_file, run_python_file_async)
+REGISTRY.register(schema_search_code, search_code, search_code_async)
+REGISTRY.register(schema_write_file, write_file, write_file_async)
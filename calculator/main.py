@@ -1,14 +1,63 @@
+import json
 import sys
 from pkg.calculator import Calculator
-from pkg.render import format_json_output
+from pkg.render import format_json_output, format_ndjson_line
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+
+def print_usage():
+    print("Calculator App")
+    print('Usage: python main.py "<expression>"')
+    print('Example: python main.py "3 + 5"')
+    print("       python main.py --stdin           Evaluate one expression per input line, one JSON result per line")
+    print(f"       python main.py --serve [PORT]    Serve /evaluate and /evaluate/batch on {DEFAULT_HOST}")
+
+
+def evaluate_stream(calculator, lines, output):
+    # A line is an expression, or a JSON object {"expression": ..., "variables": {...}}. Each result is flushed as
+    # soon as it is written, so a caller can feed expressions and read results through the same pipe.
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        expression, variables = line, None
+        try:
+            if line.startswith("{"):
+                request = json.loads(line)
+                expression, variables = request["expression"], request.get("variables")
+                if not isinstance(expression, str):
+                    raise TypeError('"expression" must be a string')
+            result = calculator.evaluate(expression, variables)
+            if result is None:
+                output.write(format_ndjson_line(expression, error="Expression is empty or contains only whitespace."))
+            else:
+                output.write(format_ndjson_line(expression, result))
+        except (ValueError, ArithmeticError, KeyError, TypeError) as e:
+            output.write(format_ndjson_line(expression, error=str(e)))
+        output.write("\n")
+        output.flush()
+
+
+def serve(port):
+    from pkg.server import create_app
+
+    create_app().run(host=DEFAULT_HOST, port=port)
 
 
 def main():
     calculator = Calculator()
     if len(sys.argv) <= 1:
-        print("Calculator App")
-        print('Usage: python main.py "<expression>"')
-        print('Example: python main.py "3 + 5"')
+        print_usage()
+        return
+
+    if sys.argv[1] == "--stdin":
+        evaluate_stream(calculator, sys.stdin, sys.stdout)
+        return
+    if sys.argv[1] == "--serve":
+        serve(int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT)
         return
 
     expression = " ".join(sys.argv[1:])
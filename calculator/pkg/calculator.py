@@ -1,59 +1,278 @@
+import math
+import operator
+import re
+
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+from itertools import repeat
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+COMPILED_CACHE_SIZE = 1024
+
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+        | (?P<name>[A-Za-z_]\w*)
+        | (?P<operator>[-+*/])
+        | (?P<paren>[()])
+        | (?P<other>[^\s()+\-*/\w.]+|.)
+    )""",
+    re.VERBOSE,
+)
+
+PUSH, UNARY, BINARY, LOAD = 0, 1, 2, 3
+NEGATE = "neg"
+
+# One entry of Calculator.evaluate_many: value is None when error is set.
+EvaluationResult = namedtuple("EvaluationResult", ["expression", "value", "error"])
+# Calculator.evaluate_vectorized output: values[i] is NaN wherever division_by_zero[i] is true.
+VectorResult = namedtuple("VectorResult", ["values", "division_by_zero"])
+
+
+def tokenize(expression):
+    # Yields (kind, text) pairs; spaces between tokens are optional.
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "other":
+            raise ValueError(f"invalid token: {text}")
+        yield kind, text
+        position = match.end()
+
+
+def _column_length(columns):
+    lengths = {len(column) for column in columns.values() if not isinstance(column, (int, float))}
+    if len(lengths) > 1:
+        raise ValueError(f"columns have different lengths: {sorted(lengths)}")
+    return lengths.pop() if lengths else 1
+
+
+def _iterate(operand, length):
+    return repeat(operand, length) if isinstance(operand, float) else operand
+
+
+class Program:
+    # An expression compiled to postfix order. Each instruction is (PUSH, value), (LOAD, variable name),
+    # (UNARY, function) or (BINARY, function), so running it is a single pass over a list with no parsing or
+    # dictionary lookups beyond the variables.
+    __slots__ = ("expression", "code", "names")
+
+    def __init__(self, expression, code):
+        self.expression = expression
+        self.code = tuple(code)
+        self.names = tuple(dict.fromkeys(value for kind, value in self.code if kind == LOAD))
+
+    def run(self, variables=None):
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for kind, value in self.code:
+            if kind == PUSH:
+                push(value)
+            elif kind == BINARY:
+                b = pop()
+                stack[-1] = value(stack[-1], b)
+            elif kind == UNARY:
+                stack[-1] = value(stack[-1])
+            else:
+                if not variables or value not in variables:
+                    raise ValueError(f"unknown variable: {value}")
+                push(float(variables[value]))
+        return stack[0]
+
+    def _check_columns(self, columns):
+        for name in self.names:
+            if name not in columns:
+                raise ValueError(f"unknown variable: {name}")
+
+    def run_numpy(self, columns):
+        # Every instruction works on whole columns at once. Division by zero yields NaN in that row, and the row is
+        # flagged instead of the whole evaluation failing.
+        self._check_columns(columns)
+        length = _column_length(columns)
+        arrays = {name: np.asarray(columns[name], dtype=np.float64) for name in self.names}
+        division_by_zero = np.zeros(length, dtype=bool)
+        stack = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for kind, value in self.code:
+                if kind == PUSH:
+                    # As a NumPy scalar, so that dividing two constants by zero is flagged like any other row.
+                    stack.append(np.float64(value))
+                elif kind == LOAD:
+                    stack.append(arrays[value])
+                elif kind == UNARY:
+                    stack[-1] = value(stack[-1])
+                else:
+                    b = stack.pop()
+                    if value is operator.truediv:
+                        division_by_zero |= np.broadcast_to(np.asarray(b) == 0, (length,))
+                    stack[-1] = value(stack[-1], b)
+        values = np.broadcast_to(np.asarray(stack[0], dtype=np.float64), (length,)).copy()
+        values[division_by_zero] = np.nan
+        return VectorResult(values, division_by_zero)
+
+    def run_columns(self, columns):
+        # The same column-at-a-time evaluation in plain Python, for array('d') buffers or lists when NumPy is not
+        # installed: one list comprehension per instruction rather than one interpreter pass per row.
+        self._check_columns(columns)
+        length = _column_length(columns)
+        division_by_zero = [False] * length
+        stack = []
+        for kind, value in self.code:
+            if kind == PUSH:
+                stack.append(value)
+            elif kind == LOAD:
+                column = columns[value]
+                stack.append(float(column) if isinstance(column, (int, float)) else [float(x) for x in column])
+            elif kind == UNARY:
+                a = stack[-1]
+                stack[-1] = value(a) if isinstance(a, float) else [value(x) for x in a]
+            else:
+                b = stack.pop()
+                a = stack[-1]
+                if isinstance(a, float) and isinstance(b, float):
+                    if value is operator.truediv and b == 0:
+                        division_by_zero = [True] * length
+                        stack[-1] = math.nan
+                    else:
+                        stack[-1] = value(a, b)
+                elif value is operator.truediv:
+                    result = []
+                    for i, (x, y) in enumerate(zip(_iterate(a, length), _iterate(b, length))):
+                        if y == 0:
+                            division_by_zero[i] = True
+                            result.append(math.nan)
+                        else:
+                            result.append(x / y)
+                    stack[-1] = result
+                else:
+                    stack[-1] = [value(x, y) for x, y in zip(_iterate(a, length), _iterate(b, length))]
+        values = array("d", _iterate(stack[0], length))
+        for i, failed in enumerate(division_by_zero):
+            if failed:
+                values[i] = math.nan
+        return VectorResult(values, division_by_zero)
+
+
 class Calculator:
-    def __init__(self):
-        self.operators = {
-            "+": lambda a, b: a + b,
-            "-": lambda a, b: a - b,
-            "*": lambda a, b: a * b,
-            "/": lambda a, b: a / b,
-        }
-        self.precedence = {
-            "+": 1,
-            "-": 1,
-            "*": 2,
-            "/": 2,
-        }
-
-    def evaluate(self, expression):
+    operators = {
+        "+": operator.add,
+        "-": operator.sub,
+        "*": operator.mul,
+        "/": operator.truediv,
+    }
+    unary_operators = {
+        NEGATE: operator.neg,
+    }
+    precedence = {
+        "+": 1,
+        "-": 1,
+        "*": 2,
+        "/": 2,
+        NEGATE: 3,
+    }
+
+    def evaluate(self, expression, variables=None):
         if not expression or expression.isspace():
             return None
-        tokens = expression.strip().split()
-        return self._evaluate_infix(tokens)
+        return compile_expression(expression.strip()).run(variables)
 
-    def _evaluate_infix(self, tokens):
-        values = []
-        operators = []
+    def evaluate_many(self, expressions, variables=None):
+        # Bulk scalar evaluation: an error in one expression is reported in its result and the rest carry on.
+        results = []
+        for expression in expressions:
+            try:
+                results.append(EvaluationResult(expression, self.evaluate(expression, variables), None))
+            except (ValueError, ArithmeticError, TypeError) as e:
+                results.append(EvaluationResult(expression, None, str(e)))
+        return results
 
-        for token in tokens:
-            if token in self.operators:
-                while (
-                    operators
-                    and operators[-1] in self.operators
-                    and self.precedence[operators[-1]] >= self.precedence[token]
-                ):
-                    self._apply_operator(operators, values)
-                operators.append(token)
-            else:
-                try:
-                    values.append(float(token))
-                except ValueError:
-                    raise ValueError(f"invalid token: {token}")
+    def evaluate_vectorized(self, expression, columns=None, use_numpy=None, **named_columns):
+        # Compiles the expression once and evaluates it over columns of values (NumPy arrays, array('d') buffers
+        # or any sequences of numbers, keyed by variable name), all rows in one pass. NumPy is used when it is
+        # installed unless use_numpy is False; values then come back as an ndarray, otherwise as array('d').
+        if not expression or expression.isspace():
+            raise ValueError("expression is empty")
+        columns = {**(columns or {}), **named_columns}
+        program = compile_expression(expression.strip())
+        if use_numpy is None:
+            use_numpy = np is not None
+        if use_numpy:
+            if np is None:
+                raise RuntimeError("NumPy is not installed")
+            return program.run_numpy(columns)
+        return program.run_columns(columns)
 
-        while operators:
-            self._apply_operator(operators, values)
+    @classmethod
+    def compile(cls, expression):
+        # Shunting-yard over the token stream. expect_operand tells a unary minus from a binary one and catches
+        # operators with a missing operand.
+        code = []
+        pending = []
+        expect_operand = True
 
-        if len(values) != 1:
-            raise ValueError("invalid expression")
+        def emit(symbol):
+            if symbol in cls.unary_operators:
+                code.append((UNARY, cls.unary_operators[symbol]))
+            else:
+                code.append((BINARY, cls.operators[symbol]))
 
-        return values[0]
+        for kind, text in tokenize(expression):
+            if kind == "number" or kind == "name":
+                if not expect_operand:
+                    raise ValueError("invalid expression")
+                code.append((PUSH, float(text)) if kind == "number" else (LOAD, text))
+                expect_operand = False
+            elif kind == "operator":
+                if expect_operand:
+                    if text != "-":
+                        raise ValueError(f"not enough operands for operator {text}")
+                    # Unary operators are right-associative, so nothing pending is applied before them.
+                    pending.append(NEGATE)
+                    continue
+                while (
+                    pending
+                    and pending[-1] != "("
+                    and cls.precedence[pending[-1]] >= cls.precedence[text]
+                ):
+                    emit(pending.pop())
+                pending.append(text)
+                expect_operand = True
+            elif text == "(":
+                if not expect_operand:
+                    raise ValueError("invalid expression")
+                pending.append(text)
+            else:
+                if expect_operand:
+                    raise ValueError("invalid expression")
+                while pending and pending[-1] != "(":
+                    emit(pending.pop())
+                if not pending:
+                    raise ValueError("mismatched parentheses")
+                pending.pop()
 
-    def _apply_operator(self, operators, values):
-        if not operators:
-            return
+        if expect_operand:
+            symbol = next((symbol for symbol in reversed(pending) if symbol != "("), None)
+            if symbol is None:
+                raise ValueError("invalid expression")
+            raise ValueError(f"not enough operands for operator {'-' if symbol == NEGATE else symbol}")
+        while pending:
+            symbol = pending.pop()
+            if symbol == "(":
+                raise ValueError("mismatched parentheses")
+            emit(symbol)
+        return Program(expression, code)
 
-        operator = operators.pop()
-        if len(values) < 2:
-            raise ValueError(f"not enough operands for operator {operator}")
 
-        b = values.pop()
-        a = values.pop()
-        values.append(self.operators[operator](a, b))
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def compile_expression(expression):
+    return Calculator.compile(expression)
@@ -1,14 +1,24 @@
 import json
 
 
-def format_json_output(expression: str, result: float, indent: int = 2) -> str:
+def result_value(result):
     if isinstance(result, float) and result.is_integer():
-        result_to_dump = int(result)
-    else:
-        result_to_dump = result
+        return int(result)
+    return result
 
+
+def format_json_output(expression: str, result: float, indent: int | None = 2) -> str:
     output_data = {
         "expression": expression,
-        "result": result_to_dump,
+        "result": result_value(result),
     }
+    if indent is None:
+        return json.dumps(output_data, separators=(",", ":"))
     return json.dumps(output_data, indent=indent)
+
+
+def format_ndjson_line(expression: str, result: float | None = None, error: str | None = None) -> str:
+    # One compact JSON object per line, for streaming many results.
+    if error is not None:
+        return json.dumps({"expression": expression, "error": error}, separators=(",", ":"))
+    return format_json_output(expression, result, indent=None)
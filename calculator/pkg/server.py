@@ -0,0 +1,80 @@
+import math
+
+from flask import Flask, jsonify, request
+
+from pkg.calculator import Calculator
+from pkg.render import result_value
+
+
+MAX_BATCH_SIZE = 100_000
+
+
+def _json_value(value):
+    # JSON has no NaN; rows that divided by zero come back as null and are listed in "division_by_zero".
+    if value is None or math.isnan(value):
+        return None
+    return result_value(float(value))
+
+
+def _error(message, status=400):
+    return jsonify({"error": message}), status
+
+
+def create_app(calculator=None):
+    calculator = calculator or Calculator()
+    app = Flask(__name__)
+
+    @app.get("/evaluate")
+    def evaluate():
+        expression = request.args.get("expression", "")
+        try:
+            result = calculator.evaluate(expression)
+        except (ValueError, ArithmeticError) as e:
+            return jsonify({"expression": expression, "error": str(e)}), 400
+        if result is None:
+            return _error("Expression is empty or contains only whitespace.")
+        return jsonify({"expression": expression, "result": result_value(result)})
+
+    # Either {"expressions": [...], "variables": {...}} to evaluate many expressions, or
+    # {"expression": "...", "columns": {"x": [...], ...}} to evaluate one expression over columns of inputs.
+    @app.post("/evaluate/batch")
+    def evaluate_batch():
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return _error("Expected a JSON object")
+
+        if "expressions" in body:
+            expressions = body["expressions"]
+            if not isinstance(expressions, list) or not all(isinstance(e, str) for e in expressions):
+                return _error('"expressions" must be a list of strings')
+            if len(expressions) > MAX_BATCH_SIZE:
+                return _error(f"At most {MAX_BATCH_SIZE} expressions per request")
+            results = []
+            for result in calculator.evaluate_many(expressions, body.get("variables")):
+                if result.error is not None:
+                    results.append({"expression": result.expression, "error": result.error})
+                else:
+                    results.append({"expression": result.expression, "result": _json_value(result.value)})
+            return jsonify({"results": results})
+
+        if "expression" in body:
+            if not isinstance(body["expression"], str):
+                return _error('"expression" must be a string')
+            columns = body.get("columns") or {}
+            if not isinstance(columns, dict):
+                return _error('"columns" must be an object of variable name to list of numbers')
+            try:
+                result = calculator.evaluate_vectorized(body["expression"], columns)
+            except (ValueError, ArithmeticError, TypeError) as e:
+                return jsonify({"expression": body["expression"], "error": str(e)}), 400
+            return jsonify(
+                {
+                    "expression": body["expression"],
+                    "results": [_json_value(value) for value in result.values],
+                    "division_by_zero": [i for i, failed in enumerate(result.division_by_zero) if failed],
+                }
+            )
+
+        return _error('Expected "expressions" or "expression" in the request body')
+
+    return app
@@ -1,5 +1,15 @@
+import io
+import math
 import unittest
-from pkg.calculator import Calculator
+from array import array
+from main import evaluate_stream
+from pkg.calculator import Calculator, compile_expression, np, tokenize
+from pkg.render import format_json_output, format_ndjson_line
+
+try:
+    from pkg.server import create_app
+except ImportError:
+    create_app = None
 
 
 class TestCalculator(unittest.TestCase):
@@ -42,6 +52,168 @@ class TestCalculator(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.calculator.evaluate("+ 3")
 
+    def test_without_spaces(self):
+        result = self.calculator.evaluate("3+5*2")
+        self.assertEqual(result, 13)
+
+    def test_parentheses(self):
+        result = self.calculator.evaluate("3+5*(2-1)")
+        self.assertEqual(result, 8)
+
+    def test_nested_parentheses(self):
+        result = self.calculator.evaluate("((2 + 3) * (4 - 1)) / 5")
+        self.assertEqual(result, 3)
+
+    def test_unary_minus(self):
+        self.assertEqual(self.calculator.evaluate("-3 + 5"), 2)
+        self.assertEqual(self.calculator.evaluate("2 * -3"), -6)
+        self.assertEqual(self.calculator.evaluate("-(2 + 3) * 2"), -10)
+
+    def test_decimal_numbers(self):
+        result = self.calculator.evaluate("1.5 * .5 + 1e1")
+        self.assertEqual(result, 10.75)
+
+    def test_mismatched_parentheses(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("(3 + 5")
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("3 + 5)")
+
+    def test_missing_operator(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("3 5")
+
+    def test_trailing_operator(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("3 +")
+
+    def test_division_by_zero(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.evaluate("1 / (2 - 2)")
+
+    def test_tokenize(self):
+        tokens = [text for _, text in tokenize("3+5*(2-1)")]
+        self.assertEqual(tokens, ["3", "+", "5", "*", "(", "2", "-", "1", ")"])
+
+    def test_compiled_expression_is_reused(self):
+        self.calculator.evaluate("7 * 6 - 2")
+        hits = compile_expression.cache_info().hits
+        result = Calculator().evaluate("7 * 6 - 2")
+        self.assertEqual(result, 40)
+        self.assertEqual(compile_expression.cache_info().hits, hits + 1)
+
+    def test_variables(self):
+        result = self.calculator.evaluate("price * (1 + rate)", {"price": 100, "rate": 0.5})
+        self.assertEqual(result, 150)
+
+    def test_unknown_variable(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("x + 1")
+
+    def test_evaluate_many(self):
+        results = self.calculator.evaluate_many(["1 + 1", "2 / 0", "$ 3", "a * 2"], {"a": 5})
+        self.assertEqual([result.value for result in results], [2, None, None, 10])
+        self.assertEqual(results[1].error, "float division by zero")
+        self.assertEqual(results[2].error, "invalid token: $")
+
+    def test_evaluate_vectorized_array(self):
+        result = self.calculator.evaluate_vectorized(
+            "x / y - 1", x=array("d", [1, 4, 3]), y=array("d", [2, 0, 1]), use_numpy=False
+        )
+        self.assertEqual(result.values[0], -0.5)
+        self.assertTrue(math.isnan(result.values[1]))
+        self.assertEqual(result.values[2], 2)
+        self.assertEqual(list(result.division_by_zero), [False, True, False])
+
+    def test_evaluate_vectorized_mismatched_columns(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate_vectorized("x + y", x=[1, 2], y=[1, 2, 3], use_numpy=False)
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_evaluate_vectorized_numpy(self):
+        result = self.calculator.evaluate_vectorized("-x / y", {"x": np.array([1.0, 2.0]), "y": np.array([4.0, 0.0])})
+        self.assertEqual(result.values[0], -0.25)
+        self.assertTrue(np.isnan(result.values[1]))
+        self.assertEqual(result.division_by_zero.tolist(), [False, True])
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_evaluate_vectorized_numpy_constant_division_by_zero(self):
+        result = self.calculator.evaluate_vectorized("x + 1/0", x=[1, 2])
+        self.assertTrue(np.isnan(result.values).all())
+        self.assertEqual(result.division_by_zero.tolist(), [True, True])
+
+
+class TestOutput(unittest.TestCase):
+    def test_format_json_output_compact(self):
+        self.assertEqual(format_json_output("3 + 5", 8.0, indent=None), '{"expression":"3 + 5","result":8}')
+
+    def test_format_ndjson_line_error(self):
+        line = format_ndjson_line("1 / 0", error="float division by zero")
+        self.assertEqual(line, '{"expression":"1 / 0","error":"float division by zero"}')
+
+    def test_evaluate_stream(self):
+        output = io.StringIO()
+        lines = ["3+5\n", "\n", "2 / 0\n", '{"expression": "x * 2", "variables": {"x": 4}}\n']
+        evaluate_stream(Calculator(), lines, output)
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            [
+                '{"expression":"3+5","result":8}',
+                '{"expression":"2 / 0","error":"float division by zero"}',
+                '{"expression":"x * 2","result":8}',
+            ],
+        )
+
+    def test_evaluate_stream_non_string_expression(self):
+        output = io.StringIO()
+        evaluate_stream(Calculator(), ['{"expression": 5}\n', "1 + 1\n"], output)
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            ['{"expression":5,"error":"\\"expression\\" must be a string"}', '{"expression":"1 + 1","result":2}'],
+        )
+
+
+@unittest.skipIf(create_app is None, "Flask is not installed")
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.client = create_app().test_client()
+
+    def test_evaluate(self):
+        response = self.client.get("/evaluate", query_string={"expression": "3+5*(2-1)"})
+        self.assertEqual(response.get_json(), {"expression": "3+5*(2-1)", "result": 8})
+
+    def test_evaluate_error(self):
+        response = self.client.get("/evaluate", query_string={"expression": "$ 3 5"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_evaluate_batch_expressions(self):
+        response = self.client.post("/evaluate/batch", json={"expressions": ["1 + 1", "2 / 0"]})
+        results = response.get_json()["results"]
+        self.assertEqual(results[0]["result"], 2)
+        self.assertEqual(results[1]["error"], "float division by zero")
+
+    def test_evaluate_batch_columns(self):
+        response = self.client.post(
+            "/evaluate/batch", json={"expression": "x / y", "columns": {"x": [1, 2, 3], "y": [1, 0, 2]}}
+        )
+        self.assertEqual(response.get_json()["results"], [1, None, 1.5])
+        self.assertEqual(response.get_json()["division_by_zero"], [1])
+
+    def test_evaluate_batch_columns_constant_division_by_zero(self):
+        response = self.client.post("/evaluate/batch", json={"expression": "x + 1/0", "columns": {"x": [1, 2]}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["division_by_zero"], [0, 1])
+
+    def test_evaluate_batch_null_variable(self):
+        response = self.client.post("/evaluate/batch", json={"expressions": ["x", "1 + 1"], "variables": {"x": None}})
+        results = response.get_json()["results"]
+        self.assertIn("error", results[0])
+        self.assertEqual(results[1]["result"], 2)
+
+    def test_evaluate_batch_non_string_expression(self):
+        response = self.client.post("/evaluate/batch", json={"expression": 5})
+        self.assertEqual(response.status_code, 400)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import re
+
+from .workspace import Workspace
+from .write_file import atomic_write, notify_written
+
+
+DEV_NULL = "/dev/null"
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(Exception):
+    pass
+
+
+class Hunk:
+    def __init__(self, old_start):
+        self.old_start = old_start
+        # (kind, text) with kind one of " ", "-", "+"; text has no line ending.
+        self.lines = []
+        self.new_ends_without_newline = False
+
+    def old_lines(self):
+        return [text for kind, text in self.lines if kind != "+"]
+
+    def new_lines(self):
+        return [text for kind, text in self.lines if kind != "-"]
+
+
+class FilePatch:
+    def __init__(self, old_path, new_path):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks = []
+
+
+def _strip_path(header):
+    path = header[4:].split("\t")[0].strip()
+    if path == DEV_NULL:
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+def _read_hunk(lines, i, hunk, old_count, new_count):
+    # Reads exactly the old_count old and new_count new lines the hunk header announces, starting at lines[i], so a
+    # removed "-- comment" or an added "++ x" inside a hunk is never taken for a file header. Returns the index of
+    # the first line after the hunk.
+    header_number = i
+    while old_count > 0 or new_count > 0:
+        if i >= len(lines):
+            raise PatchError(
+                f"Hunk at patch line {header_number} ends {old_count} old and {new_count} new lines short of the "
+                "counts in its header"
+            )
+        line = lines[i]
+        # Editors and models often strip the single space off blank context lines.
+        kind, text = line[:1] or " ", line[1:]
+        if kind == "\\":
+            # "\ No newline at end of file" refers to the line before it.
+            if hunk.lines and hunk.lines[-1][0] != "-":
+                hunk.new_ends_without_newline = True
+            i += 1
+            continue
+        if kind not in (" ", "-", "+"):
+            raise PatchError(
+                f"Patch line {i + 1} is inside the hunk at line {header_number} by its header's counts, but is not "
+                "a context, removed or added line"
+            )
+        old_count -= kind != "+"
+        new_count -= kind != "-"
+        if old_count < 0 or new_count < 0:
+            raise PatchError(f"Hunk at patch line {header_number} has more lines than the counts in its header")
+        hunk.lines.append((kind, text))
+        i += 1
+    while i < len(lines) and lines[i].startswith("\\"):
+        if hunk.lines and hunk.lines[-1][0] != "-":
+            hunk.new_ends_without_newline = True
+        i += 1
+    return i
+
+
+def parse_patch(patch):
+    file_patches = []
+    current = None
+    lines = patch.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = FilePatch(_strip_path(line), _strip_path(lines[i + 1]))
+            file_patches.append(current)
+            i += 2
+            continue
+        match = HUNK_HEADER.match(line)
+        if match:
+            if current is None:
+                raise PatchError(f"Hunk at patch line {i + 1} comes before any ---/+++ file header")
+            hunk = Hunk(int(match.group(1)))
+            current.hunks.append(hunk)
+            old_count = int(match.group(2)) if match.group(2) is not None else 1
+            new_count = int(match.group(4)) if match.group(4) is not None else 1
+            i = _read_hunk(lines, i + 1, hunk, old_count, new_count)
+            continue
+        if current is not None and current.hunks and line[:1] in ("+", "-", " ") and line.strip():
+            # A hunk line past the end of its hunk: the header's counts are too small.
+            raise PatchError(f"Patch line {i + 1} follows a hunk but is not counted in its @@ header")
+        i += 1
+
+    if not file_patches:
+        raise PatchError("No ---/+++ file headers found; expected a unified diff")
+    return file_patches
+
+
+def patch_paths(patch):
+    # Every path a patch would write or delete, for callers that need to know before applying it.
+    try:
+        file_patches = parse_patch(patch)
+    except PatchError:
+        return []
+    paths = []
+    for file_patch in file_patches:
+        for path in (file_patch.old_path, file_patch.new_path):
+            if path is not None and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _find_hunk(lines, old_lines, expected, start):
+    # Try the position the hunk header gives first, then search outwards from it, never before the previous hunk.
+    limit = len(lines) - len(old_lines)
+    if limit < start:
+        return None
+    expected = min(max(expected, start), limit)
+    for distance in range(max(expected - start, limit - expected) + 1):
+        for position in (expected - distance, expected + distance):
+            if start <= position <= limit and lines[position : position + len(old_lines)] == old_lines:
+                return position
+    return None
+
+
+def _apply_hunks(path, text, hunks):
+    newline = "\r\n" if "\r\n" in text else "\n"
+    lines = text.splitlines()
+    ends_with_newline = text.endswith(("\n", "\r"))
+    output = []
+    cursor = 0
+    for number, hunk in enumerate(hunks, start=1):
+        old_lines = hunk.old_lines()
+        expected = max(hunk.old_start - 1, 0) if old_lines else min(hunk.old_start, len(lines))
+        position = _find_hunk(lines, old_lines, expected, cursor)
+        if position is None:
+            first = next((line for line in old_lines if line.strip()), "")
+            raise PatchError(f'Hunk {number} does not match "{path}" (near line {hunk.old_start}: "{first.strip()}")')
+        output.extend(lines[cursor:position])
+        output.extend(hunk.new_lines())
+        cursor = position + len(old_lines)
+        if cursor >= len(lines):
+            ends_with_newline = not hunk.new_ends_without_newline
+    output.extend(lines[cursor:])
+    return newline.join(output) + (newline if output and ends_with_newline else "")
+
+
+def apply_patch(working_directory, patch):
+    try:
+        file_patches = parse_patch(patch)
+        workspace = Workspace.of(working_directory)
+        working_directory_abs_path = workspace.root
+
+        # Work out every file's new contents before touching any of them, so a hunk that does not apply leaves the
+        # whole tree as it was. A section for a path an earlier section already changed applies on top of that change.
+        pending = {}
+        names = {}
+        for file_patch in file_patches:
+            source_path = file_patch.old_path
+            target_path = file_patch.new_path
+            for path in (source_path, target_path):
+                if path is not None and workspace.resolve(path) is None:
+                    return f'Error: Cannot patch "{path}" as it is outside the permitted working directory'
+
+            if source_path is None:
+                if target_path is None:
+                    return "Error: A file header has /dev/null on both sides"
+                original = ""
+                target_abs_path = workspace.resolve(target_path)
+                exists = pending[target_abs_path] is not None if target_abs_path in pending else None
+                if exists or (exists is None and os.path.exists(target_abs_path)):
+                    return f'Error: Cannot create "{target_path}" as it already exists'
+            else:
+                source_abs_path = workspace.resolve(source_path)
+                if source_abs_path in pending:
+                    original = pending[source_abs_path]
+                    if original is None:
+                        return f'Error: "{source_path}" is deleted by an earlier part of the patch'
+                else:
+                    if not os.path.isfile(source_abs_path):
+                        return f'Error: File not found or is not a regular file: "{source_path}"'
+                    with open(source_abs_path, "r", encoding="utf-8", newline="") as f:
+                        original = f.read()
+
+            if target_path is None:
+                pending[source_abs_path] = None
+                names[source_abs_path] = source_path
+                continue
+            target_abs_path = workspace.resolve(target_path)
+            pending[target_abs_path] = _apply_hunks(source_path or target_path, original, file_patch.hunks)
+            names[target_abs_path] = target_path
+            if source_path is not None and source_abs_path != target_abs_path:
+                pending[source_abs_path] = None
+                names[source_abs_path] = source_path
+
+        changed = []
+        for file_abs_path, content in pending.items():
+            if content is None:
+                # A file created and deleted again by the same patch never reaches the disk.
+                if os.path.lexists(file_abs_path):
+                    os.remove(file_abs_path)
+                changed.append(f"{names[file_abs_path]} (deleted)")
+            else:
+                atomic_write(file_abs_path, content)
+                changed.append(names[file_abs_path])
+            notify_written(working_directory_abs_path, file_abs_path)
+
+        return f"Successfully applied patch to {len(changed)} files: {', '.join(changed)}"
+
+    except PatchError as e:
+        return f"Error: {e}; no files were changed"
+    except Exception as e:
+        return f"Error: {e}"
+
+
+async def apply_patch_async(working_directory, patch):
+    return await asyncio.to_thread(apply_patch, working_directory, patch)
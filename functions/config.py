@@ -1 +1,17 @@
+import os
+
+
 MAX_CHARS = 10000
+MAX_ENTRIES = 1000
+MAX_OUTPUT_BYTES = 64 * 1024
+MAX_SEARCH_RESULTS = 50
+MAX_INDEXED_FILE_BYTES = 1024 * 1024
+MAX_RESULT_CACHE_ENTRIES = 256
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".agent_cache")
+
+PYTHON_WORKER_MAX_RUNS = 50
+# A pooled run spools its output to temporary files and is killed once they hold more than this, so a script printing
+# in a loop cannot fill the disk before it times out.
+PYTHON_WORKER_MAX_SPOOLED_OUTPUT_BYTES = 16 * 1024 * 1024
+PYTHON_WORKER_PRELOAD = ("argparse", "json", "unittest")
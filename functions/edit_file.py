@@ -0,0 +1,55 @@
+import asyncio
+import os
+
+from .write_file import atomic_write, notify_written, resolve_writable_path
+
+
+def _apply_edit(content, edit):
+    search = edit.get("search", "")
+    replace = edit.get("replace", "")
+    if not search:
+        return None, "the search text is empty"
+    occurrences = content.count(search)
+    if occurrences == 0:
+        return None, "the search text was not found"
+    if occurrences > 1 and not edit.get("replace_all"):
+        return None, (
+            f"the search text occurs {occurrences} times; include more surrounding lines to make it unique, "
+            "or set replace_all"
+        )
+    return content.replace(search, replace), None
+
+
+def edit_file(working_directory, file_path, edits):
+    try:
+        working_directory_abs_path, file_abs_path = resolve_writable_path(working_directory, file_path)
+        if file_abs_path is None:
+            return f'Error: Cannot edit "{file_path}" as it is outside the permitted working directory'
+        if not os.path.isfile(file_abs_path):
+            return f'Error: File not found or is not a regular file: "{file_path}"'
+        if not edits:
+            return "Error: No edits given"
+
+        with open(file_abs_path, "r", encoding="utf-8", newline="") as f:
+            content = f.read()
+        original_length = len(content)
+        # Every edit is checked before anything is written, so a failing edit leaves the file untouched.
+        for number, edit in enumerate(edits, start=1):
+            content, problem = _apply_edit(content, edit)
+            if problem is not None:
+                return f'Error: Edit {number} to "{file_path}" failed: {problem}. No edits were applied.'
+
+        atomic_write(file_abs_path, content)
+        notify_written(working_directory_abs_path, file_abs_path)
+
+        return (
+            f'Successfully edited "{file_path}" ({len(edits)} edits applied, '
+            f"{original_length} -> {len(content)} characters)"
+        )
+
+    except Exception as e:
+        return f"Error: {e}"
+
+
+async def edit_file_async(working_directory, file_path, edits):
+    return await asyncio.to_thread(edit_file, working_directory, file_path, edits)
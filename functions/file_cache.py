@@ -0,0 +1,78 @@
+import threading
+
+from collections import OrderedDict
+
+
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+
+
+def file_version(stat_result):
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+# LRU of values derived from files, keyed on (absolute path, kind) and only valid for the (st_mtime_ns, st_size)
+# version they were read at. Entries are evicted oldest-first once their total size passes the byte budget.
+class FileCache:
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, version, kind="content"):
+        with self._lock:
+            entry = self.entries.get((path, kind))
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end((path, kind))
+            self.hits += 1
+            return entry[1]
+
+    def contains(self, path, version, kind="content"):
+        # Like get, but neither counts a hit or miss nor refreshes the entry.
+        with self._lock:
+            entry = self.entries.get((path, kind))
+            return entry is not None and entry[0] == version
+
+    def put(self, path, version, value, size, kind="content"):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop((path, kind))
+            self.entries[(path, kind)] = (version, value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, path):
+        with self._lock:
+            for key in [key for key in self.entries if key[0] == path]:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+        }
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+
+FILE_CACHE = FileCache()
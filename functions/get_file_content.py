@@ -1,26 +1,114 @@
+import asyncio
+import mmap
 import os
+import stat
 
-from google.genai import types
+from array import array
+from bisect import bisect_right
 
 from .config import MAX_CHARS
+from .file_cache import FILE_CACHE, file_version
+from .workspace import Workspace
 
 
-def get_file_content(working_directory, file_path):
-    try:
-        working_directory_abs_path = os.path.abspath(working_directory)
-        file_abs_path = os.path.normpath(os.path.join(working_directory_abs_path, file_path))
+def _build_line_index(mapped):
+    line_starts = array("Q", [0])
+    position = mapped.find(b"\n")
+    while position != -1:
+        line_starts.append(position + 1)
+        position = mapped.find(b"\n", position + 1)
+    return line_starts
+
+
+def _line_index(file_abs_path, version, mapped):
+    # Offsets of the first byte of every line, built once per file version so later line lookups are a bisect.
+    line_starts = FILE_CACHE.get(file_abs_path, version, kind="lines")
+    if line_starts is None:
+        line_starts = _build_line_index(mapped) if mapped is not None else array("Q", [0])
+        FILE_CACHE.put(file_abs_path, version, line_starts, line_starts.itemsize * len(line_starts), kind="lines")
+    return line_starts
+
+
+def _line_count(line_starts, file_size):
+    return len(line_starts) - 1 if line_starts[-1] == file_size else len(line_starts)
+
+
+def _read_range(file_path, file_abs_path, file_stat, offset, length, start_line, end_line):
+    version = file_version(file_stat)
+    file_size = file_stat.st_size
+    with open(file_abs_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if file_size else None
+        try:
+            line_starts = _line_index(file_abs_path, version, mapped)
+            line_count = _line_count(line_starts, file_size)
 
-        if not file_abs_path.startswith(working_directory_abs_path):
+            if start_line is not None or end_line is not None:
+                start_line = int(start_line) if start_line is not None else 1
+                end_line = min(int(end_line), line_count) if end_line is not None else line_count
+                if start_line < 1 or start_line > line_count or end_line < start_line:
+                    return (
+                        f'Error: Line range {start_line}-{end_line} is outside "{file_path}", '
+                        f"which has {line_count} lines"
+                    )
+                start = line_starts[start_line - 1]
+                end = line_starts[end_line] if end_line < len(line_starts) else file_size
+            else:
+                start = int(offset) if offset is not None else 0
+                if start < 0 or start > file_size:
+                    return f'Error: Offset {start} is outside "{file_path}", which is {file_size} bytes'
+                end = min(file_size, start + (int(length) if length is not None else MAX_CHARS))
+
+            truncated = end - start > MAX_CHARS
+            end = min(end, start + MAX_CHARS)
+            content = mapped[start:end].decode("utf-8", errors="replace") if mapped is not None else ""
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+    first_line = bisect_right(line_starts, start)
+    last_line = bisect_right(line_starts, max(start, end - 1))
+    header = (
+        f'[File "{file_path}": {file_size} bytes, {line_count} lines; '
+        f"showing bytes {start}-{end} (lines {first_line}-{last_line})]"
+    )
+    if truncated:
+        content += f"\n[...Range truncated at {MAX_CHARS} bytes; continue from offset={end}]"
+    return f"{header}\n{content}"
+
+
+def get_file_content(working_directory, file_path, offset=None, length=None, start_line=None, end_line=None):
+    try:
+        file_abs_path = Workspace.of(working_directory).resolve(file_path)
+        if file_abs_path is None:
             return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
-        if not os.path.isfile(file_abs_path):
+        try:
+            file_stat = os.stat(file_abs_path)
+        except OSError:
+            file_stat = None
+        if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
             return f'Error: File not found or is not a regular file: "{file_path}"'
 
-        file_size = os.path.getsize(file_abs_path)
-        with open(file_abs_path, "r") as f:
-            file_content_string = f.read(MAX_CHARS)
+        if any(value is not None for value in (offset, length, start_line, end_line)):
+            return _read_range(file_path, file_abs_path, file_stat, offset, length, start_line, end_line)
+
+        version = file_version(file_stat)
+        cached = FILE_CACHE.get(file_abs_path, version)
+        if cached is None:
+            with open(file_abs_path, "r") as f:
+                file_content_string = f.read(MAX_CHARS)
+                # MAX_CHARS counts characters and st_size bytes, so only reading on tells whether anything was left.
+                truncated = f.read(1) != ""
+            cached = (file_content_string, truncated)
+            FILE_CACHE.put(file_abs_path, version, cached, len(file_content_string.encode("utf-8")))
 
-        if len(file_content_string) < file_size:
-            file_content_string += f'\n[...File "{file_path}" truncated at {MAX_CHARS} characters]'
+        file_content_string, truncated = cached
+        if truncated:
+            with open(file_abs_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                line_count = _line_count(_line_index(file_abs_path, version, mapped), file_stat.st_size)
+            file_content_string += (
+                f'\n[...File "{file_path}" truncated at {MAX_CHARS} characters; the file is {file_stat.st_size} '
+                f"bytes and {line_count} lines, read further with offset/length or start_line/end_line]"
+            )
 
         return file_content_string
 
@@ -28,16 +116,5 @@ def get_file_content(working_directory, file_path):
         return f"Error: {e}"
 
 
-schema_get_file_content = types.FunctionDeclaration(
-    name="get_file_content",
-    description="Read file contents, constrained to the working directory.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The file path for any file whose content must be read, relative to the working directory.",
-            ),
-        },
-    ),
-)
+async def get_file_content_async(working_directory, file_path, **kwargs):
+    return await asyncio.to_thread(get_file_content, working_directory, file_path, **kwargs)
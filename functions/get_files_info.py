@@ -1,46 +1,79 @@
+import asyncio
+import fnmatch
 import os
+import stat
 
-from google.genai import types
+from .config import MAX_ENTRIES
+from .workspace import Workspace
 
 
-def get_files_info(working_directory, directory="."):
+def _walk(directory_abs_path, prefix, depth, max_depth):
+    with os.scandir(directory_abs_path) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        relative_path = prefix + entry.name
+        yield relative_path, entry
+        # DirEntry.is_dir uses the d_type returned by scandir, so deciding whether to descend costs no stat call.
+        if entry.is_dir(follow_symlinks=False) and (max_depth is None or depth < max_depth):
+            try:
+                yield from _walk(entry.path, relative_path + "/", depth + 1, max_depth)
+            except OSError:
+                continue
+
+
+def _matches(relative_path, pattern):
+    if pattern is None:
+        return True
+    return fnmatch.fnmatch(relative_path if "/" in pattern else os.path.basename(relative_path), pattern)
+
+
+def _describe(relative_path, entry):
     try:
-        working_directory_abs_path = os.path.abspath(working_directory)
-        directory_abs_path = os.path.normpath(os.path.join(working_directory_abs_path, directory))
-        
-        if not directory_abs_path.startswith(working_directory_abs_path):
+        entry_stat = entry.stat()
+    except OSError:
+        entry_stat = entry.stat(follow_symlinks=False)
+    return f"- {relative_path}: file_size={entry_stat.st_size} bytes, is_dir={stat.S_ISDIR(entry_stat.st_mode)}"
+
+
+def get_files_info(
+    working_directory, directory=".", recursive=False, max_depth=None, pattern=None, offset=0, limit=MAX_ENTRIES
+):
+    try:
+        directory_abs_path = Workspace.of(working_directory).resolve(directory)
+        if directory_abs_path is None:
             return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
         if not os.path.isdir(directory_abs_path):
             return f'Error: "{directory}" is not a directory'
 
-        directory_contents = os.listdir(directory_abs_path)
-        enrich_directory_contents = [
-            {
-                "file_name": file_name,
-                "file_size": os.path.getsize(os.path.join(directory_abs_path, file_name)),
-                "is_dir": os.path.isdir(os.path.join(directory_abs_path, file_name))
-            }
-            for file_name in directory_contents
-        ]
-        response = ""
-        for entry in enrich_directory_contents:
-            response += f"- {entry['file_name']}: file_size={entry['file_size']} bytes, is_dir={entry['is_dir']}\n"
-        return response
+        if max_depth is not None:
+            max_depth = int(max_depth)
+        elif not recursive:
+            max_depth = 1
+        offset = max(int(offset), 0)
+        limit = max(int(limit), 0)
+
+        # Every entry is counted so the model knows how much is left, but only the requested page is stat'ed.
+        lines = []
+        total = 0
+        for relative_path, entry in _walk(directory_abs_path, "", 1, max_depth):
+            if not _matches(relative_path, pattern):
+                continue
+            if offset <= total < offset + limit:
+                lines.append(_describe(relative_path, entry))
+            total += 1
+
+        shown_end = offset + len(lines)
+        if shown_end < total:
+            lines.append(f"[Showing entries {offset + 1}-{shown_end} of {total}; pass offset={shown_end} to list more]")
+        elif offset >= total > 0:
+            lines.append(f"[No entries at offset {offset}; the listing has {total} entries]")
+        elif offset > 0:
+            lines.append(f"[Showing entries {offset + 1}-{shown_end} of {total}]")
+        return "".join(f"{line}\n" for line in lines)
 
     except Exception as e:
         return f"Error: {e}"
 
 
-schema_get_files_info = types.FunctionDeclaration(
-    name="get_files_info",
-    description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "directory": types.Schema(
-                type=types.Type.STRING,
-                description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
-            ),
-        },
-    ),
-)
+async def get_files_info_async(working_directory, directory=".", **kwargs):
+    return await asyncio.to_thread(get_files_info, working_directory, directory, **kwargs)
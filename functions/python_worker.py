@@ -0,0 +1,135 @@
+# Fork server started by PythonWorkerPool. It imports the modules it is asked to preload once, then reads one JSON
+# job per line from stdin and runs each script in a forked child, so every run starts from the same warm state and
+# nothing a script does survives into the next run. Results are written back to stdout as one JSON line per job.
+import base64
+import importlib
+import json
+import os
+import resource
+import signal
+import sys
+import tempfile
+import time
+import traceback
+import types
+
+
+POLL_INTERVAL = 0.002
+
+
+def _run_child(working_directory, file_path, args, stdout_fd, stderr_fd, timeout):
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+    sys.stdin = open(os.devnull)
+    os.chdir(working_directory)
+    cpu_limit = int(timeout) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+
+    file_abs_path = os.path.abspath(file_path)
+    sys.argv = [file_path, *args]
+    sys.path[0] = os.path.dirname(file_abs_path)
+    exit_code = 0
+    try:
+        with open(file_abs_path, "rb") as f:
+            code = compile(f.read(), file_abs_path, "exec")
+        main_module = types.ModuleType("__main__")
+        main_module.__file__ = file_abs_path
+        sys.modules["__main__"] = main_module
+        exec(code, main_module.__dict__)
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # Drop the worker frames so the traceback reads like one from a fresh interpreter.
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != file_abs_path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(exit_code & 0xFF)
+
+
+def _read_capped(output_file, name, max_output_bytes):
+    size = output_file.seek(0, os.SEEK_END)
+    output_file.seek(0)
+    return {
+        name: base64.b64encode(output_file.read(max_output_bytes)).decode("ascii"),
+        f"{name}_dropped": max(0, size - max_output_bytes),
+    }
+
+
+def _spooled_bytes(*output_files):
+    return sum(os.fstat(output_file.fileno()).st_size for output_file in output_files)
+
+
+def _run_job(working_directory, job):
+    with tempfile.TemporaryFile() as stdout_file, tempfile.TemporaryFile() as stderr_file:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_child(
+                    working_directory,
+                    job["file_path"],
+                    job["args"],
+                    stdout_file.fileno(),
+                    stderr_file.fileno(),
+                    job["timeout"],
+                )
+            finally:
+                os._exit(1)
+
+        # The child is killed when it runs out of time, or when its output outgrows max_spooled_output_bytes: only
+        # max_output_bytes of it are read back, and the rest would only fill the disk.
+        deadline = time.monotonic() + job["timeout"]
+        timed_out = output_limited = False
+        while True:
+            waited_pid, status = os.waitpid(pid, os.WNOHANG)
+            if waited_pid:
+                break
+            timed_out = time.monotonic() > deadline
+            output_limited = _spooled_bytes(stdout_file, stderr_file) > job["max_spooled_output_bytes"]
+            if timed_out or output_limited:
+                os.kill(pid, signal.SIGKILL)
+                _, status = os.waitpid(pid, 0)
+                break
+            time.sleep(POLL_INTERVAL)
+
+        return {
+            **_read_capped(stdout_file, "stdout", job["max_output_bytes"]),
+            **_read_capped(stderr_file, "stderr", job["max_output_bytes"]),
+            "returncode": os.waitstatus_to_exitcode(status),
+            "timed_out": timed_out,
+            "output_limited": output_limited,
+        }
+
+
+def main():
+    working_directory = os.getcwd()
+    for module_name in sys.argv[1:]:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+
+    responses = os.fdopen(os.dup(1), "w")
+    for line in sys.stdin:
+        try:
+            response = _run_job(working_directory, json.loads(line))
+        except Exception as e:
+            response = {"error": str(e)}
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import atexit
+import base64
+import json
+import os
+import queue
+import subprocess
+import threading
+
+from .config import (
+    MAX_OUTPUT_BYTES,
+    PYTHON_WORKER_MAX_RUNS,
+    PYTHON_WORKER_MAX_SPOOLED_OUTPUT_BYTES,
+    PYTHON_WORKER_PRELOAD,
+)
+
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "python_worker.py")
+# Scripts the model runs should not be able to read the agent's credentials from their environment.
+SCRUBBED_ENVIRONMENT_VARIABLES = {"GEMINI_API_KEY", "GOOGLE_API_KEY"}
+
+
+class PythonWorker:
+    def __init__(self, working_directory, preload):
+        environment = {k: v for k, v in os.environ.items() if k not in SCRUBBED_ENVIRONMENT_VARIABLES}
+        self.process = subprocess.Popen(
+            ["python", WORKER_SCRIPT, *preload],
+            cwd=working_directory,
+            env=environment,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        self.runs = 0
+
+    def run(self, file_path, args, timeout, max_output_bytes):
+        assert self.process.stdin is not None and self.process.stdout is not None
+        job = {
+            "file_path": file_path,
+            "args": list(args),
+            "timeout": timeout,
+            "max_output_bytes": max_output_bytes,
+            "max_spooled_output_bytes": PYTHON_WORKER_MAX_SPOOLED_OUTPUT_BYTES,
+        }
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        self.runs += 1
+        if not line:
+            raise RuntimeError("Python worker exited unexpectedly")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(f"Python worker failed: {response['error']}")
+        return response
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+# Pre-started fork-server interpreters for one working directory. Each run forks a fresh child from a warm worker,
+# so runs skip interpreter start-up and preloaded imports but never see state left behind by an earlier run.
+class PythonWorkerPool:
+    def __init__(self, working_directory, size=2, max_runs=PYTHON_WORKER_MAX_RUNS, preload=PYTHON_WORKER_PRELOAD):
+        self.working_directory = os.path.abspath(working_directory)
+        self.max_runs = max_runs
+        self.preload = tuple(preload)
+        self.idle = queue.Queue()
+        self.workers = set()
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self.idle.put(self._start_worker())
+
+    def _start_worker(self):
+        worker = PythonWorker(self.working_directory, self.preload)
+        with self._lock:
+            self.workers.add(worker)
+        return worker
+
+    def _retire(self, worker):
+        worker.close()
+        with self._lock:
+            self.workers.discard(worker)
+
+    def run(self, file_path, args, timeout, max_output_bytes=MAX_OUTPUT_BYTES):
+        worker = self.idle.get()
+        try:
+            response = worker.run(file_path, args, timeout, max_output_bytes)
+        except Exception:
+            self._retire(worker)
+            self.idle.put(self._start_worker())
+            raise
+
+        if worker.runs >= self.max_runs or worker.process.poll() is not None:
+            self._retire(worker)
+            worker = self._start_worker()
+        self.idle.put(worker)
+
+        if response["timed_out"]:
+            raise subprocess.TimeoutExpired(["python", file_path, *args], timeout)
+        stderr = base64.b64decode(response["stderr"])
+        if response["output_limited"]:
+            limit = PYTHON_WORKER_MAX_SPOOLED_OUTPUT_BYTES
+            stderr += f"\n[Process killed after writing more than {limit} bytes of output]".encode()
+        return (
+            base64.b64decode(response["stdout"]),
+            stderr,
+            response["returncode"],
+            response["stdout_dropped"],
+            response["stderr_dropped"],
+        )
+
+    def close(self):
+        with self._lock:
+            workers = list(self.workers)
+            self.workers.clear()
+        for worker in workers:
+            worker.close()
+
+
+WORKER_POOLS = {}
+
+
+def enable_worker_pool(working_directory, size=2, max_runs=PYTHON_WORKER_MAX_RUNS):
+    working_directory_abs_path = os.path.abspath(working_directory)
+    if working_directory_abs_path not in WORKER_POOLS:
+        WORKER_POOLS[working_directory_abs_path] = PythonWorkerPool(working_directory_abs_path, size, max_runs)
+    return WORKER_POOLS[working_directory_abs_path]
+
+
+def get_worker_pool(working_directory_abs_path):
+    return WORKER_POOLS.get(working_directory_abs_path)
+
+
+@atexit.register
+def close_worker_pools():
+    while WORKER_POOLS:
+        _, pool = WORKER_POOLS.popitem()
+        pool.close()
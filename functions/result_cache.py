@@ -0,0 +1,190 @@
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from collections import OrderedDict
+
+from .config import CACHE_DIR, MAX_RESULT_CACHE_ENTRIES
+
+
+RESULT_CACHE_FORMAT_VERSION = 1
+# Tools whose result only depends on their arguments and the files under the working directory, and that cost more
+# to run than the two tree walks a cached call takes. Listing and searching are cheaper than the walks (search_code
+# keeps its own index fresh), and get_file_content is cached by file version in FILE_CACHE.
+CACHEABLE_FUNCTIONS = {"run_python_file"}
+# Bytecode caches and the like change whenever a script runs; leaving them out keeps a test run from invalidating
+# every cached result.
+SKIPPED_DIRECTORIES = {"__pycache__", "node_modules"}
+
+
+def canonical_args(args):
+    return json.dumps(args or {}, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def tree_fingerprint(root):
+    # Digest of every path under root with its (st_mtime_ns, st_size); directories only contribute their names.
+    digest = hashlib.sha1()
+    pending = [("", root)]
+    while pending:
+        prefix, directory_abs_path = pending.pop()
+        with os.scandir(directory_abs_path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.name.startswith(".") or entry.name in SKIPPED_DIRECTORIES:
+                continue
+            relative_path = f"{prefix}{entry.name}".encode("utf-8", errors="surrogateescape")
+            if entry.is_dir(follow_symlinks=False):
+                digest.update(b"d " + relative_path + b"\n")
+                pending.append((f"{prefix}{entry.name}/", entry.path))
+            else:
+                file_stat = entry.stat(follow_symlinks=False)
+                digest.update(b"f " + relative_path + f" {file_stat.st_mtime_ns} {file_stat.st_size}\n".encode())
+    return digest.hexdigest()
+
+
+# Results of deterministic tool calls, keyed on (working directory, function name, canonical args). Each working
+# directory has a generation that advances when write_file reports a write or when the tree's fingerprint changes
+# underneath us, and a result is only served for the generation and fingerprint it was produced at. A result is
+# not stored if the call itself changed the tree (a script that writes files, say). With persist set, results are
+# saved under CACHE_DIR and reused by later processes for as long as the tree's fingerprint is unchanged.
+class ToolResultCache:
+    def __init__(self, max_entries=MAX_RESULT_CACHE_ENTRIES, enabled=True, persist=False):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.persist = persist
+        self.entries = OrderedDict()
+        self.trees = {}
+        self.dirty = set()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _cache_path(self, working_directory_abs_path):
+        return os.path.join(
+            CACHE_DIR, "tool_results", hashlib.sha1(working_directory_abs_path.encode("utf-8")).hexdigest() + ".json.gz"
+        )
+
+    def _load(self, working_directory_abs_path, generation):
+        try:
+            with gzip.open(self._cache_path(working_directory_abs_path), "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != RESULT_CACHE_FORMAT_VERSION or data.get("root") != working_directory_abs_path:
+            return
+        for name, args, fingerprint, result in data["entries"]:
+            self.entries[(working_directory_abs_path, name, args)] = (generation, fingerprint, result)
+
+    def observe(self, working_directory_abs_path):
+        fingerprint = tree_fingerprint(working_directory_abs_path)
+        with self._lock:
+            state = self.trees.get(working_directory_abs_path)
+            if state is None:
+                state = self.trees[working_directory_abs_path] = [0, fingerprint]
+                if self.persist:
+                    self._load(working_directory_abs_path, 0)
+            elif state[1] != fingerprint:
+                state[0] += 1
+                state[1] = fingerprint
+            return state[0], fingerprint
+
+    def invalidate(self, working_directory_abs_path):
+        with self._lock:
+            state = self.trees.get(working_directory_abs_path)
+            if state is not None:
+                state[0] += 1
+
+    def get(self, key, generation, fingerprint):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != generation or entry[1] != fingerprint:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, generation, fingerprint, result):
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (generation, fingerprint, result)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty.add(key[0])
+
+    def _cacheable(self, name):
+        return self.enabled and name in CACHEABLE_FUNCTIONS
+
+    def _store_if_unchanged(self, key, before, after, result):
+        if before == after and isinstance(result, str) and not result.startswith("Error:"):
+            self.put(key, *before, result)
+
+    def call(self, working_directory, name, args, function):
+        # Returns (result, served_from_cache).
+        if not self._cacheable(name):
+            return function(), False
+        working_directory_abs_path = os.path.abspath(working_directory)
+        key = (working_directory_abs_path, name, canonical_args(args))
+        before = self.observe(working_directory_abs_path)
+        result = self.get(key, *before)
+        if result is not None:
+            return result, True
+        result = function()
+        self._store_if_unchanged(key, before, self.observe(working_directory_abs_path), result)
+        return result, False
+
+    async def call_async(self, working_directory, name, args, function):
+        if not self._cacheable(name):
+            return await function(), False
+        working_directory_abs_path = os.path.abspath(working_directory)
+        key = (working_directory_abs_path, name, canonical_args(args))
+        before = await asyncio.to_thread(self.observe, working_directory_abs_path)
+        result = self.get(key, *before)
+        if result is not None:
+            return result, True
+        result = await function()
+        after = await asyncio.to_thread(self.observe, working_directory_abs_path)
+        self._store_if_unchanged(key, before, after, result)
+        return result, False
+
+    def save(self):
+        with self._lock:
+            snapshots = {}
+            for working_directory_abs_path in self.dirty:
+                _, fingerprint = self.trees.get(working_directory_abs_path, (None, None))
+                snapshots[working_directory_abs_path] = [
+                    [name, args, entry_fingerprint, result]
+                    for (root, name, args), (_, entry_fingerprint, result) in self.entries.items()
+                    if root == working_directory_abs_path and entry_fingerprint == fingerprint
+                ]
+            self.dirty.clear()
+        for working_directory_abs_path, entries in snapshots.items():
+            cache_path = self._cache_path(working_directory_abs_path)
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+            data = {"version": RESULT_CACHE_FORMAT_VERSION, "root": working_directory_abs_path, "entries": entries}
+            with gzip.open(temporary_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temporary_path, cache_path)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.trees.clear()
+            self.dirty.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+RESULT_CACHE = ToolResultCache()
+
+
+@atexit.register
+def save_result_cache():
+    if RESULT_CACHE.persist:
+        RESULT_CACHE.save()
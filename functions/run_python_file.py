@@ -1,59 +1,149 @@
+import asyncio
 import os
 import subprocess
+import threading
 
-from google.genai import types
+from .config import MAX_OUTPUT_BYTES
+from .python_worker_pool import get_worker_pool
+from .workspace import Workspace
+
+
+TIMEOUT = 30
+READ_CHUNK_BYTES = 64 * 1024
+
+
+def _resolve_python_file(working_directory, file_path):
+    workspace = Workspace.of(working_directory)
+    file_abs_path = workspace.resolve(file_path)
+    if file_abs_path is None:
+        return None, f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
+    if not os.path.isfile(file_abs_path):
+        return None, f'Error: File "{file_path}" not found.'
+    if not file_abs_path.endswith(".py"):
+        return None, f'Error: "{file_path}" is not a Python file.'
+    return workspace.root, None
+
+
+def _decode(output, dropped):
+    text = output.decode("utf-8", errors="replace")
+    if dropped:
+        text += f"\n[...{dropped} more bytes of output truncated]"
+    return text
+
+
+def _format_output(stdout, stderr, returncode, stdout_dropped=0, stderr_dropped=0):
+    output = []
+    if stdout or stderr:
+        output.append(f"STDOUT: {_decode(stdout, stdout_dropped)}")
+        output.append(f"STDERR: {_decode(stderr, stderr_dropped)}")
+    if returncode != 0:
+        output.append(f"Process exited with code {returncode}")
+    if not output:
+        output.append("No output produced")
+
+    return "\n".join(output)
+
+
+# Both readers keep draining the pipe after the cap so the child never blocks on a full pipe, but only the first
+# MAX_OUTPUT_BYTES are kept; the rest is just counted for the truncation marker.
+class _CappedOutput:
+    def __init__(self, limit=MAX_OUTPUT_BYTES):
+        self.limit = limit
+        self.chunks = []
+        self.kept = 0
+        self.dropped = 0
+
+    def feed(self, chunk):
+        keep = max(0, min(len(chunk), self.limit - self.kept))
+        if keep:
+            self.chunks.append(chunk[:keep])
+            self.kept += keep
+        self.dropped += len(chunk) - keep
+
+    def value(self):
+        return b"".join(self.chunks)
+
+
+def _drain(stream, capped_output):
+    with stream:
+        for chunk in iter(lambda: stream.read1(READ_CHUNK_BYTES), b""):
+            capped_output.feed(chunk)
+
+
+async def _drain_async(stream, capped_output):
+    while chunk := await stream.read(READ_CHUNK_BYTES):
+        capped_output.feed(chunk)
 
 
 def run_python_file(working_directory, file_path, args=[]):
     try:
-        working_directory_abs_path = os.path.abspath(working_directory)
-        file_abs_path = os.path.normpath(os.path.join(working_directory_abs_path, file_path))
-
-        if not file_abs_path.startswith(working_directory_abs_path):
-            return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
-        if not os.path.isfile(file_abs_path):
-            return f'Error: File "{file_path}" not found.'
-        if not file_abs_path.endswith(".py"):
-            return f'Error: "{file_path}" is not a Python file.'
-
-        old_cwd_abs_path = os.path.abspath(os.getcwd())
-        os.chdir(working_directory_abs_path)
-        response = subprocess.run(["python", file_path, *args], timeout=30, capture_output=True)
-        os.chdir(old_cwd_abs_path)
-
-        output = []
-        if response.stdout or response.stderr:
-            output.append(f"STDOUT: {(response.stdout.decode("utf-8"))}")
-            output.append(f"STDERR: {response.stderr.decode("utf-8")}")
-        if response.returncode != 0:
-            output.append(f"Process exited with code {response.returncode}")
-        if not output:
-            output.append("No output produced")
-
-        return "\n".join(output)
+        working_directory_abs_path, error = _resolve_python_file(working_directory, file_path)
+        if error:
+            return error
+
+        worker_pool = get_worker_pool(working_directory_abs_path)
+        if worker_pool is not None:
+            return _format_output(*worker_pool.run(file_path, args, TIMEOUT, MAX_OUTPUT_BYTES))
+
+        command = ["python", file_path, *args]
+        stdout, stderr = _CappedOutput(), _CappedOutput()
+        with subprocess.Popen(
+            command, cwd=working_directory_abs_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        ) as process:
+            readers = [
+                threading.Thread(target=_drain, args=(process.stdout, stdout), daemon=True),
+                threading.Thread(target=_drain, args=(process.stderr, stderr), daemon=True),
+            ]
+            for reader in readers:
+                reader.start()
+            try:
+                process.wait(timeout=TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                raise
+            finally:
+                for reader in readers:
+                    reader.join()
+
+        return _format_output(stdout.value(), stderr.value(), process.returncode, stdout.dropped, stderr.dropped)
 
     except Exception as e:
         return f"Error: executing Python file: {e}"
 
 
-schema_run_python_file = types.FunctionDeclaration(
-    name="run_python_file",
-    description="Run a specified python file with any arguments given, constrained to the working directory.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The file path for any the python file to be run, relative to the working directory.",
-            ),
-            "args": types.Schema(
-                type=types.Type.ARRAY,
-                description="An optional list of arguments to be supplied when running the python file.",
-                items=types.Schema(
-                    type=types.Type.STRING,
-                    description="An argument to be passed to the python file being run.",
-                )
-            ),
-        },
-    ),
-)
+async def run_python_file_async(working_directory, file_path, args=[]):
+    try:
+        working_directory_abs_path, error = _resolve_python_file(working_directory, file_path)
+        if error:
+            return error
+
+        worker_pool = get_worker_pool(working_directory_abs_path)
+        if worker_pool is not None:
+            return _format_output(
+                *await asyncio.to_thread(worker_pool.run, file_path, args, TIMEOUT, MAX_OUTPUT_BYTES)
+            )
+
+        command = ["python", file_path, *args]
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=working_directory_abs_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = _CappedOutput(), _CappedOutput()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    _drain_async(process.stdout, stdout), _drain_async(process.stderr, stderr), process.wait()
+                ),
+                timeout=TIMEOUT,
+            )
+        except TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.TimeoutExpired(command, TIMEOUT)
+
+        return _format_output(stdout.value(), stderr.value(), process.returncode, stdout.dropped, stderr.dropped)
+
+    except Exception as e:
+        return f"Error: executing Python file: {e}"
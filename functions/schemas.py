@@ -0,0 +1,225 @@
+from google.genai import types
+
+from .config import MAX_CHARS, MAX_ENTRIES, MAX_SEARCH_RESULTS
+
+
+# Gemini function declarations for the tools in this package. They are kept apart from the implementations so that
+# importing and running a tool does not load the Gen AI SDK.
+schema_get_files_info = types.FunctionDeclaration(
+    name="get_files_info",
+    description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "directory": types.Schema(
+                type=types.Type.STRING,
+                description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
+            ),
+            "recursive": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="If true, also lists the contents of every subdirectory. Defaults to false.",
+            ),
+            "max_depth": types.Schema(
+                type=types.Type.INTEGER,
+                description="How many directory levels to descend when listing recursively. 1 lists only the directory itself.",
+            ),
+            "pattern": types.Schema(
+                type=types.Type.STRING,
+                description="Optional glob such as '*.py' to filter entries by name, or by relative path if it contains '/'.",
+            ),
+            "offset": types.Schema(
+                type=types.Type.INTEGER,
+                description="Number of matching entries to skip, for paging through large listings. Defaults to 0.",
+            ),
+            "limit": types.Schema(
+                type=types.Type.INTEGER,
+                description=f"Maximum number of entries to return. Defaults to {MAX_ENTRIES}.",
+            ),
+        },
+    ),
+)
+
+
+schema_get_file_content = types.FunctionDeclaration(
+    name="get_file_content",
+    description=(
+        "Read file contents, constrained to the working directory. Without a range, returns the first "
+        f"{MAX_CHARS} characters. Ranged reads report the file's total size and line count."
+    ),
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The file path for any file whose content must be read, relative to the working directory.",
+            ),
+            "offset": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional byte offset to start reading from.",
+            ),
+            "length": types.Schema(
+                type=types.Type.INTEGER,
+                description=f"Optional number of bytes to read from offset, at most {MAX_CHARS}.",
+            ),
+            "start_line": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional first line to read, counting from 1. Takes precedence over offset/length.",
+            ),
+            "end_line": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional last line to read, inclusive. Defaults to the end of the file.",
+            ),
+        },
+    ),
+)
+
+
+schema_search_code = types.FunctionDeclaration(
+    name="search_code",
+    description=(
+        "Search the text files in the working directory for a literal string or regular expression, and return "
+        "each matching line with its file, line number and surrounding context."
+    ),
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "query": types.Schema(
+                type=types.Type.STRING,
+                description="The text to search for, or a regular expression if regex is true. Matched line by line.",
+            ),
+            "regex": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="If true, treat the query as a Python regular expression. Defaults to false.",
+            ),
+            "case_sensitive": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="If true, match case exactly. Defaults to false.",
+            ),
+            "directory": types.Schema(
+                type=types.Type.STRING,
+                description="Optional directory to restrict the search to, relative to the working directory.",
+            ),
+            "pattern": types.Schema(
+                type=types.Type.STRING,
+                description="Optional glob such as '*.py' to restrict which files are searched.",
+            ),
+            "context_lines": types.Schema(
+                type=types.Type.INTEGER,
+                description="Number of lines of context to show before and after each match. Defaults to 2.",
+            ),
+            "max_results": types.Schema(
+                type=types.Type.INTEGER,
+                description=f"Maximum number of matches to return. Defaults to {MAX_SEARCH_RESULTS}.",
+            ),
+        },
+        required=["query"],
+    ),
+)
+
+
+schema_run_python_file = types.FunctionDeclaration(
+    name="run_python_file",
+    description="Run a specified python file with any arguments given, constrained to the working directory.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The file path for any the python file to be run, relative to the working directory.",
+            ),
+            "args": types.Schema(
+                type=types.Type.ARRAY,
+                description="An optional list of arguments to be supplied when running the python file.",
+                items=types.Schema(
+                    type=types.Type.STRING,
+                    description="An argument to be passed to the python file being run.",
+                )
+            ),
+        },
+    ),
+)
+
+
+schema_write_file = types.FunctionDeclaration(
+    name="write_file",
+    description=(
+        "Write or overwrite file contents, constrained to the working directory. To change part of an existing file, "
+        "use edit_file or apply_patch instead of sending the whole file again."
+    ),
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The file path for the file to be written to, relative to the working directory.",
+            ),
+            "content": types.Schema(
+                type=types.Type.STRING,
+                description="The content to be written to the file."
+            )
+        },
+    ),
+)
+
+
+schema_edit_file = types.FunctionDeclaration(
+    name="edit_file",
+    description=(
+        "Change part of an existing file by replacing exact text, constrained to the working directory. Each edit's "
+        "search text must appear exactly once in the file, so include enough surrounding lines to make it unique. "
+        "Edits are applied in order and all-or-nothing. Much cheaper than rewriting the file with write_file."
+    ),
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The file path for the file to be edited, relative to the working directory.",
+            ),
+            "edits": types.Schema(
+                type=types.Type.ARRAY,
+                description="The replacements to make, in order.",
+                items=types.Schema(
+                    type=types.Type.OBJECT,
+                    properties={
+                        "search": types.Schema(
+                            type=types.Type.STRING,
+                            description="Exact text to find, including whitespace and indentation.",
+                        ),
+                        "replace": types.Schema(
+                            type=types.Type.STRING,
+                            description="Text to put in its place.",
+                        ),
+                        "replace_all": types.Schema(
+                            type=types.Type.BOOLEAN,
+                            description="Replace every occurrence instead of requiring exactly one. Defaults to false.",
+                        ),
+                    },
+                    required=["search", "replace"],
+                ),
+            ),
+        },
+        required=["file_path", "edits"],
+    ),
+)
+
+
+schema_apply_patch = types.FunctionDeclaration(
+    name="apply_patch",
+    description=(
+        "Apply a unified diff (as produced by diff -u or git diff) to files in the working directory. Use --- and "
+        "+++ headers with paths relative to the working directory, /dev/null to create or delete a file, and a few "
+        "lines of context around each change. Hunks that moved are found by their context. All files are checked "
+        "before any is written, so a patch either applies completely or not at all."
+    ),
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "patch": types.Schema(
+                type=types.Type.STRING,
+                description="The unified diff to apply.",
+            ),
+        },
+        required=["patch"],
+    ),
+)
@@ -0,0 +1,320 @@
+import asyncio
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+
+from collections import defaultdict
+
+from .config import CACHE_DIR, MAX_INDEXED_FILE_BYTES, MAX_SEARCH_RESULTS
+from .workspace import Workspace
+
+
+INDEX_FORMAT_VERSION = 1
+SKIPPED_DIRECTORIES = {"__pycache__", "node_modules"}
+# An inline (?x) flag, under which whitespace and "#" in the pattern are not literal.
+VERBOSE_FLAG = re.compile(r"\(\?[aiLmsux]*x")
+# How many hex digits follow each numeric character escape.
+HEX_ESCAPE_DIGITS = {"x": 2, "u": 4, "U": 8}
+# The rest of a backreference or octal escape after its first digit.
+ESCAPE_DIGITS = re.compile(r"[0-9]{0,2}")
+
+
+def _trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _required_literals(pattern):
+    # Literal runs that any match of the pattern must contain, read from its top level. Anything that is not plainly
+    # a literal character ends the current run, so the result is always safe to filter on; a top-level alternation
+    # or verbose mode means there are none.
+    if VERBOSE_FLAG.search(pattern):
+        return []
+    literals, run = [], []
+
+    def end_run():
+        if run:
+            literals.append("".join(run))
+            run.clear()
+
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == "\\":
+            escaped = pattern[i : i + 1]
+            i += 1
+            if depth == 0 and escaped and not escaped.isalnum():
+                run.append(escaped)
+                continue
+            # Skip the escape's argument along with it, so that its digits are not taken for literal text. Up to two
+            # more digits follow a backreference or an octal escape; skipping a literal digit is still safe.
+            if escaped in HEX_ESCAPE_DIGITS:
+                i += HEX_ESCAPE_DIGITS[escaped]
+            elif escaped == "N" and pattern[i : i + 1] == "{":
+                closing = pattern.find("}", i)
+                i = closing + 1 if closing != -1 else len(pattern)
+            elif escaped.isdigit():
+                i = ESCAPE_DIGITS.match(pattern, i).end()
+            end_run()
+        elif char == "[":
+            # Skip the class; a "]" straight after "[" or "[^" is part of it.
+            if pattern[i : i + 1] == "^":
+                i += 1
+            if pattern[i : i + 1] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+            end_run()
+        elif char == "(":
+            depth += 1
+            end_run()
+        elif char == ")":
+            depth = max(depth - 1, 0)
+            end_run()
+        elif char == "|" and depth == 0:
+            return []
+        elif char in "*?{":
+            # The previous character may be missing from a match.
+            if run:
+                run.pop()
+            end_run()
+            if char == "{":
+                closing = pattern.find("}", i)
+                i = closing + 1 if closing != -1 else i
+        elif char == "+":
+            # The previous character is there at least once, but may repeat.
+            end_run()
+        elif depth == 0 and char not in ".^$":
+            run.append(char)
+        else:
+            end_run()
+    end_run()
+    return literals
+
+
+def _read_text(file_abs_path):
+    with open(file_abs_path, "rb") as f:
+        data = f.read(MAX_INDEXED_FILE_BYTES + 1)
+    if len(data) > MAX_INDEXED_FILE_BYTES or b"\0" in data[:8192]:
+        return None
+    return data.decode("utf-8", errors="replace")
+
+
+# Trigram inverted index over the text files of one working directory, persisted under CACHE_DIR. Files are
+# re-indexed when their (st_mtime_ns, st_size) changes or when write_file reports that it wrote them.
+class TrigramIndex:
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(
+            CACHE_DIR, "search_index", hashlib.sha1(root.encode("utf-8")).hexdigest() + ".json.gz"
+        )
+        self.files = {}
+        self.postings = defaultdict(set)
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with gzip.open(self.index_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_FORMAT_VERSION or data.get("root") != self.root:
+            return
+        for relative_path, (mtime_ns, size, trigrams) in data["files"].items():
+            self._add(relative_path, (mtime_ns, size), set(trigrams))
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            data = {
+                "version": INDEX_FORMAT_VERSION,
+                "root": self.root,
+                "files": {
+                    relative_path: [*version, sorted(trigrams)]
+                    for relative_path, (version, trigrams) in self.files.items()
+                },
+            }
+            self.dirty = False
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        temporary_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(temporary_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temporary_path, self.index_path)
+
+    def _add(self, relative_path, version, trigrams):
+        self.files[relative_path] = (version, trigrams)
+        for trigram in trigrams:
+            self.postings[trigram].add(relative_path)
+
+    def _remove(self, relative_path):
+        _, trigrams = self.files.pop(relative_path, (None, ()))
+        for trigram in trigrams:
+            paths = self.postings.get(trigram)
+            if paths is not None:
+                paths.discard(relative_path)
+                if not paths:
+                    del self.postings[trigram]
+
+    def _index_file(self, relative_path, file_stat):
+        version = (file_stat.st_mtime_ns, file_stat.st_size)
+        indexed = self.files.get(relative_path)
+        if indexed is not None and indexed[0] == version:
+            return
+        self._remove(relative_path)
+        text = _read_text(os.path.join(self.root, relative_path))
+        self._add(relative_path, version, _trigrams(text.lower()) if text is not None else set())
+        self.dirty = True
+
+    def _walk(self, directory_abs_path, prefix=""):
+        with os.scandir(directory_abs_path) as it:
+            for entry in it:
+                if entry.name.startswith(".") or entry.name in SKIPPED_DIRECTORIES:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._walk(entry.path, f"{prefix}{entry.name}/")
+                elif entry.is_file(follow_symlinks=False):
+                    yield f"{prefix}{entry.name}", entry.stat(follow_symlinks=False)
+
+    def refresh(self):
+        with self._lock:
+            seen = set()
+            for relative_path, file_stat in self._walk(self.root):
+                seen.add(relative_path)
+                self._index_file(relative_path, file_stat)
+            for relative_path in set(self.files) - seen:
+                self._remove(relative_path)
+                self.dirty = True
+
+    def update_file(self, file_abs_path):
+        relative_path = os.path.relpath(file_abs_path, self.root).replace(os.sep, "/")
+        with self._lock:
+            try:
+                self._index_file(relative_path, os.stat(file_abs_path))
+            except FileNotFoundError:
+                self._remove(relative_path)
+                self.dirty = True
+
+    def candidates(self, literals):
+        with self._lock:
+            candidates = set(self.files)
+            for literal in literals:
+                for trigram in _trigrams(literal.lower()):
+                    candidates &= self.postings.get(trigram, set())
+            return sorted(candidates)
+
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_index(working_directory_abs_path):
+    with _INDEXES_LOCK:
+        if working_directory_abs_path not in _INDEXES:
+            _INDEXES[working_directory_abs_path] = TrigramIndex(working_directory_abs_path)
+        return _INDEXES[working_directory_abs_path]
+
+
+def notify_file_changed(working_directory_abs_path, file_abs_path):
+    index = _INDEXES.get(working_directory_abs_path)
+    if index is not None:
+        index.update_file(file_abs_path)
+
+
+def _format_matches(relative_path, lines, line_numbers, context_lines):
+    # One block per group of matches whose context lines overlap or touch, as grep -C prints them, so that no line
+    # is shown twice.
+    ranges = []
+    for line_number in line_numbers:
+        start = max(0, line_number - context_lines)
+        end = min(len(lines), line_number + context_lines + 1)
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    matched = set(line_numbers)
+    return [
+        "\n".join(
+            f"{relative_path}{':' if i in matched else '-'}{i + 1}{':' if i in matched else '-'} {lines[i]}"
+            for i in range(start, end)
+        )
+        for start, end in ranges
+    ]
+
+
+def search_code(
+    working_directory,
+    query,
+    regex=False,
+    case_sensitive=False,
+    directory=".",
+    pattern=None,
+    context_lines=2,
+    max_results=MAX_SEARCH_RESULTS,
+):
+    try:
+        workspace = Workspace.of(working_directory)
+        working_directory_abs_path = workspace.root
+        directory_abs_path = workspace.resolve(directory)
+        if directory_abs_path is None:
+            return f'Error: Cannot search "{directory}" as it is outside the permitted working directory'
+        if not os.path.isdir(directory_abs_path):
+            return f'Error: "{directory}" is not a directory'
+        if not query:
+            return "Error: A search query is required"
+
+        flags = 0 if case_sensitive else re.IGNORECASE
+        try:
+            compiled = re.compile(query if regex else re.escape(query), flags)
+        except re.error as e:
+            return f'Error: Invalid regular expression "{query}": {e}'
+        context_lines = max(int(context_lines), 0)
+        max_results = max(int(max_results), 1)
+
+        index = get_index(working_directory_abs_path)
+        index.refresh()
+        index.save()
+
+        prefix = os.path.relpath(directory_abs_path, working_directory_abs_path).replace(os.sep, "/")
+        prefix = "" if prefix == "." else f"{prefix}/"
+        blocks = []
+        shown = total = 0
+        for relative_path in index.candidates(_required_literals(query) if regex else [query]):
+            if not relative_path.startswith(prefix):
+                continue
+            name = relative_path if pattern and "/" in pattern else os.path.basename(relative_path)
+            if pattern and not fnmatch.fnmatch(name, pattern):
+                continue
+            text = _read_text(os.path.join(working_directory_abs_path, relative_path))
+            if text is None:
+                continue
+            lines = text.splitlines()
+            line_numbers = []
+            for line_number, line in enumerate(lines):
+                if compiled.search(line):
+                    total += 1
+                    if shown < max_results:
+                        line_numbers.append(line_number)
+                        shown += 1
+            blocks.extend(_format_matches(relative_path, lines, line_numbers, context_lines))
+
+        if not blocks:
+            return f'No matches found for "{query}"'
+        if total > shown:
+            blocks.append(f"[{total - shown} more matches not shown; narrow the query or raise max_results]")
+        return "\n--\n".join(blocks)
+
+    except Exception as e:
+        return f"Error: {e}"
+
+
+async def search_code_async(working_directory, query, **kwargs):
+    return await asyncio.to_thread(search_code, working_directory, query, **kwargs)
@@ -0,0 +1,267 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from functions.apply_patch import PatchError, apply_patch, parse_patch
+from functions.config import PYTHON_WORKER_MAX_SPOOLED_OUTPUT_BYTES
+from functions.edit_file import edit_file
+from functions.python_worker_pool import PythonWorkerPool
+from functions.search_code import _required_literals, get_index, search_code
+
+
+def _write(directory, relative_path, content):
+    path = os.path.join(directory, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class WorkspaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, relative_path):
+        with open(os.path.join(self.directory, relative_path), newline="") as f:
+            return f.read()
+
+    def exists(self, relative_path):
+        return os.path.exists(os.path.join(self.directory, relative_path))
+
+
+class TestSearchCode(WorkspaceTestCase):
+    def tearDown(self):
+        index_path = get_index(self.directory).index_path
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        super().tearDown()
+
+    def test_required_literals_skip_escape_arguments(self):
+        for pattern in [r"\x41BC", r"\101BC", r"\U00000041BC", r"\N{LATIN CAPITAL LETTER A}BC"]:
+            self.assertEqual(_required_literals(pattern), ["BC"], pattern)
+        self.assertEqual(_required_literals(r"(a)\1bcd"), ["bcd"])
+        self.assertEqual(_required_literals(r"foo\.bar"), ["foo.bar"])
+
+    def test_numeric_escape_matches(self):
+        _write(self.directory, "pkg/names.py", "class ABC:\n    pass\n")
+        for pattern in [r"\x41BC", r"\101BC", r"ABC"]:
+            self.assertIn("pkg/names.py:1:", search_code(self.directory, pattern, regex=True, case_sensitive=True))
+
+    def test_overlapping_context_is_shown_once(self):
+        _write(self.directory, "values.py", "a = 1\nb = 1\nc = 2\nd = 3\ne = 4\nf = 5\ng = 1\n")
+        result = search_code(self.directory, "= 1", context_lines=1)
+        self.assertEqual(
+            result,
+            "values.py:1: a = 1\nvalues.py:2: b = 1\nvalues.py-3- c = 2\n--\nvalues.py-6- f = 5\nvalues.py:7: g = 1",
+        )
+
+    def test_more_matches_are_counted(self):
+        _write(self.directory, "values.py", "a = 1\nb = 1\nc = 1\n")
+        result = search_code(self.directory, "= 1", context_lines=0, max_results=2)
+        self.assertEqual(
+            result,
+            "values.py:1: a = 1\nvalues.py:2: b = 1\n--\n"
+            "[1 more matches not shown; narrow the query or raise max_results]",
+        )
+
+
+LINES = "".join(f"line {i}\n" for i in range(1, 11))
+
+
+class TestApplyPatch(WorkspaceTestCase):
+    def setUp(self):
+        super().setUp()
+        _write(self.directory, "lines.txt", LINES)
+
+    def test_multiple_hunks(self):
+        patch = (
+            "--- a/lines.txt\n"
+            "+++ b/lines.txt\n"
+            "@@ -1,2 +1,2 @@\n"
+            "-line 1\n"
+            "+line one\n"
+            " line 2\n"
+            "@@ -9,2 +9,3 @@\n"
+            " line 9\n"
+            " line 10\n"
+            "+line 11\n"
+        )
+        self.assertEqual(apply_patch(self.directory, patch), "Successfully applied patch to 1 files: lines.txt")
+        self.assertEqual(self.read("lines.txt"), LINES.replace("line 1\n", "line one\n", 1) + "line 11\n")
+
+    def test_create(self):
+        patch = "--- /dev/null\n+++ b/pkg/new.txt\n@@ -0,0 +1,2 @@\n+first\n+second\n"
+        self.assertEqual(apply_patch(self.directory, patch), "Successfully applied patch to 1 files: pkg/new.txt")
+        self.assertEqual(self.read("pkg/new.txt"), "first\nsecond\n")
+
+    def test_create_existing_file_fails(self):
+        patch = "--- /dev/null\n+++ b/lines.txt\n@@ -0,0 +1 @@\n+first\n"
+        self.assertEqual(apply_patch(self.directory, patch), 'Error: Cannot create "lines.txt" as it already exists')
+        self.assertEqual(self.read("lines.txt"), LINES)
+
+    def test_delete(self):
+        patch = "--- a/lines.txt\n+++ /dev/null\n@@ -1,10 +0,0 @@\n" + "".join(
+            f"-{line}\n" for line in LINES.splitlines()
+        )
+        self.assertEqual(
+            apply_patch(self.directory, patch), "Successfully applied patch to 1 files: lines.txt (deleted)"
+        )
+        self.assertFalse(self.exists("lines.txt"))
+
+    def test_rename(self):
+        patch = "--- a/lines.txt\n+++ b/renamed.txt\n@@ -10 +10 @@\n-line 10\n+line ten\n"
+        self.assertEqual(
+            apply_patch(self.directory, patch),
+            "Successfully applied patch to 2 files: renamed.txt, lines.txt (deleted)",
+        )
+        self.assertFalse(self.exists("lines.txt"))
+        self.assertEqual(self.read("renamed.txt"), LINES.replace("line 10\n", "line ten\n"))
+
+    def test_no_newline_at_end_of_file(self):
+        patch = (
+            "--- a/lines.txt\n"
+            "+++ b/lines.txt\n"
+            "@@ -10 +10 @@\n"
+            "-line 10\n"
+            "+line ten\n"
+            "\\ No newline at end of file\n"
+        )
+        self.assertIn("Successfully", apply_patch(self.directory, patch))
+        self.assertEqual(self.read("lines.txt"), LINES.replace("line 10\n", "line ten"))
+
+    def test_counted_lines_that_look_like_headers(self):
+        _write(self.directory, "query.sql", "-- first\nselect 1;\n")
+        patch = (
+            "--- a/query.sql\n"
+            "+++ b/query.sql\n"
+            "@@ -1,2 +1,2 @@\n"
+            "--- first\n"
+            "+++ second\n"
+            " select 1;\n"
+        )
+        self.assertEqual(apply_patch(self.directory, patch), "Successfully applied patch to 1 files: query.sql")
+        self.assertEqual(self.read("query.sql"), "++ second\nselect 1;\n")
+
+    def test_repeated_sections_for_one_file(self):
+        patch = (
+            "--- a/lines.txt\n"
+            "+++ b/lines.txt\n"
+            "@@ -1 +1 @@\n"
+            "-line 1\n"
+            "+line one\n"
+            "--- a/lines.txt\n"
+            "+++ b/lines.txt\n"
+            "@@ -2 +2 @@\n"
+            "-line 2\n"
+            "+line two\n"
+        )
+        self.assertEqual(apply_patch(self.directory, patch), "Successfully applied patch to 1 files: lines.txt")
+        expected = LINES.replace("line 1\n", "line one\n", 1).replace("line 2\n", "line two\n")
+        self.assertEqual(self.read("lines.txt"), expected)
+
+    def test_patching_a_file_deleted_earlier_fails(self):
+        patch = (
+            "--- a/lines.txt\n"
+            "+++ b/renamed.txt\n"
+            "@@ -1 +1 @@\n"
+            "-line 1\n"
+            "+line one\n"
+            "--- a/lines.txt\n"
+            "+++ b/lines.txt\n"
+            "@@ -2 +2 @@\n"
+            "-line 2\n"
+            "+line two\n"
+        )
+        self.assertEqual(
+            apply_patch(self.directory, patch), 'Error: "lines.txt" is deleted by an earlier part of the patch'
+        )
+        self.assertFalse(self.exists("renamed.txt"))
+
+    def test_failing_hunk_changes_nothing(self):
+        _write(self.directory, "other.txt", "other\n")
+        patch = (
+            "--- a/other.txt\n"
+            "+++ b/other.txt\n"
+            "@@ -1 +1 @@\n"
+            "-other\n"
+            "+changed\n"
+            "--- a/lines.txt\n"
+            "+++ b/lines.txt\n"
+            "@@ -1 +1 @@\n"
+            "-not in the file\n"
+            "+line one\n"
+        )
+        self.assertTrue(apply_patch(self.directory, patch).endswith("; no files were changed"))
+        self.assertEqual(self.read("other.txt"), "other\n")
+
+    def test_outside_working_directory_fails(self):
+        patch = "--- /dev/null\n+++ b/../outside.txt\n@@ -0,0 +1 @@\n+outside\n"
+        self.assertEqual(
+            apply_patch(self.directory, patch),
+            'Error: Cannot patch "../outside.txt" as it is outside the permitted working directory',
+        )
+
+    def test_hunk_shorter_than_its_header(self):
+        with self.assertRaisesRegex(PatchError, "short of the counts in its header"):
+            parse_patch("--- a/lines.txt\n+++ b/lines.txt\n@@ -1,2 +1,2 @@\n-line 1\n+line one\n")
+
+    def test_hunk_longer_than_its_header(self):
+        with self.assertRaisesRegex(PatchError, "not counted in its @@ header"):
+            parse_patch("--- a/lines.txt\n+++ b/lines.txt\n@@ -1 +1 @@\n-line 1\n+line one\n+line two\n")
+
+
+class TestEditFile(WorkspaceTestCase):
+    def setUp(self):
+        super().setUp()
+        _write(self.directory, "lorem.txt", "lorem ipsum dolor sit amet\nconsectetur adipiscing elit\n")
+
+    def test_search_replace(self):
+        result = edit_file(self.directory, "lorem.txt", [{"search": "dolor sit", "replace": "dolor sat"}])
+        self.assertTrue(result.startswith('Successfully edited "lorem.txt" (1 edits applied'))
+        self.assertEqual(self.read("lorem.txt"), "lorem ipsum dolor sat amet\nconsectetur adipiscing elit\n")
+
+    def test_ambiguous_search_fails(self):
+        result = edit_file(self.directory, "lorem.txt", [{"search": "or", "replace": "OR"}])
+        self.assertIn("occurs 2 times", result)
+        self.assertEqual(self.read("lorem.txt"), "lorem ipsum dolor sit amet\nconsectetur adipiscing elit\n")
+
+    def test_replace_all(self):
+        edit_file(self.directory, "lorem.txt", [{"search": "or", "replace": "OR", "replace_all": True}])
+        self.assertEqual(self.read("lorem.txt"), "lORem ipsum dolOR sit amet\nconsectetur adipiscing elit\n")
+
+    def test_failing_edit_applies_none(self):
+        edits = [{"search": "lorem", "replace": "LOREM"}, {"search": "missing", "replace": ""}]
+        result = edit_file(self.directory, "lorem.txt", edits)
+        self.assertEqual(
+            result, 'Error: Edit 2 to "lorem.txt" failed: the search text was not found. No edits were applied.'
+        )
+        self.assertEqual(self.read("lorem.txt"), "lorem ipsum dolor sit amet\nconsectetur adipiscing elit\n")
+
+
+class TestPythonWorkerPool(WorkspaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = PythonWorkerPool(self.directory, size=1)
+
+    def tearDown(self):
+        self.pool.close()
+        super().tearDown()
+
+    def test_run(self):
+        _write(self.directory, "hello.py", "print('hello')\n")
+        self.assertEqual(self.pool.run("hello.py", [], 30, 1024), (b"hello\n", b"", 0, 0, 0))
+
+    def test_endless_output_is_killed(self):
+        _write(self.directory, "spam.py", "while True:\n    print('x' * 1000)\n")
+        stdout, stderr, returncode, stdout_dropped, _ = self.pool.run("spam.py", [], 30, 1024)
+        self.assertEqual(len(stdout), 1024)
+        self.assertIn(b"Process killed after writing more than", stderr)
+        self.assertNotEqual(returncode, 0)
+        self.assertLess(stdout_dropped, 2 * PYTHON_WORKER_MAX_SPOOLED_OUTPUT_BYTES)
+
+
+if __name__ == "__main__":
+    unittest.main()
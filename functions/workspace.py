@@ -0,0 +1,35 @@
+import os
+
+
+# The directory a tool is confined to, resolved once. Tools accept a Workspace or a plain path as their
+# working_directory; os.fspath(workspace) is the root, so a Workspace can be passed wherever a path is expected.
+class Workspace:
+    __slots__ = ("root", "real_root")
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.real_root = os.path.realpath(self.root)
+
+    @classmethod
+    def of(cls, working_directory):
+        return working_directory if isinstance(working_directory, cls) else cls(working_directory)
+
+    def __fspath__(self):
+        return self.root
+
+    def __str__(self):
+        return self.root
+
+    def __repr__(self):
+        return f"Workspace({self.root!r})"
+
+    def contains(self, abs_path):
+        # Compared by whole path components after following symlinks: a string prefix check would also accept a
+        # sibling such as "calculator2" for "calculator", and a symlink inside the workspace could point out of it.
+        real_path = os.path.realpath(abs_path)
+        return os.path.commonpath([self.real_root, real_path]) == self.real_root
+
+    def resolve(self, path):
+        # Absolute, normalized path of a path given relative to the workspace, or None when it is outside it.
+        abs_path = os.path.normpath(os.path.join(self.root, path))
+        return abs_path if self.contains(abs_path) else None
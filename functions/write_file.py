@@ -1,24 +1,64 @@
+import asyncio
+import contextlib
 import os
+import stat
+import tempfile
 
-from google.genai import types
+from .file_cache import FILE_CACHE
+from .result_cache import RESULT_CACHE
+from .search_code import notify_file_changed
+from .workspace import Workspace
+
+
+# Permissions for newly created files, as open() would have given them.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+NEW_FILE_MODE = 0o666 & ~_UMASK
+
+
+def resolve_writable_path(working_directory, file_path):
+    # (workspace root, absolute file path), with None for the file path when it is outside the workspace.
+    workspace = Workspace.of(working_directory)
+    return workspace.root, workspace.resolve(file_path)
+
+
+def atomic_write(file_abs_path, content):
+    # Write to a temporary file next to the target, fsync it and rename it over the target, so a crash leaves either
+    # the old file or the new one and never a missing or half-written file. The target's permissions are kept.
+    directory_abs_path = os.path.dirname(file_abs_path)
+    os.makedirs(directory_abs_path, exist_ok=True)
+    try:
+        mode = stat.S_IMODE(os.stat(file_abs_path).st_mode)
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+    fd, temporary_path = tempfile.mkstemp(dir=directory_abs_path, prefix=f".{os.path.basename(file_abs_path)}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporary_path, mode)
+        os.replace(temporary_path, file_abs_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporary_path)
+        raise
+
+
+def notify_written(working_directory_abs_path, file_abs_path):
+    FILE_CACHE.invalidate(file_abs_path)
+    RESULT_CACHE.invalidate(working_directory_abs_path)
+    notify_file_changed(working_directory_abs_path, file_abs_path)
 
 
 def write_file(working_directory, file_path, content):
     try:
-        working_directory_abs_path = os.path.abspath(working_directory)
-        file_abs_path = os.path.normpath(os.path.join(working_directory_abs_path, file_path))
-        if not file_abs_path.startswith(working_directory_abs_path):
+        working_directory_abs_path, file_abs_path = resolve_writable_path(working_directory, file_path)
+        if file_abs_path is None:
             return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory'
 
-        if not os.path.exists(file_abs_path):
-            file_dir_abs_path = os.path.dirname(file_abs_path)
-            if not os.path.isdir(file_dir_abs_path):
-                os.makedirs(file_dir_abs_path)
-        elif os.path.isfile(file_abs_path):
-            os.remove(file_abs_path)
-
-        with open(file_abs_path, "w") as f:
-            f.write(content)
+        atomic_write(file_abs_path, content)
+        notify_written(working_directory_abs_path, file_abs_path)
 
         return f'Successfully wrote to "{file_path}" ({len(content)} characters written)'
 
@@ -26,20 +66,5 @@ def write_file(working_directory, file_path, content):
         return f"Error: {e}"
 
 
-schema_write_file = types.FunctionDeclaration(
-    name="write_file",
-    description="Write or overwrite file contents, constrained to the working directory.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The file path for the file to be written to, relative to the working directory.",
-            ),
-            "content": types.Schema(
-                type=types.Type.STRING,
-                description="The content to be written to the file."
-            )
-        },
-    ),
-)
+async def write_file_async(working_directory, file_path, content):
+    return await asyncio.to_thread(write_file, working_directory, file_path, content)
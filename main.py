@@ -1,39 +1,22 @@
 import argparse
 import os
-import logging
+import sys
 
 from datetime import datetime
-from time import sleep
-
-from dotenv import load_dotenv
-from google import genai
-from google.genai import errors, types
-from tenacity import retry, retry_if_exception_type, stop_after_attempt
-
-from functions.get_file_content import get_file_content, schema_get_file_content
-from functions.get_files_info import get_files_info, schema_get_files_info
-from functions.run_python_file import run_python_file, schema_run_python_file
-from functions.write_file import write_file, schema_write_file
 
+from agent.config import (
+    CONCURRENCY,
+    MAX_ITERATIONS,
+    MAX_WORKERS,
+    PREFETCH_BYTE_BUDGET,
+    REQUESTS_PER_MINUTE,
+    TOKEN_BUDGET,
+    TOKENS_PER_MINUTE,
+    WORKING_DIRECTORY,
+)
 
-load_dotenv()
-API_KEY = os.environ.get("GEMINI_API_KEY")
 
-LOGGER = logging.getLogger(__name__)
-FILE_HANDLER = logging.FileHandler(
-    f"action_log_{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.log",
-    mode="w",
-    encoding="utf-8",
-)
-FILE_HANDLER.setFormatter(
-    logging.Formatter(
-        "{asctime} - {levelname} - {message}",
-        style="{",
-        datefmt="%Y-%m-%d:%H:%M:%S",
-    )
-)
-LOGGER.addHandler(FILE_HANDLER)
-LOGGER.setLevel(logging.INFO)
+RUN_TIMESTAMP = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
 
 
 def parse_args():
@@ -41,49 +24,158 @@ def parse_args():
         prog="bootloader_ai_agent",
         description="Take a prompt arg from the command line and send to Gemini LLM",
     )
-    parser.add_argument("user_prompt")
+    parser.add_argument("user_prompt", nargs="?")
     parser.add_argument("--verbose", action="store_true")
-    return parser.parse_args()
-
-
-def call_function(function_call_part, verbose=False) -> types.Part:
-    LOGGER.info(f" - Calling function: {function_call_part.name}({function_call_part.args})")
-    if verbose:
-        print(f"Calling function: {function_call_part.name}({function_call_part.args})")
-    else:
-        print(f" - Calling function: {function_call_part.name}")
-
-    function_map = {
-        "get_file_content": get_file_content,
-        "get_files_info": get_files_info,
-        "run_python_file": run_python_file,
-        "write_file": write_file,
-    }
+    parser.add_argument(
+        "--workspace",
+        metavar="DIR",
+        default=WORKING_DIRECTORY,
+        help="Directory the agent's tools are confined to (in batch mode, a prompt's \"workspace\" overrides it)",
+    )
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=MAX_ITERATIONS,
+        help="Model calls a session may make in this run before it gives up (a resumed session gets as many again)",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="SESSION",
+        help="Continue a failed session from its last checkpoint, given its id or the path of its checkpoint file",
+    )
+    parser.add_argument(
+        "--no-checkpoint",
+        action="store_true",
+        help="Do not save the session under .agent_cache/sessions after each iteration",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=MAX_WORKERS,
+        help="Maximum number of function calls from a single model turn to run concurrently",
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=REQUESTS_PER_MINUTE, help="Model requests allowed per minute by the API quota"
+    )
+    parser.add_argument(
+        "--tpm", type=int, default=TOKENS_PER_MINUTE, help="Model tokens allowed per minute by the API quota"
+    )
+    parser.add_argument(
+        "--python-workers",
+        type=int,
+        default=0,
+        help="Run Python files on this many pre-started worker interpreters instead of a new process per run",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=TOKEN_BUDGET,
+        help="Approximate prompt size in tokens above which older turns are summarized",
+    )
+    parser.add_argument(
+        "--context-cache",
+        action="store_true",
+        help="Upload the system prompt, tool declarations and user prompt once as Gemini cached content",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream model responses and start each function call as soon as it arrives",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="PROMPTS_FILE",
+        help="Run one session per line of a JSONL prompts file ('-' for stdin) instead of a single user_prompt",
+    )
+    parser.add_argument(
+        "--batch-output",
+        metavar="RESULTS_FILE",
+        help="Where to write one JSON result record per prompt in batch mode (defaults to a timestamped file)",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=CONCURRENCY, help="Number of sessions to run at once in batch mode"
+    )
+    parser.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Record the session's API calls to a cassette file for offline replay with agent.benchmark",
+    )
+    parser.add_argument(
+        "--no-tool-cache",
+        action="store_true",
+        help="Always run tools, instead of reusing results of identical calls over an unchanged working directory",
+    )
+    parser.add_argument(
+        "--persist-tool-cache",
+        action="store_true",
+        help="Save tool results under .agent_cache so later runs over an unchanged working directory can reuse them",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="While the model is thinking, read ahead the files it is likely to ask for next, as learned from the "
+        "tool calls in earlier action logs",
+    )
+    parser.add_argument(
+        "--prefetch-budget",
+        type=int,
+        default=PREFETCH_BYTE_BUDGET,
+        metavar="BYTES",
+        help="Bytes of files read ahead per model call with --prefetch",
+    )
+    parser.add_argument(
+        "--no-output-shaping",
+        action="store_true",
+        help="Send tool output to the model as it is, instead of keeping each tool's output within a token budget, "
+        "collapsing repeated traceback lines and referring back to identical earlier output",
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        metavar="DIR",
+        help="Write timing spans as JSON lines and a Prometheus text summary of the run into this directory",
+    )
+    args = parser.parse_args()
+    if [args.user_prompt, args.batch, args.resume].count(None) != 2:
+        parser.error("provide either a user_prompt, --batch PROMPTS_FILE or --resume SESSION")
+    if args.record and (args.batch or args.resume):
+        parser.error("--record records a whole single session and cannot be combined with --batch or --resume")
+    if not os.path.isdir(args.workspace):
+        parser.error(f"--workspace {args.workspace} is not a directory")
+    if args.max_iterations < 1:
+        parser.error("--max-iterations must be at least 1")
+    return args
 
-    if function_call_part.name not in function_map:
-        return types.Part.from_function_response(
-            name=function_call_part.name, response={"error": f"Unknown function: {function_call_part.name}"}
-        )
 
-    try:
-        response = function_map[function_call_part.name]("./calculator", **function_call_part.args)
-    except Exception as e:
-        return types.Part.from_function_response(name=function_call_part.name, response={"error": str(e)})
-    return types.Part.from_function_response(name=function_call_part.name, response={"result": response})
+def main():
+    args = parse_args()
 
+    # Everything below talks to the model or runs tools, so the Gen AI SDK and the agent modules are only imported
+    # once the arguments are known to be valid.
+    import asyncio
 
-@retry(reraise=True, stop=stop_after_attempt(2), retry=retry_if_exception_type(errors.ClientError))
-def generate_content_helper(client, model, system_prompt, messages):
-    return client.models.generate_content(
-        model=model,
-        config=types.GenerateContentConfig(tools=[available_functions], system_instruction=system_prompt),
-        contents=messages,
-    )
+    from dotenv import load_dotenv
+    from google import genai
 
+    from agent.batch import read_prompts, run_batch
+    from agent.cassette import RecordingClient, snapshot_directory
+    from agent.checkpoint import SessionCheckpoint, checkpoint_path
+    from agent.logs import configure_file_logging
+    from agent.metrics import Tracer
+    from agent.prefetch import CallPatterns, recent_action_logs
+    from agent.rate_limit import RateLimiter
+    from agent.runner import run_session
+    from functions.python_worker_pool import enable_worker_pool
+    from functions.result_cache import RESULT_CACHE
 
-if __name__ == "__main__":
-    args = parse_args()
-    client = genai.Client(api_key=API_KEY)
+    # Call patterns are learned before this run's log is opened, so only earlier sessions count.
+    prefetch = CallPatterns.from_logs(recent_action_logs()) if args.prefetch else None
+    configure_file_logging(f"action_log_{RUN_TIMESTAMP}.log")
+    load_dotenv()
+    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+    if args.python_workers > 0:
+        enable_worker_pool(args.workspace, size=args.python_workers)
+    RESULT_CACHE.enabled = not args.no_tool_cache
+    RESULT_CACHE.persist = args.persist_tool_cache
     model = "gemini-2.5-flash"
 
     system_prompt = """
@@ -93,8 +185,10 @@ if __name__ == "__main__":
 
     - List files and directories
     - Read file contents
+    - Search file contents for text or regular expressions
     - Execute Python files with optional arguments
     - Write or overwrite files
+    - Edit files with exact search/replace edits or unified diff patches
 
     All paths you provide should be relative to the working directory. You do not need to specify the working directory
     in your function calls as it is automatically injected for security reasons.
@@ -102,62 +196,110 @@ if __name__ == "__main__":
     Any questions about a calculator application can be answered by examining the files to which you are given access.
     """
 
-    available_functions = types.Tool(
-        function_declarations=[
-            schema_get_file_content,
-            schema_get_files_info,
-            schema_run_python_file,
-            schema_write_file,
-        ]
-    )
-
-    messages = [types.Content(role="user", parts=[types.Part(text=args.user_prompt)])]
-    for i in range(20):
-        print(f"Iteration {i}")
-        response = generate_content_helper(client, model, system_prompt, messages)
-
-        if not response.function_calls or not response.candidates:
-            LOGGER.info(f"Final Response: {response.text}")
-            print(f"Final Response: {response.text}")
-            break
-
-        for candidate in response.candidates:
-            if not candidate.content:
-                continue
-            messages.append(candidate.content)
-            if not candidate.content.parts:
-                continue
-
-            candidate_response_content = types.Content(role="tool", parts=[])
-            assert candidate_response_content.parts is not None
-            for part in candidate.content.parts:
-                if part.text:
-                    LOGGER.info(part.text.strip("\n"))
-                    if args.verbose:
-                        print(part.text)
-
-                if part.function_call:
-                    function_call_result = call_function(part.function_call, verbose=args.verbose)
-                    if not (
-                        hasattr(function_call_result, "function_response")
-                        and function_call_result.function_response is not None
-                        and hasattr(function_call_result.function_response, "response")
-                        and function_call_result.function_response.response is not None
-                    ):
-                        raise RuntimeError(
-                            f"Response content from call_function {part.function_call.name} does not "
-                            "have appropriate format"
-                        )
-                    if args.verbose:
-                        print(f"-> {function_call_result.function_response.response}")
-                    candidate_response_content.parts.append(function_call_result)
-            messages.append(candidate_response_content)
-        sleep(4)
-    else:
-        raise RecursionError("Failed to get expected response before max iterations.")
-
-    if args.verbose:
-        print(f"User prompt: {args.user_prompt}")
-        if response.usage_metadata:
-            print(f"Prompt tokens: {response.usage_metadata.prompt_token_count}")
-            print(f"Response tokens: {response.usage_metadata.candidates_token_count}")
+    rate_limiter = RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    tracer = Tracer() if args.metrics_dir else None
+    session_kwargs = dict(
+        verbose=args.verbose,
+        max_workers=args.max_workers,
+        rate_limiter=rate_limiter,
+        token_budget=args.token_budget,
+        context_cache=args.context_cache,
+        stream=args.stream,
+        tracer=tracer,
+        max_iterations=args.max_iterations,
+        prefetch=prefetch,
+        prefetch_budget=args.prefetch_budget,
+        workspace=args.workspace,
+        shape_output=not args.no_output_shaping,
+    )
+
+    try:
+        if args.batch:
+            batch_output = args.batch_output or f"batch_results_{RUN_TIMESTAMP}.jsonl"
+            with open(batch_output, "w", encoding="utf-8") as output:
+                counts = asyncio.run(
+                    run_batch(
+                        client,
+                        model,
+                        system_prompt,
+                        list(read_prompts(args.batch)),
+                        output,
+                        concurrency=args.concurrency,
+                        **session_kwargs,
+                    )
+                )
+            print(
+                f"Batch results written to {batch_output}: "
+                f"{counts['succeeded']} succeeded, {counts['failed']} failed"
+            )
+        else:
+            user_prompt = args.user_prompt
+            checkpoint = None
+            if args.resume:
+                try:
+                    checkpoint = SessionCheckpoint.load(args.resume)
+                except (OSError, ValueError) as e:
+                    sys.exit(f"Error: Cannot resume session {args.resume}: {e}")
+                model = checkpoint.metadata["model"]
+                system_prompt = checkpoint.metadata["system_prompt"]
+                user_prompt = checkpoint.metadata["user_prompt"]
+                session_kwargs["workspace"] = checkpoint.metadata.get("workspace", args.workspace)
+            elif not args.no_checkpoint:
+                checkpoint = SessionCheckpoint(
+                    f"{RUN_TIMESTAMP}-{os.getpid()}",
+                    dict(
+                        model=model,
+                        system_prompt=system_prompt,
+                        user_prompt=user_prompt,
+                        workspace=os.path.abspath(args.workspace),
+                    ),
+                )
+            if args.record:
+                client = RecordingClient(client)
+                client.cassette.metadata = dict(
+                    model=model,
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    workspace=os.path.abspath(args.workspace),
+                    token_budget=args.token_budget,
+                    context_cache=args.context_cache,
+                    stream=args.stream,
+                    shape_output=not args.no_output_shaping,
+                )
+                client.cassette.snapshot = snapshot_directory(args.workspace)
+            try:
+                result = asyncio.run(
+                    run_session(client, model, system_prompt, user_prompt, checkpoint=checkpoint, **session_kwargs)
+                )
+            except BaseException:
+                if checkpoint is not None and checkpoint.state is not None:
+                    session = checkpoint.session_id
+                    if checkpoint.path != checkpoint_path(session):
+                        session = checkpoint.path
+                    print(
+                        f"Session checkpointed after {checkpoint.next_iteration} iterations; continue it with: "
+                        f"python main.py --resume {session}",
+                        file=sys.stderr,
+                    )
+                raise
+            else:
+                if checkpoint is not None:
+                    checkpoint.delete()
+            finally:
+                if args.record:
+                    client.cassette.save(args.record)
+
+            if args.verbose:
+                print(f"User prompt: {user_prompt}")
+                if result.response.usage_metadata:
+                    print(f"Prompt tokens: {result.response.usage_metadata.prompt_token_count}")
+                    print(f"Response tokens: {result.response.usage_metadata.candidates_token_count}")
+    finally:
+        if tracer is not None:
+            os.makedirs(args.metrics_dir, exist_ok=True)
+            tracer.write_jsonl(os.path.join(args.metrics_dir, f"metrics_{RUN_TIMESTAMP}.jsonl"))
+            tracer.write_prometheus(os.path.join(args.metrics_dir, f"metrics_{RUN_TIMESTAMP}.prom"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 from functions.get_files_info import get_files_info
 from functions.get_file_content import get_file_content
+from functions.file_cache import FILE_CACHE
 from functions.write_file import write_file
+from functions.edit_file import edit_file
+from functions.apply_patch import apply_patch
 from functions.run_python_file import run_python_file
+from functions.result_cache import RESULT_CACHE
+from functions.search_code import search_code
 
 
 def test_get_files_info_dotpath_success():
@@ -14,6 +19,16 @@ def test_get_files_info_dir_success():
     print(f"Result for 'pkg' directory:\n{response}")
 
 
+def test_get_files_info_recursive_success():
+    response = get_files_info("calculator", ".", recursive=True)
+    print(f"Result for recursive listing of current directory:\n{response}")
+
+
+def test_get_files_info_pattern_paginated_success():
+    response = get_files_info("calculator", ".", recursive=True, pattern="*.py", offset=1, limit=2)
+    print(f"Result for second page of '*.py' entries:\n{response}")
+
+
 def test_get_files_info_oob_abspath_failure():
     response = get_files_info("calculator", "/bin")
     print(f"Result for '/bin' directory:\n{response}")
@@ -24,6 +39,11 @@ def test_get_files_info_oob_relpath_failure():
     print(f"Result for '../' directory:\n{response}")
 
 
+def test_get_files_info_oob_sibling_prefix_failure():
+    response = get_files_info("calculator", "../calculator2")
+    print(f"Result for '../calculator2' directory:\n{response}")
+
+
 def test_get_file_content_size_limit_success():
     response = get_file_content("calculator", "lorem.txt")
     print(f"Contents of 'lorem.txt' file:\n{response}")
@@ -39,6 +59,16 @@ def test_get_file_content_relpath_success():
     print(f"Contents of 'pkg/calculator.py' file:\n{response}")
 
 
+def test_get_file_content_line_range_success():
+    response = get_file_content("calculator", "pkg/calculator.py", start_line=16, end_line=20)
+    print(f"Lines 16-20 of 'pkg/calculator.py' file:\n{response}")
+
+
+def test_get_file_content_byte_range_success():
+    response = get_file_content("calculator", "main.py", offset=100, length=200)
+    print(f"Bytes 100-300 of 'main.py' file:\n{response}")
+
+
 def test_get_file_content_oob_abspath_failure():
     response = get_file_content("calculator", "/bin/cat")
     print(f"Contents of '/bin/cat' file:\n{response}")
@@ -49,6 +79,13 @@ def test_get_file_content_file_not_found_failure():
     print(f"Contents of 'pkg/does_not_exist.py' file:\n{response}")
 
 
+def test_get_file_content_cache_hit_success():
+    get_file_content("calculator", "main.py")
+    hits = FILE_CACHE.hits
+    get_file_content("calculator", "./main.py")
+    print(f"Cache hits after re-reading 'main.py': {FILE_CACHE.hits - hits}, stats: {FILE_CACHE.stats()}")
+
+
 def test_write_file_filename_success():
     response = write_file("calculator", "lorem.txt", "wait, this isn't lorem ipsum")
     print(response)
@@ -64,6 +101,37 @@ def test_write_file_oob_abspath_failure():
     print(response)
 
 
+def test_edit_file_search_replace_success():
+    write_file("calculator", "pkg/morelorem.txt", "lorem ipsum dolor sit amet\nconsectetur adipiscing elit\n")
+    response = edit_file("calculator", "pkg/morelorem.txt", [{"search": "dolor sit", "replace": "dolor sat"}])
+    print(response)
+
+
+def test_edit_file_ambiguous_search_failure():
+    response = edit_file("calculator", "pkg/morelorem.txt", [{"search": "i", "replace": "I"}])
+    print(response)
+
+
+def test_apply_patch_unified_diff_success():
+    write_file("calculator", "pkg/morelorem.txt", "lorem ipsum dolor sit amet\nconsectetur adipiscing elit\n")
+    response = apply_patch(
+        "calculator",
+        "--- a/pkg/morelorem.txt\n"
+        "+++ b/pkg/morelorem.txt\n"
+        "@@ -1,2 +1,3 @@\n"
+        " lorem ipsum dolor sit amet\n"
+        "-consectetur adipiscing elit\n"
+        "+consectetur adipiscing elit,\n"
+        "+sed do eiusmod tempor\n",
+    )
+    print(response)
+
+
+def test_apply_patch_oob_relpath_failure():
+    response = apply_patch("calculator", "--- /dev/null\n+++ b/../temp.txt\n@@ -0,0 +1 @@\n+this should not be allowed\n")
+    print(response)
+
+
 def test_run_python_file_no_args_success():
     response = run_python_file("calculator", "main.py")
     print(response)
@@ -94,26 +162,62 @@ def test_run_python_file_not_python_file_failure():
     print(response)
 
 
+def test_result_cache_run_python_file_hit_success():
+    call = lambda: run_python_file("calculator", "tests.py")
+    _, first_cached = RESULT_CACHE.call("calculator", "run_python_file", {"file_path": "tests.py"}, call)
+    _, second_cached = RESULT_CACHE.call("calculator", "run_python_file", {"file_path": "tests.py"}, call)
+    print(f"Served from cache: first run {first_cached}, second run {second_cached}, stats: {RESULT_CACHE.stats()}")
+
+
+def test_search_code_literal_success():
+    response = search_code("calculator", "precedence", context_lines=0)
+    print(f"Matches for 'precedence':\n{response}")
+
+
+def test_search_code_regex_success():
+    response = search_code("calculator", r"def \w+\(self", regex=True, pattern="*.py", directory="pkg")
+    print(f"Matches for method definitions in 'pkg':\n{response}")
+
+
+def test_search_code_oob_relpath_failure():
+    response = search_code("calculator", "import", directory="../")
+    print(response)
+
+
 def main():
     for func in [
         # test_get_files_info_dotpath_success,
         # test_get_files_info_dir_success,
+        # test_get_files_info_recursive_success,
+        # test_get_files_info_pattern_paginated_success,
         # test_get_files_info_oob_abspath_failure,
         # test_get_files_info_oob_relpath_failure,
+        # test_get_files_info_oob_sibling_prefix_failure,
         # test_get_file_content_size_limit_success,
         # test_get_file_content_filename_success,
         # test_get_file_content_relpath_success,
+        # test_get_file_content_line_range_success,
+        # test_get_file_content_byte_range_success,
         # test_get_file_content_oob_abspath_failure,
         # test_get_file_content_file_not_found_failure,
+        # test_get_file_content_cache_hit_success,
         # test_write_file_filename_success,
         # test_write_file_relpath_success,
         # test_write_file_oob_abspath_failure,
+        # test_edit_file_search_replace_success,
+        # test_edit_file_ambiguous_search_failure,
+        # test_apply_patch_unified_diff_success,
+        # test_apply_patch_oob_relpath_failure,
         test_run_python_file_no_args_success,
         test_run_python_file_correct_args_success,
         test_run_python_file_no_args_test_success,
         test_run_python_file_oob_relpath_failure,
         test_run_python_file_nonexistent_failure,
-        test_run_python_file_not_python_file_failure
+        test_run_python_file_not_python_file_failure,
+        # test_result_cache_run_python_file_hit_success,
+        # test_search_code_literal_success,
+        # test_search_code_regex_success,
+        # test_search_code_oob_relpath_failure,
     ]:
         func()
 